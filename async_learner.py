@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+import collections
+import copy
+import queue
+import threading
+import time
+
+
+class BackgroundLearner:
+    """后台训练线程：主循环只负责选动作和提交经验，梯度更新在后台线程完成
+
+    动作选择使用定期发布的策略副本，训练耗时不会影响控制循环的延迟。
+    指定replay_buffer时经验直接写入该回放池（不再调用agent.store_experience），并把它接到
+    agent.replay_buffer上，agent.train()需要从agent.replay_buffer.sample()取批量数据；
+    agent没有声明replay_buffer属性时抛出TypeError。
+
+    策略副本只复制策略：优先用snapshot_fn，其次用agent.policy_snapshot()；都没有时深拷贝agent，
+    但回放池、经验池（shared_attributes中的属性和deque类型的属性）只共享引用不复制。
+    每条经验调用updates_per_transition次train()（默认1，与同步训练时的更新/数据比例相同）。
+    """
+    def __init__(self, agent, max_queue_size=10000, batch_size=64, publish_interval=50,
+                 snapshot_fn=None, replay_buffer=None, updates_per_transition=1.0,
+                 shared_attributes=('replay_buffer', 'memory', 'training_history')):
+        self.agent = agent
+        self.batch_size = batch_size
+        self.publish_interval = publish_interval
+        self.snapshot_fn = snapshot_fn
+        self.updates_per_transition = updates_per_transition
+        self.shared_attributes = tuple(shared_attributes)
+        self._pending_updates = 0.0
+        self.replay_buffer = replay_buffer
+        if replay_buffer is not None:
+            self.attach_replay_buffer(agent, replay_buffer)
+        self.queue = queue.Queue(maxsize=max_queue_size)
+
+        # 保护学习端agent（训练、保存模型不能同时进行）
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.policy = agent
+        self.policy_version = 0
+
+        # 统计信息
+        self.pushed = 0
+        self.dropped = 0
+        self.consumed = 0
+        self.train_steps = 0
+        self.last_error = None
+        self._rate_time = time.perf_counter()
+        self._rate_consumed = 0
+        self._rate_steps = 0
+
+    @staticmethod
+    def supports_replay_buffer(agent):
+        """agent是否声明了外部回放池接口（replay_buffer属性，train()从中采样）"""
+        return hasattr(agent, 'replay_buffer')
+
+    @classmethod
+    def attach_replay_buffer(cls, agent, replay_buffer):
+        """把回放池接到agent上，接口不满足时直接报错，避免经验写入后训练取不到"""
+        for name in ('store_experience', 'sample'):
+            if not callable(getattr(replay_buffer, name, None)):
+                raise TypeError(f"回放池 {type(replay_buffer).__name__} 缺少 {name}() 方法")
+        if not cls.supports_replay_buffer(agent):
+            raise TypeError(
+                f"{type(agent).__name__} 没有replay_buffer属性，train()不会从外部回放池采样；"
+                f"请在agent中声明replay_buffer并从replay_buffer.sample()取数据，或不指定replay_buffer"
+            )
+        agent.replay_buffer = replay_buffer
+
+    def start(self):
+        """启动后台训练线程"""
+        if self._thread is not None:
+            return
+        self._publish()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='rl-learner', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """停止后台线程，队列中剩余的经验仍会写入agent"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._thread = None
+        with self._lock:
+            batch = self._drain(block=False)
+            while batch:
+                self._store(batch)
+                batch = self._drain(block=False)
+
+    def push(self, observation, action, reward, next_observation, done):
+        """提交一条经验（不阻塞），队列满时丢弃最旧的一条"""
+        transition = (observation, action, reward, next_observation, done)
+        try:
+            self.queue.put_nowait(transition)
+        except queue.Full:
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+            self.queue.put_nowait(transition)
+        self.pushed += 1
+
+    def select_action(self, observation):
+        """使用最近发布的策略选择动作"""
+        return self.policy.select_action(observation)
+
+    def save_model(self, *args, **kwargs):
+        """保存模型，与训练互斥"""
+        with self._lock:
+            return self.agent.save_model(*args, **kwargs)
+
+    def _drain(self, block=True):
+        """取出一批经验，最多batch_size条"""
+        batch = []
+        try:
+            if block:
+                batch.append(self.queue.get(timeout=0.1))
+            while len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _store(self, batch):
+        """把一批经验写入回放池"""
+        store = self.replay_buffer.store_experience if self.replay_buffer is not None else self.agent.store_experience
+        for transition in batch:
+            store(*transition)
+
+    def _shared_objects(self):
+        """不随策略副本复制的对象：回放池和经验池"""
+        shared = []
+        if self.replay_buffer is not None:
+            shared.append(self.replay_buffer)
+        for name, value in vars(self.agent).items():
+            if name in self.shared_attributes or isinstance(value, collections.deque):
+                shared.append(value)
+        return shared
+
+    def snapshot(self):
+        """复制当前策略"""
+        if self.snapshot_fn is not None:
+            return self.snapshot_fn(self.agent)
+        policy_snapshot = getattr(self.agent, 'policy_snapshot', None)
+        if callable(policy_snapshot):
+            return policy_snapshot()
+        # 经验池通过memo共享而不复制，拷贝耗时只和网络参数大小有关
+        memo = {id(value): value for value in self._shared_objects()}
+        return copy.deepcopy(self.agent, memo)
+
+    def _publish(self):
+        """发布策略副本给控制循环（直接替换引用，控制端无需加锁）"""
+        self.policy = self.snapshot()
+        self.policy_version += 1
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._drain()
+            if not batch:
+                continue
+            try:
+                with self._lock:
+                    self._store(batch)
+                self.consumed += len(batch)
+                # 按每条经验的更新次数训练，逐次加锁，保存模型不用等整批训练完
+                self._pending_updates += len(batch) * self.updates_per_transition
+                while self._pending_updates >= 1.0 and not self._stop_event.is_set():
+                    self._pending_updates -= 1.0
+                    with self._lock:
+                        self.agent.train()
+                        self.train_steps += 1
+                        if self.train_steps % self.publish_interval == 0:
+                            self._publish()
+            except Exception as e:
+                self.last_error = e
+                print(f"后台训练出错: {str(e)}")
+
+    def metrics(self):
+        """队列深度和学习吞吐量（自上次调用以来）"""
+        now = time.perf_counter()
+        elapsed = max(now - self._rate_time, 1e-6)
+        consumed_rate = (self.consumed - self._rate_consumed) / elapsed
+        steps_rate = (self.train_steps - self._rate_steps) / elapsed
+        self._rate_time = now
+        self._rate_consumed = self.consumed
+        self._rate_steps = self.train_steps
+        return {
+            'queue_depth': self.queue.qsize(),
+            'pushed': self.pushed,
+            'dropped': self.dropped,
+            'consumed': self.consumed,
+            'train_steps': self.train_steps,
+            'transitions_per_sec': consumed_rate,
+            'train_steps_per_sec': steps_rate,
+            'policy_version': self.policy_version
+        }
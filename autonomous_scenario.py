@@ -10,39 +10,77 @@ import math
 import numpy as np
 import os
 from rl_agent import RLAgent  # 导入RL代理
+from world_snapshot import RpcCounter, WorldSnapshotCache
+from observation_utils import ObservationLayout, encode_nearby_vehicles
+from spatial_index import StaticActorIndex
+from route_cache import RouteCache
+from stepping import SteppingEngine
+from async_learner import BackgroundLearner
+from replay_buffer import ObservationReplayBuffer
+from camera_pipeline import CameraView
+from hud import ScenarioHud
+from world_loader import acquire_world
+from episode_recorder import EpisodeRecorder
+from tick_profiler import TickProfiler
 
 class AutonomousScenario:
-    def __init__(self):
+    def __init__(self, synchronous=True, fixed_delta_seconds=0.05, no_rendering=False,
+                 flat_observations=False, host='localhost', port=2000, tm_port=8000, headless=False,
+                 warm_reset=True, record_episodes=True, record_frames=False, profile=False,
+                 profile_sampling=False, with_agent=True, reward_fn=None, replay_buffer_capacity=None,
+                 replay_buffer_dir=None):
+        # with_agent=False时只作为环境使用（多环境工作进程，训练在主进程完成），奖励由reward_fn计算
+        if not with_agent and reward_fn is None:
+            raise ValueError("with_agent=False时需要指定reward_fn(observation, collision=False, off_road=False)")
+        
         # 初始化Carla客户端
-        self.client = carla.Client('localhost', 2000)
+        self.client = carla.Client(host, port)
         self.client.set_timeout(10.0)
         
         # 加载生成点
         with open('spawn_points.json', 'r') as f:
             self.spawn_data = json.load(f)
         
-        # 确保加载正确的地图
-        world = self.client.get_world()
-        if world.get_map().name != self.spawn_data['map_name']:
-            self.client.load_world(self.spawn_data['map_name'])
-            world = self.client.get_world()
+        # 确保加载正确的地图（已是该地图时直接复用）
+        world = acquire_world(self.client, self.spawn_data['map_name'], client_timeout=10.0)
         
         self.world = world
         self.map = world.get_map()  # 获取地图引用
         self.blueprint_library = world.get_blueprint_library()
         
+        # 逐帧快照缓存，观察构建只读取快照
+        self.rpc_counter = RpcCounter()
+        self.snapshot_cache = WorldSnapshotCache(self.world, self.rpc_counter)
+        
+        # 静态交通信号灯索引，只在加载地图时构建
+        self.build_map_indices()
+        
         # 获取TrafficManager并设置全局参数
-        self.traffic_manager = self.client.get_trafficmanager(8000)
+        self.traffic_manager = self.client.get_trafficmanager(tm_port)
         self.traffic_manager.set_global_distance_to_leading_vehicle(0.5)
         self.traffic_manager.global_percentage_speed_difference(-30)
         
+        # 同步模式固定步长驱动，轮次按仿真帧计时
+        self.stepping = SteppingEngine(
+            self.world,
+            fixed_delta_seconds=fixed_delta_seconds,
+            synchronous=synchronous,
+            no_rendering=no_rendering,
+            realtime=not headless,  # 无界面时不按真实时间限速
+            traffic_manager=self.traffic_manager,
+            rpc_counter=self.rpc_counter
+        )
+        
         # 初始化Pygame
         pygame.init()
         
-        # 获取显示器信息
-        display_info = pygame.display.Info()
-        max_width = min(1600, display_info.current_w - 100)
-        max_height = min(900, display_info.current_h - 100)
+        # 获取显示器信息（无界面模式用于多环境工作进程，不创建窗口）
+        if headless:
+            max_width, max_height = 1600, 900
+        else:
+            display_info = pygame.display.Info()
+            max_width = min(1600, display_info.current_w - 100)
+            max_height = min(900, display_info.current_h - 100)
         
         # 计算主视图尺寸（16:9）
         main_width = max_width - 300
@@ -56,11 +94,12 @@ class AutonomousScenario:
         self.side_panel_width = 300
         self.map_size = 280
         
-        self.screen = pygame.display.set_mode(self.display_size)
-        pygame.display.set_caption('Autonomous Driving Scenario')
+        self.screen = None
+        if not headless:
+            self.screen = pygame.display.set_mode(self.display_size)
+            pygame.display.set_caption('Autonomous Driving Scenario')
         
-        # 记录开始时间
-        self.start_time = time.time()
+        # 轮次设置（仿真时间）
         self.round_time = 30
         self.max_rounds = 10
         self.current_round = 0
@@ -68,27 +107,112 @@ class AutonomousScenario:
         # 存储车辆和摄像头
         self.ego_vehicle = None
         self.npc_vehicles = []
+        # 生成点变换，热重置时把actor瞬移回这些位置（与npc_vehicles一一对应）
+        self.ego_spawn_transform = None
+        self.npc_spawn_transforms = []
+        self.warm_reset = warm_reset
         self.cameras = {}
+        self.camera_views = {}
         self.camera_surfaces = {}
         
         # 强化学习相关
         self.rl_control = True  # 默认使用RL控制
-        self.rl_agent = RLAgent()  # 创建RL代理
+        self.rl_agent = None
+        self.replay_buffer = None
+        self.learner = None
+        if with_agent:
+            self.rl_agent = RLAgent()  # 创建RL代理
+            # 默认经验交给RLAgent.store_experience()。指定replay_buffer_capacity时改用预分配的列式回放池，
+            # 要求RLAgent声明replay_buffer并在train()中从replay_buffer.sample()采样（否则BackgroundLearner报错）；
+            # 再指定replay_buffer_dir时回放池存放在磁盘上，目录里已有回放池时接着使用
+            if replay_buffer_capacity:
+                if replay_buffer_dir is not None and os.path.exists(os.path.join(replay_buffer_dir, 'meta.json')):
+                    self.replay_buffer = ObservationReplayBuffer.open(replay_buffer_dir)
+                    print(f"已打开回放池 {replay_buffer_dir}（{len(self.replay_buffer)} 条经验）")
+                else:
+                    self.replay_buffer = ObservationReplayBuffer(replay_buffer_capacity, mmap_dir=replay_buffer_dir)
+            self.learner = BackgroundLearner(self.rl_agent, replay_buffer=self.replay_buffer)  # 后台训练线程
+        self.reward_fn = reward_fn if reward_fn is not None else self.rl_agent.calculate_reward
         self.last_observation = None
         self.last_action = None
         self.episode_reward = 0
+        # 观察布局；flat_observations为True时get_observation直接返回扁平float32向量
+        self.observation_layout = ObservationLayout()
+        self.flat_observations = flat_observations
+        # 主循环的观察写入这块预分配缓冲区（字段视图也只建一次），只在存储经验时复制
+        self._observation_buffer = self.observation_layout.allocate()
+        self._observation_views = self.observation_layout.views(self._observation_buffer)
         self.collision_sensor = None
         self.last_collision_time = 0
         self.collision_cooldown = 1.0  # 碰撞检测冷却时间（秒）
+        self.pending_collision = False  # 传感器线程只做标记，由主循环处理
         
         # 创建输出文件夹
         self.output_dir = f"scenario_output_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
         os.makedirs(self.output_dir, exist_ok=True)
         
+        # 每步数据异步写入输出目录（按RPC端口区分，多环境并行时互不覆盖）
+        self.recorder = None
+        if record_episodes:
+            self.recorder = EpisodeRecorder(os.path.join(self.output_dir, f"episodes_{port}"))
+        self.record_frames = record_frames  # 是否同时记录主视角画面
+        self._recorded_camera_frame = -1  # 上次记录的画面帧号，同一帧不重复记录
+        self.episode_index = 0
+        
+        # 主循环逐阶段计时（未启用时几乎没有开销），汇总定期追加到输出目录；F3切换界面叠加层
+        # 学习线程只取累计计数（metrics()会重置吞吐量统计窗口）
+        extra_metrics = {}
+        if self.learner is not None:
+            extra_metrics['learner'] = lambda: {
+                'queue_depth': self.learner.queue.qsize(),
+                'pushed': self.learner.pushed,
+                'dropped': self.learner.dropped,
+                'train_steps': self.learner.train_steps
+            }
+        if self.recorder is not None:
+            extra_metrics['recorder'] = self.recorder.metrics
+        self.profiler = TickProfiler(
+            self.rpc_counter,
+            enabled=profile,
+            export_path=os.path.join(self.output_dir, f"tick_profile_{port}.jsonl"),
+            sampling=profile_sampling,
+            extra_metrics=extra_metrics
+        )
+        self.show_profiler = profile
+        
         # 字体初始化
         self.font_large = pygame.font.Font(None, 48)
         self.font_normal = pygame.font.Font(None, 36)
         self.font_small = pygame.font.Font(None, 24)
+        
+        # 缓存式界面绘制
+        self.hud = None
+        if self.screen is not None:
+            self.hud = ScenarioHud(
+                self.screen, self.main_view_size, self.side_panel_width, self.map_size,
+                self.font_large, self.font_normal, self.font_small
+            )
+
+    def build_map_indices(self):
+        """构建地图相关的静态索引（每次加载地图后调用一次）"""
+        self.world_id = self.world.id
+        self.traffic_light_index = StaticActorIndex(self.world, 'traffic.traffic_light', self.map.name)
+        self.route_cache = RouteCache(self.map, lookahead=10, spacing=5.0, rpc_counter=self.rpc_counter)
+        print(f"已索引 {len(self.traffic_light_index)} 个交通信号灯")
+
+    def check_map_changed(self):
+        """服务器切换地图后刷新地图引用并重建静态索引"""
+        world = self.client.get_world()
+        if world.id == self.world_id:
+            return False
+        self.world = world
+        self.map = world.get_map()
+        self.blueprint_library = world.get_blueprint_library()
+        self.snapshot_cache = WorldSnapshotCache(self.world, self.rpc_counter)
+        self.stepping.world = world
+        self.stepping.enable()
+        self.build_map_indices()
+        return True
 
     def setup_ego_vehicle(self):
         """设置主车"""
@@ -102,6 +226,8 @@ class AutonomousScenario:
                 carla.Rotation(yaw=ego_spawn['yaw'])
             )
             
+            self.ego_spawn_transform = transform
+            
             # 尝试多次生成主车
             max_attempts = 3
             for attempt in range(max_attempts):
@@ -111,7 +237,7 @@ class AutonomousScenario:
                 except Exception as e:
                     if attempt == max_attempts - 1:
                         raise Exception(f"无法生成主车: {str(e)}")
-                    time.sleep(0.5)
+                    self.stepping.settle(0.5)
             
             # 设置碰撞检测器
             collision_bp = self.blueprint_library.find('sensor.other.collision')
@@ -120,45 +246,136 @@ class AutonomousScenario:
             
             # 根据控制模式设置车辆
             if not self.rl_control:
-                self.ego_vehicle.set_autopilot(True)
+                self.ego_vehicle.set_autopilot(True, self.traffic_manager.get_port())
             
             # 设置摄像头
             self.setup_cameras()
             
             # 重置RL状态
-            self.last_observation = None
-            self.last_action = None
-            self.episode_reward = 0
+            self.reset_episode_state()
             
         except Exception as e:
             print(f"设置主车时出错: {str(e)}")
             raise
 
+    def setup_cameras(self):
+        """设置主视角和小地图摄像头
+
+        每个摄像头一个单槽最新帧缓冲和一块预分配surface，传感器线程只替换最新帧，
+        绘制时再把BGRA数据写入surface。无界面模式下不创建摄像头。
+        """
+        if self.screen is None:
+            return
+        
+        camera_configs = {
+            # 名称: (画面尺寸, 相对主车的位置, 视场角)
+            'main': (self.main_view_size,
+                     carla.Transform(carla.Location(x=-6.0, z=3.0), carla.Rotation(pitch=-15.0)), 90),
+            'map': ((self.map_size, self.map_size),
+                    carla.Transform(carla.Location(z=50.0), carla.Rotation(pitch=-90.0)), 90),
+        }
+        for name, (size, transform, fov) in camera_configs.items():
+            camera_bp = self.blueprint_library.find('sensor.camera.rgb')
+            camera_bp.set_attribute('image_size_x', str(size[0]))
+            camera_bp.set_attribute('image_size_y', str(size[1]))
+            camera_bp.set_attribute('fov', str(fov))
+            camera = self.world.spawn_actor(camera_bp, transform, attach_to=self.ego_vehicle)
+            
+            view = CameraView(size, like=self.screen)
+            camera.listen(view.callback)
+            self.cameras[name] = camera
+            self.camera_views[name] = view
+            self.camera_surfaces[name] = view.surface
+        self.hud.invalidate()
+
+    def setup_npc_vehicles(self, max_attempts=3):
+        """批量生成NPC车辆
+
+        每个生成点一条SpawnActor命令，并在同一批中用then(SetAutopilot)开启自动驾驶，
+        所有NPC一次apply_batch_sync完成。生成点被占用而失败的在下一帧重试。
+        """
+        SpawnActor = carla.command.SpawnActor
+        SetAutopilot = carla.command.SetAutopilot
+        FutureActor = carla.command.FutureActor
+        
+        # 只使用四轮车辆
+        blueprints = [bp for bp in self.blueprint_library.filter('vehicle.*')
+                      if int(bp.get_attribute('number_of_wheels')) == 4]
+        tm_port = self.traffic_manager.get_port()
+        
+        pending = [
+            carla.Transform(
+                carla.Location(x=point['x'], y=point['y'], z=point['z']),
+                carla.Rotation(yaw=point['yaw'])
+            )
+            for point in self.spawn_data.get('npc_points', [])
+        ]
+        total = len(pending)
+        spawned = []  # [(actor_id, transform), ...]
+        
+        for attempt in range(max_attempts):
+            commands = []
+            for transform in pending:
+                blueprint = random.choice(blueprints)
+                if blueprint.has_attribute('color'):
+                    color = random.choice(blueprint.get_attribute('color').recommended_values)
+                    blueprint.set_attribute('color', color)
+                blueprint.set_attribute('role_name', 'npc')
+                commands.append(SpawnActor(blueprint, transform).then(SetAutopilot(FutureActor, True, tm_port)))
+            
+            failed = []
+            self.rpc_counter.count('client.apply_batch_sync')
+            for transform, response in zip(pending, self.client.apply_batch_sync(commands, False)):
+                if response.error:
+                    failed.append(transform)
+                else:
+                    spawned.append((response.actor_id, transform))
+            
+            pending = failed
+            if not pending:
+                break
+            if attempt < max_attempts - 1:
+                self.stepping.settle(0.5)  # 等待占用生成点的车辆离开
+        
+        if pending:
+            print(f"有 {len(pending)} 个NPC生成点被占用，已跳过")
+        
+        # 一次取回所有actor，保持与生成点的对应顺序
+        actors = {actor.id: actor for actor in self.world.get_actors([actor_id for actor_id, _ in spawned])}
+        self.npc_vehicles = []
+        self.npc_spawn_transforms = []
+        for actor_id, transform in spawned:
+            if actor_id in actors:
+                self.npc_vehicles.append(actors[actor_id])
+                self.npc_spawn_transforms.append(transform)
+        print(f"已生成 {len(self.npc_vehicles)}/{total} 辆NPC")
+
+    def destroy_npc_vehicles(self):
+        """批量销毁所有NPC车辆"""
+        if self.npc_vehicles:
+            self.rpc_counter.count('client.apply_batch_sync')
+            self.client.apply_batch_sync([
+                carla.command.DestroyActor(vehicle.id)
+                for vehicle in self.npc_vehicles if vehicle is not None
+            ], False)
+        self.npc_vehicles = []
+        self.npc_spawn_transforms = []
+
+    def reset_episode_state(self):
+        """清空RL和传感器的回合状态"""
+        self.last_observation = None
+        self.last_action = None
+        self.episode_reward = 0
+        self.pending_collision = False
+        self.last_collision_time = 0
+
     def _on_collision(self, event):
-        """碰撞事件处理"""
-        current_time = time.time()
+        """碰撞事件处理（在传感器线程中调用，只做标记，经验在主循环中提交）"""
+        current_time = event.timestamp  # 仿真时间
         if current_time - self.last_collision_time > self.collision_cooldown:
             self.last_collision_time = current_time
-            if self.rl_control and self.last_observation is not None:
-                # 给予碰撞惩罚
-                reward = self.rl_agent.calculate_reward(
-                    self.last_observation, 
-                    collision=True
-                )
-                self.episode_reward += reward
-                
-                # 存储经验
-                current_observation = self.get_observation()
-                self.rl_agent.store_experience(
-                    self.last_observation,
-                    self.last_action,
-                    reward,
-                    current_observation,
-                    True  # 碰撞视为终止状态
-                )
-                
-                # 训练网络
-                self.rl_agent.train()
+            if self.rl_control:
+                self.pending_collision = True
 
     def update_rl_control(self):
         """更新强化学习控制"""
@@ -166,93 +383,226 @@ class AutonomousScenario:
             return
             
         try:
-            # 获取当前观察
-            current_observation = self.get_observation()
+            # 获取当前观察（写入预分配缓冲区，下一帧会被覆盖）
+            current_observation = self.get_observation(out=self._observation_buffer)
+            # 存入经验队列和记录的观察需要自己的副本，每帧复制一次，下一帧作为上一观察复用
+            stored_observation = None
+            if current_observation is not None:
+                stored_observation = self.observation_layout.copy(current_observation)
+            
+            collision = self.pending_collision
+            self.pending_collision = False
             
             if self.last_observation is not None and self.last_action is not None:
-                # 计算奖励
-                reward = self.rl_agent.calculate_reward(
-                    current_observation,
-                    collision=False,
-                    off_road=not self.ego_vehicle.get_location().z > 0
-                )
-                self.episode_reward += reward
+                reward = self._compute_reward(current_observation, collision)
                 
-                # 存储经验
-                self.rl_agent.store_experience(
+                # 提交经验，训练由后台线程完成（碰撞视为终止状态）
+                self.learner.push(
                     self.last_observation,
                     self.last_action,
                     reward,
-                    current_observation,
-                    False
+                    stored_observation,
+                    collision
                 )
-                
-                # 训练网络
-                self.rl_agent.train()
+                self._record_step(self.last_observation, self.last_action, reward, collision, collision)
             
             # 选择动作
-            action = self.rl_agent.select_action(current_observation)
+            action = self.learner.select_action(current_observation)
             
             # 应用动作
             self.apply_rl_action(action)
             
             # 更新状态
-            self.last_observation = current_observation
+            self.last_observation = stored_observation
             self.last_action = action
             
         except Exception as e:
             print(f"更新RL控制时出错: {str(e)}")
 
+    def _compute_reward(self, current_observation, collision):
+        """计算本步奖励并累计到回合奖励"""
+        if collision:
+            # 给予碰撞惩罚
+            reward = self.reward_fn(
+                self.last_observation,
+                collision=True
+            )
+        else:
+            frame = self.snapshot_cache.get_frame(self.ego_vehicle)
+            reward = self.reward_fn(
+                current_observation,
+                collision=False,
+                off_road=not frame.ego_location.z > 0
+            )
+        self.episode_reward += reward
+        return reward
+
+    def _record_step(self, observation, action, reward, collision, done):
+        """把一步数据交给记录器（不阻塞），观察或动作获取失败的步不记录"""
+        if self.recorder is None or observation is None or action is None:
+            return
+        self.recorder.record(
+            self.episode_index,
+            observation=observation,
+            action=action,
+            reward=reward,
+            collision=collision,
+            done=done,
+            sim_frame=self.stepping.frame
+        )
+        if self.record_frames and 'main' in self.camera_views:
+            # 只传相机最新原始帧的引用，格式转换和写盘在记录线程完成
+            image = self.camera_views['main'].buffer.latest
+            if image is not None and image.frame != self._recorded_camera_frame:
+                self._recorded_camera_frame = image.frame
+                self.recorder.record_frame(self.episode_index, image.raw_data, image.width, image.height,
+                                           sim_frame=self.stepping.frame)
+
+    def _end_recorded_episode(self):
+        """标记记录中的回合结束"""
+        if self.recorder is not None:
+            self.recorder.end_episode(self.episode_index)
+        self.episode_index += 1
+
+    def env_reset(self):
+        """环境接口（多环境训练用）：重新生成场景，返回初始观察"""
+        if not self.stepping.enabled:
+            self.stepping.enable()
+        if self.recorder is not None:
+            self.recorder.start()
+        self.restart_actors()
+        self.last_observation = self.get_observation()
+        self.last_action = None
+        return self.last_observation
+
+    def apply_rl_action(self, action):
+        """把动作(油门, 转向, 刹车)应用到主车
+
+        动作必须是3个有限数值，否则抛出ValueError；超出范围的值裁剪到油门/刹车[0, 1]、转向[-1, 1]。
+        """
+        values = np.asarray(action, dtype=np.float64)
+        if values.size != 3:
+            raise ValueError(f"动作应为(油门, 转向, 刹车)3个值，收到形状为{values.shape}的数组")
+        values = values.ravel()
+        if not np.isfinite(values).all():
+            raise ValueError(f"动作包含NaN或无穷大: {values.tolist()}")
+        if not self.ego_vehicle:
+            return
+        throttle, steer, brake = np.clip(values, (0.0, -1.0, 0.0), (1.0, 1.0, 1.0))
+        self.rpc_counter.count('ego.apply_control')
+        self.ego_vehicle.apply_control(carla.VehicleControl(
+            throttle=float(throttle),
+            steer=float(steer),
+            brake=float(brake)
+        ))
+
+    def env_step(self, action):
+        """环境接口：应用动作并推进一帧，返回(观察, 奖励, 是否结束, 信息)"""
+        self.apply_rl_action(action)
+        self.rpc_counter.end_tick()
+        self.stepping.tick()
+        
+        observation = self.get_observation()
+        collision = self.pending_collision
+        self.pending_collision = False
+        reward = self._compute_reward(observation, collision)
+        done = collision or self.stepping.round_elapsed() >= self.round_time
+        self._record_step(self.last_observation, action, reward, collision, done)
+        if done:
+            self._end_recorded_episode()
+        self.last_observation = observation
+        self.last_action = action
+        
+        info = {
+            'frame': self.stepping.frame,
+            'collision': collision,
+            'episode_reward': self.episode_reward
+        }
+        return observation, reward, done, info
+
+    def close(self):
+        """销毁所有actor并恢复服务器设置"""
+        try:
+            if self.ego_vehicle is not None or self.npc_vehicles:
+                self.destroy_actors()
+        finally:
+            if self.recorder is not None:
+                self.recorder.stop()
+            if self.replay_buffer is not None:
+                self.replay_buffer.flush()
+            self.stepping.restore()
+
     def run(self):
         """运行场景"""
+        if self.learner is None:
+            print("交互运行需要RL代理，请使用with_agent=True创建场景")
+            return
         try:
             # 初始设置
             try:
-                self.setup_ego_vehicle()
-                time.sleep(0.2)
-                self.setup_npc_vehicles()
-                time.sleep(0.2)
+                self.learner.start()
+                if self.recorder is not None:
+                    self.recorder.start()
+                self.stepping.enable()
+                self.spawn_actors()
+                self.profiler.start()
                 print(f"开始第{self.current_round + 1}轮...")
             except Exception as e:
                 print(f"初始设置时出错: {str(e)}")
                 return
             
-            clock = pygame.time.Clock()
             running = True
             
             while running:
                 try:
-                    for event in pygame.event.get():
-                        if event.type == pygame.QUIT:
-                            running = False
-                        elif event.type == pygame.KEYDOWN:
-                            if event.key == pygame.K_ESCAPE:
+                    profiler = self.profiler
+                    with profiler.stage('events'):
+                        for event in pygame.event.get():
+                            if event.type == pygame.QUIT:
                                 running = False
-                            elif event.key == pygame.K_SPACE:
-                                # 切换控制模式
-                                self.rl_control = not self.rl_control
-                                if self.ego_vehicle:
-                                    self.ego_vehicle.set_autopilot(not self.rl_control)
-                                print(f"切换到{'强化学习' if self.rl_control else '自动驾驶'}控制模式")
+                            elif event.type == pygame.VIDEOEXPOSE and self.hud is not None:
+                                # 窗口被覆盖后整屏重绘
+                                self.hud.invalidate()
+                            elif event.type == pygame.KEYDOWN:
+                                if event.key == pygame.K_ESCAPE:
+                                    running = False
+                                elif event.key == pygame.K_SPACE:
+                                    # 切换控制模式
+                                    self.rl_control = not self.rl_control
+                                    if self.ego_vehicle:
+                                        self.ego_vehicle.set_autopilot(not self.rl_control, self.traffic_manager.get_port())
+                                    print(f"切换到{'强化学习' if self.rl_control else '自动驾驶'}控制模式")
+                                elif event.key == pygame.K_F3 and profiler.enabled:
+                                    # 切换性能叠加层
+                                    self.show_profiler = not self.show_profiler
                     
                     # 更新RL控制
                     if self.rl_control:
-                        self.update_rl_control()
+                        with profiler.stage('rl_control'):
+                            self.update_rl_control()
                     
                     # 检查是否需要重置场景
-                    if time.time() - self.start_time >= self.round_time:
-                        # 保存当前轮次的模型
-                        if self.rl_control:
-                            self.rl_agent.training_history['episode_rewards'].append(self.episode_reward)
-                            self.rl_agent.training_history['episode_lengths'].append(self.round_time)
-                            self.rl_agent.save_model(self.current_round)
-                        
-                        if not self.reset_scenario():
-                            time.sleep(3)
-                            running = False
+                    if self.stepping.round_elapsed() >= self.round_time:
+                        with profiler.stage('reset'):
+                            # 保存当前轮次的模型
+                            if self.rl_control:
+                                self.rl_agent.training_history['episode_rewards'].append(self.episode_reward)
+                                self.rl_agent.training_history['episode_lengths'].append(self.round_time)
+                                self.learner.save_model(self.current_round)
+                            self._end_recorded_episode()
+                            
+                            if not self.reset_scenario():
+                                time.sleep(3)
+                                running = False
                     
-                    self.draw()
-                    clock.tick(60)
+                    # 无渲染模式下跳过界面绘制
+                    if not self.stepping.no_rendering:
+                        with profiler.stage('draw'):
+                            self.draw()
+                    self.rpc_counter.end_tick()
+                    with profiler.stage('tick'):
+                        self.stepping.tick()
+                    profiler.end_tick()
                 except Exception as e:
                     print(f"主循环中出错: {str(e)}")
                     running = False
@@ -261,12 +611,18 @@ class AutonomousScenario:
             # 清理资源
             try:
                 pygame.quit()
+                self.profiler.close()
+                self.learner.stop()
+                if self.replay_buffer is not None:
+                    self.replay_buffer.flush()
+                if self.recorder is not None:
+                    self.recorder.stop()
                 
                 if self.collision_sensor:
                     self.collision_sensor.destroy()
                 
                 if self.ego_vehicle:
-                    self.ego_vehicle.set_autopilot(False)
+                    self.ego_vehicle.set_autopilot(False, self.traffic_manager.get_port())
                     self.ego_vehicle.destroy()
                 
                 for camera in self.cameras.values():
@@ -274,51 +630,37 @@ class AutonomousScenario:
                         camera.stop()
                         camera.destroy()
                 
-                for vehicle in self.npc_vehicles:
-                    if vehicle is not None:
-                        vehicle.set_autopilot(False)
-                        vehicle.destroy()
+                self.destroy_npc_vehicles()
+                
+                # 恢复服务器的异步模式设置
+                self.stepping.restore()
             except Exception as e:
                 print(f"清理资源时出错: {str(e)}")
 
     def reset_scenario(self):
         """重置场景"""
         print(f"\n正在重置场景... 第{self.current_round + 1}轮完成")
+        print(f"平均每tick RPC次数: {self.rpc_counter.mean_per_tick():.1f}")
+        learner_metrics = self.learner.metrics()
+        print(f"训练队列深度: {learner_metrics['queue_depth']} | "
+              f"训练吞吐: {learner_metrics['transitions_per_sec']:.1f} 条/秒, "
+              f"{learner_metrics['train_steps_per_sec']:.1f} 步/秒 | "
+              f"丢弃: {learner_metrics['dropped']}")
+        if self.recorder is not None:
+            recorder_metrics = self.recorder.metrics()
+            print(f"记录队列深度: {recorder_metrics['queue_depth']} | "
+                  f"已写入: {recorder_metrics['written']} 步 | 丢弃: {recorder_metrics['dropped']}")
         
         try:
-            # 先清理摄像头
-            for camera in self.cameras.values():
-                if camera is not None:
-                    camera.stop()
-                    camera.destroy()
-            self.cameras.clear()
-            self.camera_surfaces.clear()
-            time.sleep(0.5)  # 等待摄像头完全清理
-            
-            # 清理车辆
-            if self.ego_vehicle:
-                self.ego_vehicle.set_autopilot(False)
-                self.ego_vehicle.destroy()
-                self.ego_vehicle = None
-            
-            for vehicle in self.npc_vehicles:
-                if vehicle is not None:
-                    vehicle.set_autopilot(False)
-                    vehicle.destroy()
-            self.npc_vehicles.clear()
-            
-            time.sleep(0.5)  # 等待车辆完全清理
-            
             self.current_round += 1
             if self.current_round < self.max_rounds:
                 print(f"开始第{self.current_round + 1}轮...")
                 try:
+                    # 地图变化时重建静态索引（旧地图上的actor失效，会自动走完整重新生成）
+                    self.check_map_changed()
+                    
                     # 重新设置场景
-                    self.setup_ego_vehicle()
-                    time.sleep(0.2)  # 等待主车生成
-                    self.setup_npc_vehicles()
-                    time.sleep(0.2)  # 等待NPC生成
-                    self.start_time = time.time()
+                    self.restart_actors()
                     return True
                 except Exception as e:
                     print(f"重置场景时出错: {str(e)}")
@@ -330,77 +672,124 @@ class AutonomousScenario:
             print(f"清理场景时出错: {str(e)}")
             return False
 
-    def draw(self):
-        """绘制pygame界面"""
-        if 'main' not in self.camera_surfaces or 'map' not in self.camera_surfaces:
+    def restart_actors(self):
+        """开始新一轮：优先热重置，actor失效时销毁并重新生成"""
+        if self.warm_reset and self.warm_reset_actors():
             return
-            
-        # 填充黑色背景
-        self.screen.fill((0, 0, 0))
-        
-        # 主视角（左侧）
-        self.screen.blit(self.camera_surfaces['main'], (0, 0))
-        
-        # 右侧信息面板背景
-        side_panel = pygame.Surface((self.side_panel_width, self.display_size[1]))
-        side_panel.fill((20, 20, 20))  # 深灰色背景
-        self.screen.blit(side_panel, (self.main_view_size[0], 0))
+        if self.ego_vehicle is not None or self.npc_vehicles:
+            self.destroy_actors()
+        self.spawn_actors()
+
+    def warm_reset_actors(self):
+        """热重置：把现有actor瞬移回生成点并清零速度，一次批量请求完成
+
+        返回False表示有actor失效或数量对不上，需要完整重新生成。
+        """
+        if self.ego_vehicle is None or len(self.npc_vehicles) != len(self.npc_spawn_transforms):
+            return False
+        actors = [self.ego_vehicle] + list(self.npc_vehicles)
+        transforms = [self.ego_spawn_transform] + list(self.npc_spawn_transforms)
+        sensors = [self.collision_sensor] + list(self.cameras.values())
+        if any(actor is None or not actor.is_alive for actor in actors + sensors):
+            return False
         
-        # 小地图（右上）
-        map_pos = (self.main_view_size[0] + 10, 10)  # 留出边距
-        map_bg = pygame.Surface((self.map_size, self.map_size))
-        map_bg.fill((0, 0, 0))
-        self.screen.blit(map_bg, map_pos)
-        self.screen.blit(self.camera_surfaces['map'], map_pos)
+        zero = carla.Vector3D()
+        commands = []
+        for actor, transform in zip(actors, transforms):
+            commands += [
+                carla.command.ApplyTransform(actor.id, transform),
+                carla.command.ApplyTargetVelocity(actor.id, zero),
+                carla.command.ApplyTargetAngularVelocity(actor.id, zero)
+            ]
+        # 松开主车油门/刹车
+        commands.append(carla.command.ApplyVehicleControl(self.ego_vehicle.id, carla.VehicleControl()))
+        
+        self.rpc_counter.count('client.apply_batch_sync')
+        for response in self.client.apply_batch_sync(commands, False):
+            if response.error:
+                print(f"热重置失败，改为重新生成: {response.error}")
+                return False
         
-        # 显示NPC数量
-        npc_text = f"NPCs: {len(self.npc_vehicles)}"
-        npc_surface = self.font_normal.render(npc_text, True, (200, 200, 200))
-        self.screen.blit(npc_surface, (map_pos[0], map_pos[1] + self.map_size + 10))
+        # 瞬移后清空缓存、旧画面和回合状态
+        for view in self.camera_views.values():
+            view.buffer.clear()
+        self.snapshot_cache.invalidate()
+        self.route_cache.reset()
+        self.reset_episode_state()
+        self.stepping.settle(0.2)  # 等待瞬移生效
+        self.stepping.start_round()
+        return True
+
+    def destroy_actors(self):
+        """销毁摄像头、碰撞传感器、主车和NPC"""
+        # 先清理摄像头
+        for camera in self.cameras.values():
+            if camera is not None:
+                camera.stop()
+                camera.destroy()
+        self.cameras.clear()
+        self.camera_views.clear()
+        self.camera_surfaces.clear()
+        self.stepping.settle(0.5)  # 等待摄像头完全清理
+        
+        if self.collision_sensor:
+            self.collision_sensor.stop()
+            self.collision_sensor.destroy()
+            self.collision_sensor = None
+        
+        # 清理车辆
+        if self.ego_vehicle:
+            self.ego_vehicle.set_autopilot(False, self.traffic_manager.get_port())
+            self.ego_vehicle.destroy()
+            self.ego_vehicle = None
+        
+        self.destroy_npc_vehicles()
+        self.snapshot_cache.invalidate()
+        self.route_cache.reset()
+        
+        self.stepping.settle(0.5)  # 等待车辆完全清理
+
+    def spawn_actors(self):
+        """生成主车和NPC，开始新一轮计时"""
+        self.setup_ego_vehicle()
+        self.stepping.settle(0.2)  # 等待主车生成
+        self.setup_npc_vehicles()
+        self.stepping.settle(0.2)  # 等待NPC生成
+        self.stepping.start_round()
+
+    def draw(self):
+        """绘制pygame界面（静态元素已预渲染，只提交变化区域）"""
+        if self.screen is None:
+            return
+        if 'main' not in self.camera_surfaces or 'map' not in self.camera_surfaces:
+            return
         
-        # 获取并显示车辆数据
-        vehicle_info = self.get_vehicle_data()
-        self.draw_vehicle_info(vehicle_info, self.main_view_size[0] + 10, self.map_size + 80)
+        # 取各摄像头的最新帧写入surface（旧帧已被丢弃）
+        main_updated = self.camera_views['main'].update()
+        map_updated = self.camera_views['map'].update()
         
         # 显示当前轮次和时间
-        time_left = self.round_time - (time.time() - self.start_time) % self.round_time
-        
-        # 在主屏幕左上方显示轮次信息
-        info_bg = pygame.Surface((300, 100))
-        info_bg.fill((0, 0, 0))
-        info_bg.set_alpha(160)
-        self.screen.blit(info_bg, (20, 20))
-        
-        round_text = f"Round {self.current_round + 1}/{self.max_rounds}"
-        time_text = f"Time: {int(time_left)}s"
-        
-        round_surface = self.font_large.render(round_text, True, (255, 255, 255))
-        time_surface = self.font_large.render(time_text, True, (255, 255, 255))
-        
-        self.screen.blit(round_surface, (30, 30))
-        self.screen.blit(time_surface, (30, 70))
-        
-        # 底部操作提示
-        help_text = "ESC: Exit | Space: Switch Mode | Right Click: Save"
-        help_surface = self.font_small.render(help_text, True, (200, 200, 200))
-        help_bg = pygame.Surface((help_surface.get_width() + 20, help_surface.get_height() + 10))
-        help_bg.fill((0, 0, 0))
-        help_bg.set_alpha(160)
-        
-        help_pos = (self.display_size[0] - help_surface.get_width() - 30, self.display_size[1] - 40)
-        self.screen.blit(help_bg, (help_pos[0] - 10, help_pos[1] - 5))
-        self.screen.blit(help_surface, help_pos)
-        
-        pygame.display.flip()
+        time_left = self.round_time - self.stepping.round_elapsed() % self.round_time
+        
+        self.hud.draw(
+            self.camera_surfaces['main'], main_updated,
+            self.camera_surfaces['map'], map_updated,
+            round_text=f"Round {self.current_round + 1}/{self.max_rounds}",
+            time_text=f"Time: {int(time_left)}s",
+            npc_text=f"NPCs: {len(self.npc_vehicles)}",
+            vehicle_info=self.get_vehicle_data(),
+            overlay=self.profiler.overlay(self.font_small) if self.show_profiler else None
+        )
 
     def get_vehicle_data(self):
         """获取车辆数据"""
         if not self.ego_vehicle:
             return None
             
-        velocity = self.ego_vehicle.get_velocity()
-        transform = self.ego_vehicle.get_transform()
-        control = self.ego_vehicle.get_control()
+        frame = self.snapshot_cache.get_frame(self.ego_vehicle)
+        velocity = frame.ego_velocity
+        transform = frame.ego_transform
+        control = frame.ego_control
         
         # 计算速度
         speed = 3.6 * math.sqrt(velocity.x**2 + velocity.y**2 + velocity.z**2)  # km/h
@@ -415,255 +804,151 @@ class AutonomousScenario:
             'gear': control.gear
         }
 
-    def draw_vehicle_info(self, info, start_x, start_y):
-        """绘制车辆信息仪表盘"""
-        if not info:
-            return
-            
-        # 背景面板
-        panel_width = self.side_panel_width - 20  # 留出边距
-        panel_height = 280
-        panel_surface = pygame.Surface((panel_width, panel_height))
-        panel_surface.fill((0, 0, 0))
-        panel_surface.set_alpha(160)  # 稍微透明一些
-        self.screen.blit(panel_surface, (start_x, start_y))
-        
-        y_offset = start_y + 20
-        x_padding = start_x + 20
-        
-        # 速度表（大字体）
-        speed_text = f"{info['speed']:.1f} km/h"
-        speed_surface = self.font_large.render(speed_text, True, (255, 255, 255))
-        self.screen.blit(speed_surface, (x_padding, y_offset))
-        
-        y_offset += 60
-        
-        # 方向盘状态
-        steer_text = f"Steering: {info['steer']:.2f}"
-        steer_surface = self.font_normal.render(steer_text, True, (255, 255, 255))
-        self.screen.blit(steer_surface, (x_padding, y_offset))
-        
-        y_offset += 40
-        
-        # 油门刹车
-        throttle_text = f"Throttle: {info['throttle']:.2f}"
-        brake_text = f"Brake: {info['brake']:.2f}"
-        throttle_surface = self.font_normal.render(throttle_text, True, (0, 255, 0))
-        brake_surface = self.font_normal.render(brake_text, True, (255, 0, 0))
-        self.screen.blit(throttle_surface, (x_padding, y_offset))
-        self.screen.blit(brake_surface, (x_padding, y_offset + 40))
-        
-        y_offset += 80
-        
-        # 档位
-        gear_text = f"Gear: {info['gear']}"
-        gear_surface = self.font_normal.render(gear_text, True, (255, 255, 255))
-        self.screen.blit(gear_surface, (x_padding, y_offset))
-        
-        y_offset += 40
-        
-        # 坐标
-        loc = info['location']
-        loc_text = f"Location: ({loc.x:.1f}, {loc.y:.1f})"
-        loc_surface = self.font_small.render(loc_text, True, (200, 200, 200))
-        self.screen.blit(loc_surface, (x_padding, y_offset))
+    def get_observation(self, out=None):
+        """获取当前状态观察
 
-    def get_observation(self):
-        """获取当前状态观察"""
+        所有字段直接写入一块扁平float32缓冲区（布局见self.observation_layout.spec()）。
+        指定out时写入out（例如批量网络输入的一行，主循环传入预分配的缓冲区），否则分配一块新缓冲区；
+        env接口返回给调用方的观察不会被复用。
+        flat_observations模式下返回扁平向量，否则返回字段视图组成的字典。
+        """
         if not self.ego_vehicle:
             return None
             
         try:
-            # 基本车辆状态
-            velocity = self.ego_vehicle.get_velocity()
-            accel = self.ego_vehicle.get_acceleration()
-            angular_velocity = self.ego_vehicle.get_angular_velocity()
-            transform = self.ego_vehicle.get_transform()
-            control = self.ego_vehicle.get_control()
-            
-            # 获取车辆物理状态
-            physics_control = self.ego_vehicle.get_physics_control()
-            wheels = physics_control.wheels
-            wheel_positions = np.array([[wheel.position.x, wheel.position.y, wheel.position.z] for wheel in wheels])
-            
-            # 获取车道信息
-            waypoint = self.map.get_waypoint(self.ego_vehicle.get_location())
-            next_waypoints = []
-            current_waypoint = waypoint
-            for _ in range(10):  # 获取前方10个路点
-                next_waypoint = current_waypoint.next(5.0)[0]  # 每5米一个点
-                next_waypoints.append([
-                    next_waypoint.transform.location.x,
-                    next_waypoint.transform.location.y,
-                    next_waypoint.transform.location.z,
-                    next_waypoint.transform.rotation.yaw
-                ])
-                current_waypoint = next_waypoint
+            buffer = out if out is not None else self.observation_layout.allocate()
+            if buffer is self._observation_buffer:
+                obs = self._observation_views
+            else:
+                obs = self.observation_layout.views(buffer)
+            
+            # 基本车辆状态（同一帧只从快照获取一次）
+            frame = self.snapshot_cache.get_frame(self.ego_vehicle)
+            velocity = frame.ego_velocity
+            accel = frame.ego_acceleration
+            angular_velocity = frame.ego_angular_velocity
+            transform = frame.ego_transform
+            control = frame.ego_control
+            
+            # 基本运动学信息
+            obs['velocity'][:] = (velocity.x, velocity.y, velocity.z)
+            obs['acceleration'][:] = (accel.x, accel.y, accel.z)
+            obs['angular_velocity'][:] = (angular_velocity.x, angular_velocity.y, angular_velocity.z)
+            
+            # 位置和方向
+            obs['location'][:] = (transform.location.x, transform.location.y, transform.location.z)
+            obs['rotation'][:] = (transform.rotation.pitch, transform.rotation.yaw, transform.rotation.roll)
+            
+            # 控制状态
+            obs['control_state'][:] = (
+                control.throttle, control.steer, control.brake,
+                float(control.hand_brake), float(control.reverse)
+            )
+            
+            # 车轮状态（获取车辆物理状态，不足4个车轮的补零）
+            wheels = frame.ego_physics_control.wheels
+            wheel_positions = obs['wheel_positions']
+            wheel_positions[:] = 0
+            for i, wheel in enumerate(wheels[:len(wheel_positions)]):
+                wheel_positions[i] = (wheel.position.x, wheel.position.y, wheel.position.z)
+            
+            # 获取车道信息（本帧投影路点由路径缓存共享，前方10个路点每5米一个，增量推进）
+            waypoint = self.route_cache.update(frame.frame, frame.ego_location)
             
             # 获取车道线信息
             left_lane = waypoint.get_left_lane()
             right_lane = waypoint.get_right_lane()
-            lane_width = waypoint.lane_width
             lane_change = waypoint.lane_change
+            obs['lane_info'][:] = (
+                waypoint.lane_width,
+                float(waypoint.is_junction),
+                float(waypoint.is_intersection),
+                float(lane_change == carla.LaneChange.Left),
+                float(lane_change == carla.LaneChange.Right),
+                float(lane_change == carla.LaneChange.Both),
+                float(left_lane is not None),
+                float(right_lane is not None)
+            )
             
-            # 获取交通信号和标志
-            lights_list = self.world.get_actors().filter('traffic.traffic_light')
-            signs_list = self.world.get_actors().filter('traffic.traffic_sign')
+            # 路径信息
+            self.route_cache.lookahead_array(out=obs['waypoints'])
             
-            # 处理最近的交通信号
-            closest_light = None
-            min_light_distance = float('inf')
+            # 周围车辆信息（nearest_vehicles为每个扇区最近车辆的距离）
+            self._get_nearby_vehicle_info(frame, out=obs['vehicle_info'])
+            obs['nearest_vehicles'][:] = obs['vehicle_info'][:, 0]
+            
+            # 处理最近的交通信号（空间索引半径查询，只读取最近一个的状态）
             light_state = -1  # -1表示无信号灯
+            closest_light, min_light_distance = self.traffic_light_index.nearest(
+                frame.ego_location, 50.0  # 50米内的信号灯
+            )
+            if closest_light is not None:
+                self.rpc_counter.count('traffic_light.get_state')
+                light_state = closest_light.get_state().value
+            obs['traffic_light'][:] = (
+                min_light_distance if closest_light is not None else 100.0,
+                light_state
+            )
             
-            for light in lights_list:
-                light_location = light.get_location()
-                distance = light_location.distance(self.ego_vehicle.get_location())
-                if distance < min_light_distance and distance < 50.0:  # 50米内的信号灯
-                    min_light_distance = distance
-                    closest_light = light
-                    light_state = light.get_state().value
-            
-            # 获取天气信息
-            weather = self.world.get_weather()
-            
-            # 构建观察字典
-            observation = {
-                # 基本运动学信息
-                'velocity': np.array([velocity.x, velocity.y, velocity.z], dtype=np.float32),
-                'acceleration': np.array([accel.x, accel.y, accel.z], dtype=np.float32),
-                'angular_velocity': np.array([
-                    angular_velocity.x, angular_velocity.y, angular_velocity.z
-                ], dtype=np.float32),
-                
-                # 位置和方向
-                'location': np.array([
-                    transform.location.x, transform.location.y, transform.location.z
-                ], dtype=np.float32),
-                'rotation': np.array([
-                    transform.rotation.pitch, transform.rotation.yaw, transform.rotation.roll
-                ], dtype=np.float32),
-                
-                # 控制状态
-                'control_state': np.array([
-                    control.throttle, control.steer, control.brake,
-                    float(control.hand_brake), float(control.reverse)
-                ], dtype=np.float32),
-                
-                # 车轮状态
-                'wheel_positions': wheel_positions.astype(np.float32),
-                
-                # 车道信息
-                'lane_info': np.array([
-                    lane_width,
-                    float(waypoint.is_junction),
-                    float(waypoint.is_intersection),
-                    float(lane_change == carla.LaneChange.Left),
-                    float(lane_change == carla.LaneChange.Right),
-                    float(lane_change == carla.LaneChange.Both),
-                    float(left_lane is not None),
-                    float(right_lane is not None)
-                ], dtype=np.float32),
-                
-                # 路径信息
-                'waypoints': np.array(next_waypoints, dtype=np.float32),
-                
-                # 周围车辆信息
-                'nearest_vehicles': self._get_nearby_vehicle_distances(),
-                'vehicle_info': self._get_nearby_vehicle_info(),
-                
-                # 交通信号
-                'traffic_light': np.array([
-                    min_light_distance if closest_light else 100.0,
-                    light_state
-                ], dtype=np.float32),
-                
-                # 天气信息
-                'weather': np.array([
-                    weather.cloudiness,
-                    weather.precipitation,
-                    weather.precipitation_deposits,
-                    weather.wind_intensity,
-                    weather.fog_density,
-                    weather.wetness
-                ], dtype=np.float32),
-                
-                # 碰撞和危险信息
-                'danger_info': self._get_danger_info()
-            }
+            # 天气信息
+            weather = frame.weather
+            obs['weather'][:] = (
+                weather.cloudiness,
+                weather.precipitation,
+                weather.precipitation_deposits,
+                weather.wind_intensity,
+                weather.fog_density,
+                weather.wetness
+            )
             
-            return observation
+            # 碰撞和危险信息
+            self._get_danger_info(frame, out=obs['danger_info'])
+            
+            if self.flat_observations:
+                return buffer
+            return obs
             
         except Exception as e:
             print(f"获取观察时出错: {str(e)}")
             return None
 
-    def _get_nearby_vehicle_info(self):
+    def _get_nearby_vehicle_info(self, frame=None, out=None):
         """获取周围车辆的详细信息"""
-        vehicle_info = np.zeros((8, 4), dtype=np.float32)  # 8个方向，每个方向4个值
         if not self.ego_vehicle:
-            return vehicle_info
-            
-        ego_location = self.ego_vehicle.get_location()
-        ego_transform = self.ego_vehicle.get_transform()
-        ego_forward = ego_transform.get_forward_vector()
-        ego_velocity = self.ego_vehicle.get_velocity()
-        
-        # 获取所有车辆
-        vehicles = self.world.get_actors().filter('vehicle.*')
-        for vehicle in vehicles:
-            if vehicle.id == self.ego_vehicle.id:
-                continue
-                
-            # 计算相对位置
-            relative_location = vehicle.get_location() - ego_location
-            distance = relative_location.length()
-            if distance > 100.0:  # 忽略100米外的车辆
-                continue
-            
-            # 计算相对速度
-            vehicle_velocity = vehicle.get_velocity()
-            relative_velocity = math.sqrt(
-                (vehicle_velocity.x - ego_velocity.x) ** 2 +
-                (vehicle_velocity.y - ego_velocity.y) ** 2 +
-                (vehicle_velocity.z - ego_velocity.z) ** 2
-            )
-            
-            # 计算角度
-            angle = math.degrees(math.atan2(relative_location.y, relative_location.x))
-            angle = (angle - math.degrees(math.atan2(ego_forward.y, ego_forward.x))) % 360
-            
-            # 确定方向扇区（8个45度扇区）
-            sector = int((angle + 22.5) / 45) % 8
-            
-            # 计算时间to collision (TTC)
-            if relative_velocity > 0:
-                ttc = distance / relative_velocity
-            else:
-                ttc = 100.0  # 默认安全值
-            
-            # 如果这个扇区还没有车辆，或者这个车辆更近，则更新信息
-            if vehicle_info[sector][0] == 0 or distance < vehicle_info[sector][0]:
-                vehicle_info[sector] = np.array([
-                    distance,
-                    relative_velocity,
-                    ttc,
-                    angle
-                ], dtype=np.float32)
-        
-        return vehicle_info
+            if out is None:
+                return np.zeros((8, 4), dtype=np.float32)  # 8个方向，每个方向4个值
+            out[:] = 0
+            return out
+        if frame is None:
+            frame = self.snapshot_cache.get_frame(self.ego_vehicle)
+        
+        # 快照中的车辆（已排除主车）一次性批量编码
+        return encode_nearby_vehicles(
+            frame.ego_location,
+            frame.ego_transform.get_forward_vector(),
+            frame.ego_velocity,
+            frame.vehicle_positions,
+            frame.vehicle_velocities,
+            out=out
+        )
 
-    def _get_danger_info(self):
+    def _get_danger_info(self, frame=None, out=None):
         """获取危险相关的信息"""
+        if out is None:
+            out = np.zeros(5, dtype=np.float32)
         if not self.ego_vehicle:
-            return np.zeros(5, dtype=np.float32)
+            out[:] = 0
+            return out
             
         try:
-            location = self.ego_vehicle.get_location()
-            velocity = self.ego_vehicle.get_velocity()
+            if frame is None:
+                frame = self.snapshot_cache.get_frame(self.ego_vehicle)
+            location = frame.ego_location
+            velocity = frame.ego_velocity
             speed = math.sqrt(velocity.x**2 + velocity.y**2 + velocity.z**2)
             
-            # 获取当前车道
-            waypoint = self.map.get_waypoint(location)
+            # 获取当前车道（与观察共享同一帧的投影路点）
+            waypoint = self.route_cache.update(frame.frame, location)
             
             # 计算车道偏离
             lane_center = waypoint.transform.location
@@ -677,7 +962,7 @@ class AutonomousScenario:
             distance_to_edge = (lane_width / 2) - lane_deviation
             
             # 获取道路曲率
-            next_waypoint = waypoint.next(2.0)[0]
+            next_waypoint = self.route_cache.next_waypoint(2.0)
             road_curvature = abs(
                 math.degrees(math.atan2(
                     next_waypoint.transform.location.y - waypoint.transform.location.y,
@@ -686,22 +971,24 @@ class AutonomousScenario:
             )
             
             # 计算当前加速度
-            acceleration = self.ego_vehicle.get_acceleration()
+            acceleration = frame.ego_acceleration
             accel_magnitude = math.sqrt(
                 acceleration.x**2 + acceleration.y**2 + acceleration.z**2
             )
             
-            return np.array([
+            out[:] = (
                 lane_deviation,        # 车道偏离程度
                 distance_to_edge,      # 到路缘距离
                 road_curvature,        # 道路曲率
                 speed,                 # 当前速度
                 accel_magnitude        # 加速度大小
-            ], dtype=np.float32)
+            )
+            return out
             
         except Exception as e:
             print(f"获取危险信息时出错: {str(e)}")
-            return np.zeros(5, dtype=np.float32)
+            out[:] = 0
+            return out
 
 if __name__ == '__main__':
     try:
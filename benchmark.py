@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+
+"""场景tick的性能基准（使用fake_carla，不需要CARLA服务器）
+
+微基准：观察构建、周围车辆编码、危险信息、HUD绘制、热重置、生成点选择器绘制；
+宏基准：按NPC数量测完整tick（RL控制 + 绘制 + 推进一帧）。
+结果写成JSON；指定基准文件时逐项比较p50，变慢超过阈值记为回退并以返回码1退出。
+
+    python benchmark.py                                   # 结果写入 benchmark_results.json
+    python benchmark.py --save-baseline                   # 把本次结果保存为基准
+    python benchmark.py --baseline benchmark_baseline.json --threshold 0.15
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import types
+import numpy as np
+
+# 必须在导入pygame和各工具之前设置
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import fake_carla
+
+RESULTS_VERSION = 1
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class BenchmarkAgent:
+    """基准测试用的最小RL代理：固定动作、不训练
+
+    基准只测场景本身的开销，不依赖也不包含rl_agent.py的网络推理和训练。
+    """
+    def __init__(self):
+        self.replay_buffer = None  # 场景接入的列式回放池
+        self.training_history = {'episode_rewards': [], 'episode_lengths': []}
+
+    def select_action(self, observation):
+        return np.array([0.5, 0.0, 0.0], dtype=np.float32)
+
+    def calculate_reward(self, observation, collision=False, off_road=False):
+        return -1.0 if collision else 0.1
+
+    def store_experience(self, observation, action, reward, next_observation, done):
+        pass
+
+    def train(self):
+        pass
+
+    def save_model(self, *args, **kwargs):
+        pass
+
+
+def install_agent_stub():
+    """在导入场景之前注册rl_agent模块；已经导入过真实的rl_agent时保持不变"""
+    module = types.ModuleType('rl_agent')
+    module.RLAgent = BenchmarkAgent
+    sys.modules.setdefault('rl_agent', module)
+
+
+def summarize(samples):
+    """耗时样本（秒）-> 毫秒统计"""
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    return {
+        'n': int(len(ms)),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p90_ms': float(np.percentile(ms, 90)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'min_ms': float(ms.min()),
+        'max_ms': float(ms.max())
+    }
+
+
+def measure(fn, repeat, setup=None, warmup=5):
+    """重复调用fn并逐次计时；setup在每次调用前执行，不计入耗时"""
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        fn()
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def write_spawn_points(path, num_npcs):
+    """用假地图的生成点写spawn_points.json：第一个给主车，其余给NPC"""
+    world = fake_carla.Client('localhost', 2000).get_world()
+    spawn_points = world.get_map().get_spawn_points()
+    if num_npcs + 1 > len(spawn_points):
+        raise ValueError(f"NPC数量 {num_npcs} 超过假地图的生成点数 {len(spawn_points) - 1}，请增大 --blocks")
+
+    def point(transform):
+        location = transform.location
+        return {'x': location.x, 'y': location.y, 'z': location.z, 'yaw': transform.rotation.yaw}
+
+    with open(path, 'w') as f:
+        json.dump({
+            'map_name': world.get_map().name,
+            'ego_point': point(spawn_points[0]),
+            'npc_points': [point(transform) for transform in spawn_points[1:num_npcs + 1]]
+        }, f, indent=4)
+
+
+def respawn(scenario, num_npcs):
+    """按新的NPC数量重新生成所有actor"""
+    write_spawn_points('spawn_points.json', num_npcs)
+    with open('spawn_points.json', 'r') as f:
+        scenario.spawn_data = json.load(f)
+    scenario.destroy_actors()
+    scenario.spawn_actors()
+
+
+def scenario_tick(scenario):
+    """与AutonomousScenario.run主循环相同的一帧（不处理事件和轮次重置）"""
+    if scenario.rl_control:
+        scenario.update_rl_control()
+    if not scenario.stepping.no_rendering:
+        scenario.draw()
+    scenario.rpc_counter.end_tick()
+    scenario.stepping.tick()
+
+
+def run_scenario_benchmarks(args, results):
+    install_agent_stub()
+    from autonomous_scenario import AutonomousScenario
+
+    write_spawn_points('spawn_points.json', args.micro_npcs)
+    scenario = AutonomousScenario(headless=False, record_episodes=False)
+    scenario.stepping.realtime = False  # 基准测试不按真实时间限速
+    server = fake_carla.get_server(2000)
+    try:
+        scenario.stepping.enable()
+        scenario.spawn_actors()
+
+        def fresh_frame():
+            scenario.stepping.tick()
+            return scenario.snapshot_cache.get_frame(scenario.ego_vehicle)
+
+        state = {}
+
+        def prepare_frame():
+            state['frame'] = fresh_frame()
+
+        print(f"微基准（{len(scenario.npc_vehicles)} 辆NPC）...")
+        results['get_observation'] = measure(scenario.get_observation, args.repeat, setup=scenario.stepping.tick)
+        results['nearby_vehicle_info'] = measure(
+            lambda: scenario._get_nearby_vehicle_info(state['frame']), args.repeat, setup=prepare_frame
+        )
+        results['danger_info'] = measure(
+            lambda: scenario._get_danger_info(state['frame']), args.repeat, setup=prepare_frame
+        )
+        results['hud_draw'] = measure(scenario.draw, args.repeat, setup=scenario.stepping.tick)
+        results['warm_reset'] = measure(scenario.restart_actors, max(5, args.repeat // 20))
+
+        for num_npcs in args.npc_counts:
+            respawn(scenario, num_npcs)
+            rpc_before = sum(server.rpc_counts.values())
+            ticks = []
+            for i in range(args.warmup_ticks + args.ticks):
+                start = time.perf_counter()
+                scenario_tick(scenario)
+                if i >= args.warmup_ticks:
+                    ticks.append(time.perf_counter() - start)
+            result = summarize(ticks)
+            result['npcs'] = len(scenario.npc_vehicles)
+            result['ticks_per_sec'] = float(len(ticks) / sum(ticks))
+            result['rpcs_per_tick'] = (sum(server.rpc_counts.values()) - rpc_before) / (args.warmup_ticks + args.ticks)
+            results[f'tick_npc_{num_npcs}'] = result
+            print(f"完整tick（{result['npcs']} 辆NPC）: p50 {result['p50_ms']:.2f} ms, "
+                  f"{result['ticks_per_sec']:.0f} tick/s, {result['rpcs_per_tick']:.1f} RPC/tick")
+    finally:
+        scenario.close()
+
+
+def run_selector_benchmarks(args, results):
+    from spawn_point_selector import SpawnPointSelector
+
+    print("生成点选择器...")
+    selector = SpawnPointSelector()
+    results['selector_draw'] = measure(selector.draw, args.repeat)
+
+    # 平移：每次移动半块瓦片，新瓦片按需渲染
+    direction = [1]
+
+    def pan():
+        if abs(selector.view_left) > 4 * selector.width:
+            direction[0] = -direction[0]
+        selector.pan(37 * direction[0], 23 * direction[0])
+
+    results['selector_draw_pan'] = measure(selector.draw, args.repeat, setup=pan)
+
+
+def compare(results, baseline, threshold):
+    """按p50逐项和基准比较，返回回退列表；基准文件可用thresholds为单项指定阈值"""
+    regressions = []
+    thresholds = baseline.get('thresholds', {})
+    print(f"\n{'基准项':<24}{'基准p50':>12}{'本次p50':>12}{'变化':>10}")
+    for name, result in results.items():
+        reference = baseline.get('results', {}).get(name)
+        if reference is None:
+            print(f"{name:<24}{'-':>12}{result['p50_ms']:>10.3f}ms{'新增':>10}")
+            continue
+        change = result['p50_ms'] / max(reference['p50_ms'], 1e-9) - 1.0
+        limit = thresholds.get(name, threshold)
+        flag = ''
+        if change > limit:
+            flag = '  <-- 回退'
+            regressions.append({'name': name, 'baseline_p50_ms': reference['p50_ms'],
+                                'p50_ms': result['p50_ms'], 'change': change, 'threshold': limit})
+        print(f"{name:<24}{reference['p50_ms']:>10.3f}ms{result['p50_ms']:>10.3f}ms{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='场景tick性能基准（fake_carla）')
+    parser.add_argument('--output', default='benchmark_results.json', help='结果JSON路径')
+    parser.add_argument('--baseline', default=None, help='基准JSON路径（默认 benchmark_baseline.json，存在时比较）')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果写入基准文件')
+    parser.add_argument('--threshold', type=float, default=0.10, help='p50变慢超过该比例记为回退')
+    parser.add_argument('--npc-counts', default='0,25,100,250', help='宏基准的NPC数量，逗号分隔')
+    parser.add_argument('--micro-npcs', type=int, default=50, help='微基准使用的NPC数量')
+    parser.add_argument('--ticks', type=int, default=300, help='每个NPC数量计时的tick数')
+    parser.add_argument('--warmup-ticks', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=200, help='每个微基准的重复次数')
+    parser.add_argument('--latency', type=float, default=0.0, help='假后端每次RPC的延迟（秒）')
+    parser.add_argument('--blocks', type=int, default=12, help='假地图网格的道路数（每个方向）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-selector', action='store_true')
+    args = parser.parse_args()
+    args.npc_counts = [int(n) for n in args.npc_counts.split(',') if n.strip()]
+    baseline_path = os.path.abspath(args.baseline or 'benchmark_baseline.json')
+    output_path = os.path.abspath(args.output)
+
+    fake_carla.install(latency=args.latency, blocks=(args.blocks, args.blocks), seed=args.seed)
+    np.random.seed(args.seed)
+    random.seed(args.seed)
+
+    # 场景会在当前目录读写spawn_points.json、输出目录和地图缓存，放到临时目录里
+    sys.path.insert(0, REPO_DIR)
+    work_dir = tempfile.mkdtemp(prefix='carla_benchmark_')
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    results = {}
+    start = time.time()
+    try:
+        run_scenario_benchmarks(args, results)
+        if not args.skip_selector:
+            run_selector_benchmarks(args, results)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'version': RESULTS_VERSION,
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'duration_sec': time.time() - start,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {key: value for key, value in vars(args).items()
+                   if key not in ('output', 'baseline', 'save_baseline')},
+        'results': results
+    }
+
+    regressions = []
+    if os.path.exists(baseline_path) and not args.save_baseline:
+        with open(baseline_path, 'r') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        report['baseline'] = baseline_path
+        report['regressions'] = regressions
+
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"\n结果已保存到 {output_path}")
+
+    if args.save_baseline:
+        with open(baseline_path, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"基准已保存到 {baseline_path}")
+
+    if regressions:
+        print(f"{len(regressions)} 项性能回退: {', '.join(r['name'] for r in regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
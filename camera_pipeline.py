@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+import threading
+import numpy as np
+import pygame
+
+
+class LatestFrameBuffer:
+    """单槽最新帧缓冲：传感器线程只覆盖最新帧，取用时旧帧直接丢弃
+
+    传感器回调里只保存图像对象的引用，不做转换也不会阻塞，内存占用恒定。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._image = None
+        self.latest = None  # 最近收到的一帧，取走后仍保留（供记录画面，不复制）
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, image):
+        """传感器线程调用：覆盖未取走的旧帧"""
+        with self._lock:
+            if self._image is not None:
+                self.dropped += 1
+            self._image = image
+            self.latest = image
+            self.received += 1
+
+    def take(self):
+        """渲染线程调用：取出最新帧（没有新帧时返回None）"""
+        with self._lock:
+            image = self._image
+            self._image = None
+        return image
+
+    def clear(self):
+        """丢弃未取走的帧"""
+        with self._lock:
+            self._image = None
+            self.latest = None
+
+
+class CameraView:
+    """相机画面：BGRA原始数据直接写入预分配的pygame surface，每帧不分配新数组"""
+    def __init__(self, size, like=None):
+        self.size = size
+        if like is not None:
+            # 与显示surface同格式，blit时无需转换
+            self.surface = pygame.Surface(size, 0, like)
+        else:
+            self.surface = pygame.Surface(size, 0, 32)
+        self.buffer = LatestFrameBuffer()
+        self.frame = -1
+
+    def callback(self, image):
+        """传给sensor.listen()的回调"""
+        self.buffer.put(image)
+
+    def update(self):
+        """把最新帧写入surface，没有新帧时返回False"""
+        image = self.buffer.take()
+        if image is None:
+            return False
+        write_bgra_to_surface(image.raw_data, image.width, image.height, self.surface)
+        self.frame = image.frame
+        return True
+
+
+def write_bgra_to_surface(raw_data, width, height, surface):
+    """BGRA字节直接写入surface像素（pixels3d为(w, h, 3)视图，BGRA→RGB只做通道反向视图）"""
+    bgra = np.frombuffer(raw_data, dtype=np.uint8).reshape((height, width, 4))
+    pixels = pygame.surfarray.pixels3d(surface)
+    pixels[...] = bgra.transpose(1, 0, 2)[:, :, 2::-1]
+    del pixels  # 释放surface锁
@@ -1,38 +1,29 @@
 import carla
 import pygame
-import numpy as np
+import json
+import math
+import os
+import queue
+import sys
 import time
+import numpy as np
+from camera_pipeline import CameraView
+from map_cache import get_map_data
+from stepping import SteppingEngine
+from world_loader import acquire_world
 
-def main():
+
+def capture_single(world, map_data, timeout=30.0):
+    """在生成点中心上方500米拍一张全景图，timeout秒内没有收到图像则放弃"""
     pygame.init()
     
-    # 连接到CARLA
-    client = carla.Client('localhost', 2000)
-    client.set_timeout(20.0)
-    
-    # 加载Town03地图
-    world = client.load_world('Town03')
-    time.sleep(2.0)
-    
-    # 设置天气为晴天
-    weather = carla.WeatherParameters(
-        cloudiness=0.0,
-        precipitation=0.0,
-        sun_altitude_angle=90.0
-    )
-    world.set_weather(weather)
-    
     # 获取观察者
     spectator = world.get_spectator()
     
-    # 计算地图中心点和高度
-    spawn_points = world.get_map().get_spawn_points()
-    if len(spawn_points) > 0:
-        locations = [p.location for p in spawn_points]
-        x_coords = [l.x for l in locations]
-        y_coords = [l.y for l in locations]
-        center_x = (max(x_coords) + min(x_coords)) / 2
-        center_y = (max(y_coords) + min(y_coords)) / 2
+    # 计算地图中心点和高度（生成点从地图缓存读取）
+    spawn_xy = map_data.spawn_xy
+    if len(spawn_xy) > 0:
+        center_x, center_y = ((spawn_xy.max(axis=0) + spawn_xy.min(axis=0)) / 2).tolist()
         height = 500.0  # 调整高度以获得合适的视野
     else:
         center_x = 0
@@ -65,30 +56,168 @@ def main():
         display = pygame.display.set_mode((1280, 720))
         pygame.display.set_caption('Map Capture')
         
-        # 创建一个同步队列来存储图像
-        image_queue = []
-        
-        def camera_callback(image):
-            array = np.frombuffer(image.raw_data, dtype=np.dtype("uint8"))
-            array = np.reshape(array, (image.height, image.width, 4))
-            array = array[:, :, :3]
-            array = array[:, :, ::-1]
-            image_queue.append(array)
-        
-        camera.listen(camera_callback)
+        # 单槽最新帧缓冲，图像直接写入预分配的surface
+        view = CameraView((1280, 720), like=display)
+        camera.listen(view.callback)
         
         # 等待并保存图像
         print("Waiting for image...")
-        while len(image_queue) == 0:
+        deadline = time.time() + timeout
+        while not view.update():
+            if time.time() > deadline:
+                print(f"等待图像超时（{timeout:.0f} 秒），请检查服务器是否在运行")
+                return
             time.sleep(0.1)
         
-        image = image_queue[0]
-        pygame.image.save(pygame.surfarray.make_surface(image), "town03.jpg")
+        pygame.image.save(view.surface, "town03.jpg")
         print("Map image saved as town03.jpg")
         
     finally:
         camera.destroy()
         pygame.quit()
 
+
+def tile_grid(bounds, meters_per_pixel, image_size):
+    """按地图边界计算瓦片网格，返回(行数, 列数, 单块瓦片宽米数, 单块瓦片高米数)"""
+    min_x, min_y, max_x, max_y = bounds
+    tile_w = meters_per_pixel * image_size[0]
+    tile_h = meters_per_pixel * image_size[1]
+    cols = max(1, int(math.ceil((max_x - min_x) / tile_w)))
+    rows = max(1, int(math.ceil((max_y - min_y) / tile_h)))
+    return rows, cols, tile_w, tile_h
+
+
+def capture_tiles(world, bounds, output_dir, meters_per_pixel=0.25, fov=20.0, image_size=(1280, 720),
+                  ground_z=0.0, settle_ticks=2, queue_size=4, preview_size=4096):
+    """分块拍摄正射拼接图：同步模式下相机逐块移动，瓦片直接写入磁盘上的拼接数组
+    
+    相机朝下、yaw=-90，画面向右为+x、向下为+y；视场角较小、高度较高以接近正射投影。
+    拼接结果为 mosaic.npy（内存映射，(H, W, 3) RGB），内存占用只和单块瓦片相关；
+    georef.json 保存世界坐标到像素的仿射变换：col = (x - min_x) / m, row = (y - min_y) / m。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    width, height = image_size
+    rows, cols, tile_w, tile_h = tile_grid(bounds, meters_per_pixel, image_size)
+    min_x, min_y = bounds[0], bounds[1]
+    # 地面上画面宽度 = 2 * 高度 * tan(fov / 2)
+    altitude = meters_per_pixel * width / (2 * math.tan(math.radians(fov) / 2))
+    print(f"瓦片网格 {rows}x{cols}，相机高度 {altitude:.0f} 米，拼接图 {cols * width}x{rows * height}")
+    
+    mosaic_path = os.path.join(output_dir, 'mosaic.npy')
+    mosaic = np.lib.format.open_memmap(mosaic_path, mode='w+', dtype=np.uint8,
+                                       shape=(rows * height, cols * width, 3))
+    
+    # 有界队列：传感器线程写入，满了丢弃最旧的图像，主线程按帧号取
+    images = queue.Queue(maxsize=queue_size)
+    
+    def on_image(image):
+        while True:
+            try:
+                images.put_nowait(image)
+                return
+            except queue.Full:
+                try:
+                    images.get_nowait()
+                except queue.Empty:
+                    pass
+    
+    camera_bp = world.get_blueprint_library().find('sensor.camera.rgb')
+    camera_bp.set_attribute('image_size_x', str(width))
+    camera_bp.set_attribute('image_size_y', str(height))
+    camera_bp.set_attribute('fov', str(fov))
+    
+    def tile_transform(row, col):
+        return carla.Transform(
+            carla.Location(x=min_x + (col + 0.5) * tile_w, y=min_y + (row + 0.5) * tile_h,
+                           z=ground_z + altitude),
+            carla.Rotation(pitch=-90.0, yaw=-90.0, roll=0.0)
+        )
+    
+    stepping = SteppingEngine(world, fixed_delta_seconds=0.05, realtime=False)
+    camera = None
+    try:
+        stepping.enable()
+        camera = world.spawn_actor(camera_bp, tile_transform(0, 0))
+        camera.listen(on_image)
+        
+        start = time.time()
+        for row in range(rows):
+            for col in range(cols):
+                camera.set_transform(tile_transform(row, col))
+                # 移动后先推进几帧，让渲染跟上新位置
+                for _ in range(settle_ticks):
+                    stepping.tick()
+                frame = stepping.tick()
+                
+                image = images.get(timeout=10.0)
+                while image.frame < frame:
+                    image = images.get(timeout=10.0)
+                
+                # BGRA→RGB直接写入拼接数组对应区域
+                bgra = np.frombuffer(image.raw_data, dtype=np.uint8).reshape((height, width, 4))
+                mosaic[row * height:(row + 1) * height, col * width:(col + 1) * width] = bgra[:, :, 2::-1]
+            
+            mosaic.flush()  # 每行瓦片写完落盘
+            print(f"已完成 {row + 1}/{rows} 行，用时 {time.time() - start:.1f}s")
+    finally:
+        if camera is not None:
+            camera.stop()
+            camera.destroy()
+        stepping.restore()
+    
+    georef = {
+        'map_name': world.get_map().name,
+        'meters_per_pixel': meters_per_pixel,
+        'origin': [min_x, min_y],  # 像素(0, 0)左上角对应的世界坐标
+        'world_to_pixel': [
+            [1.0 / meters_per_pixel, 0.0, -min_x / meters_per_pixel],
+            [0.0, 1.0 / meters_per_pixel, -min_y / meters_per_pixel]
+        ],
+        'width': cols * width,
+        'height': rows * height,
+        'tile_size': [width, height],
+        'grid': [rows, cols],
+        'fov': fov,
+        'altitude': altitude
+    }
+    with open(os.path.join(output_dir, 'georef.json'), 'w') as f:
+        json.dump(georef, f, indent=4)
+    
+    save_preview(mosaic, os.path.join(output_dir, 'preview.jpg'), preview_size)
+    del mosaic
+    print(f"拼接图已保存到 {mosaic_path}")
+    return mosaic_path
+
+
+def save_preview(mosaic, path, max_size=4096):
+    """按步长抽样生成缩略图，只读取需要的像素"""
+    step = max(1, int(math.ceil(max(mosaic.shape[:2]) / max_size)))
+    preview = np.ascontiguousarray(mosaic[::step, ::step].transpose(1, 0, 2))
+    pygame.image.save(pygame.surfarray.make_surface(preview), path)
+
+
+def main():
+    # 连接到CARLA
+    client = carla.Client('localhost', 2000)
+    client.set_timeout(20.0)
+    
+    # 获取Town03地图（服务器已是该地图时直接复用，否则加载并等待第一帧）
+    world = acquire_world(client, 'Town03', client_timeout=20.0)
+    
+    # 设置天气为晴天
+    weather = carla.WeatherParameters(
+        cloudiness=0.0,
+        precipitation=0.0,
+        sun_altitude_angle=90.0
+    )
+    world.set_weather(weather)
+    
+    map_data = get_map_data(world)
+    if '--tiled' in sys.argv:
+        # 大地图分块拍摄拼接
+        capture_tiles(world, map_data.bounds.tolist(), f"{map_data.short_name.lower()}_tiles")
+    else:
+        capture_single(world, map_data)
+
 if __name__ == '__main__':
     main()
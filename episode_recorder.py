@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+
+import json
+import os
+import queue
+import threading
+import numpy as np
+
+RECORDING_VERSION = 2
+
+
+def flatten_columns(prefix, value, out):
+    """把嵌套字典展开为 prefix.key 形式的列"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flatten_columns(f"{prefix}.{key}", item, out)
+    else:
+        out[prefix] = value
+    return out
+
+
+class EpisodeRecorder:
+    """异步流式回合记录器：控制循环只把每步数据放进有界队列，后台线程按块写盘
+
+    每chunk_size步写一个压缩的列式分块（chunk_000000.npz，每列一个数组），
+    同时更新index.json记录分块和回合信息。队列满时直接丢弃该步并计数，控制循环不会被磁盘阻塞；
+    内存占用只和分块大小、队列长度相关，适合长时间运行。
+
+    相机画面单独排队：控制循环只传原始BGRA缓冲的引用，排队的画面总字节数不超过max_frame_bytes，
+    超出或写盘落后时先丢画面；写盘线程转换为RGB，每frame_shard_size帧写一个frames_000000.npz。
+    """
+    def __init__(self, output_dir, chunk_size=1000, max_queue_size=2000, compress=True,
+                 max_frame_bytes=256 * 1024 * 1024, frame_shard_size=16):
+        self.output_dir = output_dir
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.max_frame_bytes = max_frame_bytes
+        self.frame_shard_size = frame_shard_size
+        self.frame_queue = queue.Queue()
+        self._frame_bytes = 0  # 排队中画面的字节数
+        self._frame_lock = threading.Lock()
+        self._thread = None
+
+        # 以下只在写盘线程中修改
+        self._columns = {}
+        self._keys = None
+        self._chunks = []
+        self._episodes = {}
+        self._total_steps = 0
+        self._episode_keys = {}  # 回合 -> 列集合，同一回合内列集合不允许变化
+        self._frames = []
+        self._frame_episodes = []
+        self._frame_sim_frames = []
+        self._frame_shards = []
+
+        # 统计信息
+        self.recorded = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.written = 0
+        self.frames_recorded = 0
+        self.frames_dropped = 0
+        self.frames_written = 0
+        self.last_error = None
+
+    def start(self):
+        """启动写盘线程"""
+        if self._thread is not None:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='episode-recorder', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=30.0):
+        """写完队列中剩余的数据和最后一个不完整分块后停止"""
+        if self._thread is None:
+            return
+        self.queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def record(self, episode, **columns):
+        """记录一步（不阻塞），字典类型的值展开为多列，队列满时丢弃并返回False"""
+        step = {}
+        for key, value in columns.items():
+            if value is not None:
+                flatten_columns(key, value, step)
+        try:
+            self.queue.put_nowait(('step', episode, step))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.recorded += 1
+        return True
+
+    def record_frame(self, episode, raw_data, width, height, sim_frame=-1):
+        """记录一帧BGRA画面（不阻塞，不复制），超出字节上限或写盘落后时丢弃并返回False"""
+        nbytes = width * height * 4
+        with self._frame_lock:
+            if (self._frame_bytes + nbytes > self.max_frame_bytes
+                    or self.queue.qsize() * 2 >= self.queue.maxsize > 0):
+                self.frames_dropped += 1
+                return False
+            self._frame_bytes += nbytes
+        self.frame_queue.put(('frame', episode, (raw_data, width, height, sim_frame)))
+        self.frames_recorded += 1
+        return True
+
+    def end_episode(self, episode):
+        """标记回合结束"""
+        try:
+            self.queue.put_nowait(('end', episode, None))
+        except queue.Full:
+            self.dropped += 1
+
+    def metrics(self):
+        """记录统计"""
+        return {
+            'queue_depth': self.queue.qsize(),
+            'recorded': self.recorded,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+            'written': self.written,
+            'chunks': len(self._chunks),
+            'frame_bytes': self._frame_bytes,
+            'frames_recorded': self.frames_recorded,
+            'frames_dropped': self.frames_dropped,
+            'frames_written': self.frames_written
+        }
+
+    def _append(self, episode, step):
+        """写盘线程：把一步追加到当前分块，列集合变化或分块写满时落盘
+
+        同一回合内列集合和第一步不同的步（例如缺少观察）直接丢弃并计入rejected，不会新开分块。
+        """
+        keys = tuple(sorted(step))
+        expected = self._episode_keys.setdefault(episode, keys)
+        if keys != expected:
+            self.rejected += 1
+            missing = sorted(set(expected) - set(keys))
+            extra = sorted(set(keys) - set(expected))
+            print(f"回合 {episode} 的一步列集合与之前不一致（缺少 {missing}，多出 {extra}），已丢弃")
+            return
+        if self._keys is not None and keys != self._keys:
+            self._flush()
+        if self._keys is None:
+            self._keys = keys
+            self._columns = {key: [] for key in keys + ('episode', 'step')}
+
+        info = self._episodes.setdefault(episode, {
+            'length': 0, 'total_reward': 0.0, 'first_step': self._total_steps, 'complete': False
+        })
+        for key in keys:
+            self._columns[key].append(np.asarray(step[key]))
+        self._columns['episode'].append(episode)
+        self._columns['step'].append(info['length'])
+        info['length'] += 1
+        if 'reward' in step:
+            info['total_reward'] += float(step['reward'])
+        self._total_steps += 1
+
+        if len(self._columns['episode']) >= self.chunk_size:
+            self._flush()
+
+    @staticmethod
+    def _stack(values):
+        """一列数据合成数组，浮点统一存为float32"""
+        array = np.stack(values)
+        if np.issubdtype(array.dtype, np.floating):
+            array = array.astype(np.float32, copy=False)
+        return array
+
+    def _flush(self):
+        """把当前分块写成一个.npz文件并更新索引"""
+        if not self._columns or not self._columns['episode']:
+            self._keys = None
+            return
+        arrays = {key: self._stack(values) for key, values in self._columns.items()}
+        arrays['episode'] = arrays['episode'].astype(np.int32)
+        arrays['step'] = arrays['step'].astype(np.int32)
+        num_steps = len(arrays['episode'])
+
+        filename = f"chunk_{len(self._chunks):06d}.npz"
+        save = np.savez_compressed if self.compress else np.savez
+        save(os.path.join(self.output_dir, filename), **arrays)
+        self._chunks.append({
+            'file': filename,
+            'num_steps': num_steps,
+            'first_step': self._total_steps - num_steps,
+            'episodes': sorted(set(arrays['episode'].tolist())),
+            'keys': sorted(arrays)
+        })
+        self.written += num_steps
+        self._columns = {}
+        self._keys = None
+        self._write_index()
+
+    def _append_frame(self, episode, frame):
+        """写盘线程：BGRA转RGB后追加到当前画面分片，尺寸变化或分片写满时落盘"""
+        raw_data, width, height, sim_frame = frame
+        try:
+            if self._frames and self._frames[0].shape != (height, width, 3):
+                self._flush_frames()
+            bgra = np.frombuffer(raw_data, dtype=np.uint8).reshape((height, width, 4))
+            self._frames.append(bgra[:, :, 2::-1].copy())
+            self._frame_episodes.append(episode)
+            self._frame_sim_frames.append(sim_frame)
+        finally:
+            with self._frame_lock:
+                self._frame_bytes -= width * height * 4
+        if len(self._frames) >= self.frame_shard_size:
+            self._flush_frames()
+
+    def _drain_frames(self):
+        """写盘线程：处理已排队的画面"""
+        while True:
+            try:
+                _, episode, frame = self.frame_queue.get_nowait()
+            except queue.Empty:
+                return
+            self._append_frame(episode, frame)
+
+    def _flush_frames(self):
+        """把当前画面分片写成一个.npz文件并更新索引"""
+        if not self._frames:
+            return
+        filename = f"frames_{len(self._frame_shards):06d}.npz"
+        save = np.savez_compressed if self.compress else np.savez
+        save(os.path.join(self.output_dir, filename),
+             frames=np.stack(self._frames),
+             episode=np.asarray(self._frame_episodes, dtype=np.int32),
+             sim_frame=np.asarray(self._frame_sim_frames, dtype=np.int64))
+        self._frame_shards.append({
+            'file': filename,
+            'num_frames': len(self._frames),
+            'first_frame': self.frames_written,
+            'episodes': sorted(set(self._frame_episodes))
+        })
+        self.frames_written += len(self._frames)
+        self._frames = []
+        self._frame_episodes = []
+        self._frame_sim_frames = []
+        self._write_index()
+
+    def _write_index(self):
+        """先写临时文件再替换，读取方不会读到写了一半的索引"""
+        index = {
+            'version': RECORDING_VERSION,
+            'chunk_size': self.chunk_size,
+            'total_steps': self.written,
+            'chunks': self._chunks,
+            'frame_shards': self._frame_shards,
+            'episodes': {str(episode): info for episode, info in self._episodes.items()}
+        }
+        path = os.path.join(self.output_dir, 'index.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(index, f, indent=4)
+        os.replace(path + '.tmp', path)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            kind, episode, step = item
+            try:
+                if kind == 'step':
+                    self._append(episode, step)
+                elif episode in self._episodes:
+                    self._episodes[episode]['complete'] = True
+            except Exception as e:
+                self.last_error = e
+                print(f"记录数据时出错: {str(e)}")
+            try:
+                self._drain_frames()
+            except Exception as e:
+                self.last_error = e
+                print(f"记录画面时出错: {str(e)}")
+        try:
+            self._drain_frames()
+            self._flush_frames()
+            self._flush()
+            self._write_index()
+        except Exception as e:
+            self.last_error = e
+            print(f"写入记录时出错: {str(e)}")
+
+
+def load_index(recording_dir):
+    """读取记录目录的索引"""
+    with open(os.path.join(recording_dir, 'index.json'), 'r') as f:
+        return json.load(f)
+
+
+def load_chunk(recording_dir, chunk):
+    """读取一个分块，返回 列名 -> 数组 的字典"""
+    with np.load(os.path.join(recording_dir, chunk['file'])) as data:
+        return {key: data[key] for key in data.files}
+
+
+def load_frames(recording_dir, shard):
+    """读取一个画面分片，返回 frames(N, H, W, 3)、episode、sim_frame 的字典"""
+    with np.load(os.path.join(recording_dir, shard['file'])) as data:
+        return {key: data[key] for key in data.files}
@@ -0,0 +1,1309 @@
+#!/usr/bin/env python
+
+"""进程内的假CARLA后端，用于没有服务器时的性能分析和压力测试
+
+实现了本项目用到的carla API子集：网格状路网（路点、生成点、交通信号灯）、车辆/传感器actor、
+同步tick和异步模式下的后台推进、世界快照、批量命令和TrafficManager自动驾驶。每次“RPC”可以配置固定延迟和抖动，
+用来模拟客户端与服务器之间的往返开销。
+
+用法（在导入各工具之前替换carla模块）：
+
+    import fake_carla
+    fake_carla.install(latency=0.001, blocks=(8, 8))
+    from autonomous_scenario import AutonomousScenario
+"""
+
+import collections
+import enum
+import fnmatch
+import hashlib
+import itertools
+import math
+import random
+import socket
+import sys
+import threading
+import time
+import types
+import numpy as np
+
+# 运行参数，install()时更新
+CONFIG = {
+    'latency': 0.0,          # 每次RPC的固定延迟（秒）
+    'jitter': 0.0,           # 延迟的随机抖动上限（秒）
+    'map_latency': 0.0,      # world.get_map()额外延迟（真实服务器需要传输OpenDRIVE）
+    'load_latency': 0.0,     # load_world/reload_world额外延迟
+    'blocks': (6, 6),        # 网格路网的纵横道路数
+    'block_size': 100.0,     # 道路间距（米）
+    'lane_width': 3.5,
+    'render_cameras': True,  # 每帧是否为相机生成图像
+    'seed': 0,               # 世界id和延迟抖动的随机种子
+}
+
+# TrafficManager默认的自动驾驶目标速度（米/秒）
+DEFAULT_TARGET_SPEED = 8.0
+
+_servers = {}
+_actor_ids = itertools.count(1000)
+
+
+def install(**config):
+    """用本模块替换sys.modules中的carla，返回本模块"""
+    unknown = set(config).difference(CONFIG)
+    if unknown:
+        raise ValueError(f"未知配置项: {sorted(unknown)}")
+    CONFIG.update(config)
+    module = sys.modules[__name__]
+    sys.modules['carla'] = module
+    sys.modules['carla.command'] = command
+    return module
+
+
+def reset():
+    """停止并清空所有假服务器（测试之间调用）"""
+    for server in _servers.values():
+        server.stop()
+    _servers.clear()
+
+
+def get_server(port=2000):
+    """取得（必要时创建）端口对应的假服务器"""
+    if port not in _servers:
+        _servers[port] = FakeServer(port)
+    return _servers[port]
+
+
+def listen(port=2000, host='localhost'):
+    """在端口上打开一个只接受连接的TCP监听，让init_carla_server的端口探测通过；返回监听socket"""
+    server_socket = socket.create_server((host, port))
+
+    def accept():
+        while True:
+            try:
+                connection, _ = server_socket.accept()
+            except OSError:
+                return
+            connection.close()
+
+    threading.Thread(target=accept, name=f'fake-carla-{port}', daemon=True).start()
+    get_server(port)
+    return server_socket
+
+
+# ---------------------------------------------------------------- 基础类型
+
+class Vector3D:
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = float(x)
+        self.y = float(y)
+        self.z = float(z)
+
+    def __add__(self, other):
+        return type(self)(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return type(self)(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __mul__(self, k):
+        return type(self)(self.x * k, self.y * k, self.z * k)
+
+    def __eq__(self, other):
+        return (isinstance(other, Vector3D) and
+                (self.x, self.y, self.z) == (other.x, other.y, other.z))
+
+    def length(self):
+        return math.sqrt(self.x ** 2 + self.y ** 2 + self.z ** 2)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(x={self.x:.6f}, y={self.y:.6f}, z={self.z:.6f})"
+
+
+class Location(Vector3D):
+    def distance(self, other):
+        return (self - other).length()
+
+
+class Rotation:
+    def __init__(self, pitch=0.0, yaw=0.0, roll=0.0):
+        self.pitch = float(pitch)
+        self.yaw = float(yaw)
+        self.roll = float(roll)
+
+    def get_forward_vector(self):
+        pitch = math.radians(self.pitch)
+        yaw = math.radians(self.yaw)
+        return Vector3D(math.cos(pitch) * math.cos(yaw), math.cos(pitch) * math.sin(yaw), math.sin(pitch))
+
+    def get_right_vector(self):
+        yaw = math.radians(self.yaw + 90.0)
+        return Vector3D(math.cos(yaw), math.sin(yaw), 0.0)
+
+    def __repr__(self):
+        return f"Rotation(pitch={self.pitch:.6f}, yaw={self.yaw:.6f}, roll={self.roll:.6f})"
+
+
+class Transform:
+    def __init__(self, location=None, rotation=None):
+        self.location = location if location is not None else Location()
+        self.rotation = rotation if rotation is not None else Rotation()
+
+    def get_forward_vector(self):
+        return self.rotation.get_forward_vector()
+
+    def get_right_vector(self):
+        return self.rotation.get_right_vector()
+
+    def __repr__(self):
+        return f"Transform({self.location}, {self.rotation})"
+
+
+class VehicleControl:
+    def __init__(self, throttle=0.0, steer=0.0, brake=0.0, hand_brake=False, reverse=False,
+                 manual_gear_shift=False, gear=0):
+        self.throttle = throttle
+        self.steer = steer
+        self.brake = brake
+        self.hand_brake = hand_brake
+        self.reverse = reverse
+        self.manual_gear_shift = manual_gear_shift
+        self.gear = gear
+
+
+class WheelPhysicsControl:
+    def __init__(self, position):
+        self.position = position
+
+
+class VehiclePhysicsControl:
+    def __init__(self, wheels):
+        self.wheels = wheels
+
+
+class WeatherParameters:
+    def __init__(self, cloudiness=10.0, precipitation=0.0, precipitation_deposits=0.0, wind_intensity=5.0,
+                 sun_azimuth_angle=-1.0, sun_altitude_angle=45.0, fog_density=0.0, fog_distance=0.75,
+                 wetness=0.0, fog_falloff=0.1):
+        self.cloudiness = cloudiness
+        self.precipitation = precipitation
+        self.precipitation_deposits = precipitation_deposits
+        self.wind_intensity = wind_intensity
+        self.sun_azimuth_angle = sun_azimuth_angle
+        self.sun_altitude_angle = sun_altitude_angle
+        self.fog_density = fog_density
+        self.fog_distance = fog_distance
+        self.wetness = wetness
+        self.fog_falloff = fog_falloff
+
+
+class LaneChange(enum.IntEnum):
+    NONE = 0
+    Right = 1
+    Left = 2
+    Both = 3
+
+
+class LaneType(enum.IntEnum):
+    NONE = 1
+    Driving = 2
+    Shoulder = 1024
+    Any = -2
+
+
+class MapLayer(enum.IntFlag):
+    NONE = 0
+    Buildings = 1
+    Decals = 2
+    Foliage = 4
+    Ground = 8
+    ParkedVehicles = 16
+    Particles = 32
+    Props = 64
+    StreetLights = 128
+    Walls = 256
+    All = 65535
+
+
+class TrafficLightState(enum.IntEnum):
+    Red = 0
+    Yellow = 1
+    Green = 2
+    Off = 3
+    Unknown = 4
+
+
+class WorldSettings:
+    def __init__(self, synchronous_mode=False, fixed_delta_seconds=None, no_rendering_mode=False):
+        self.synchronous_mode = synchronous_mode
+        self.fixed_delta_seconds = fixed_delta_seconds
+        self.no_rendering_mode = no_rendering_mode
+
+
+class Timestamp:
+    def __init__(self, frame, elapsed_seconds, delta_seconds):
+        self.frame = frame
+        self.elapsed_seconds = elapsed_seconds
+        self.delta_seconds = delta_seconds
+        self.platform_timestamp = time.time()
+
+
+# ---------------------------------------------------------------- 蓝图
+
+class ActorAttribute:
+    def __init__(self, id, value, recommended_values=()):
+        self.id = id
+        self.value = str(value)
+        self.recommended_values = list(recommended_values)
+
+    def as_str(self):
+        return self.value
+
+    def as_int(self):
+        return int(self.value)
+
+    def as_float(self):
+        return float(self.value)
+
+    def __int__(self):
+        return self.as_int()
+
+    def __float__(self):
+        return self.as_float()
+
+    def __str__(self):
+        return self.value
+
+
+class ActorBlueprint:
+    def __init__(self, id, attributes):
+        self.id = id
+        self._attributes = {key: ActorAttribute(key, *value) for key, value in attributes.items()}
+
+    def copy(self):
+        blueprint = ActorBlueprint(self.id, {})
+        blueprint._attributes = {
+            key: ActorAttribute(key, attr.value, attr.recommended_values) for key, attr in self._attributes.items()
+        }
+        return blueprint
+
+    def has_attribute(self, key):
+        return key in self._attributes
+
+    def get_attribute(self, key):
+        return self._attributes[key]
+
+    def set_attribute(self, key, value):
+        if key not in self._attributes:
+            self._attributes[key] = ActorAttribute(key, value)
+        else:
+            self._attributes[key].value = str(value)
+
+    def __iter__(self):
+        return iter(self._attributes.values())
+
+
+_COLORS = ['255,255,255', '0,0,0', '200,30,30', '30,60,200']
+_BLUEPRINTS = [
+    ('vehicle.tesla.model3', {'number_of_wheels': ('4',), 'color': ('255,255,255', _COLORS), 'role_name': ('autopilot',)}),
+    ('vehicle.audi.a2', {'number_of_wheels': ('4',), 'color': ('200,30,30', _COLORS), 'role_name': ('autopilot',)}),
+    ('vehicle.lincoln.mkz_2020', {'number_of_wheels': ('4',), 'color': ('0,0,0', _COLORS), 'role_name': ('autopilot',)}),
+    ('vehicle.nissan.patrol', {'number_of_wheels': ('4',), 'role_name': ('autopilot',)}),
+    ('vehicle.bh.crossbike', {'number_of_wheels': ('2',), 'role_name': ('autopilot',)}),
+    ('sensor.camera.rgb', {'image_size_x': ('800',), 'image_size_y': ('600',), 'fov': ('90',), 'role_name': ('front',)}),
+    ('sensor.other.collision', {'role_name': ('front',)}),
+]
+
+
+class BlueprintLibrary:
+    def __init__(self, blueprints):
+        self._blueprints = blueprints
+
+    def find(self, id):
+        for blueprint in self._blueprints:
+            if blueprint.id == id:
+                return blueprint.copy()
+        raise IndexError(f"blueprint '{id}' not found")
+
+    def filter(self, pattern):
+        return BlueprintLibrary([bp.copy() for bp in self._blueprints if fnmatch.fnmatch(bp.id, pattern)])
+
+    def __iter__(self):
+        return iter(self._blueprints)
+
+    def __getitem__(self, index):
+        return self._blueprints[index]
+
+    def __len__(self):
+        return len(self._blueprints)
+
+
+# ---------------------------------------------------------------- 网格路网
+
+class FakeMap:
+    """网格路网：纵横各若干条双向两车道直路，交叉口为路口
+
+    车道用起点、方向和长度表示，路点投影和前进全部是解析计算。
+    """
+    def __init__(self, name, blocks=None, block_size=None, lane_width=None):
+        self.name = name
+        blocks = blocks if blocks is not None else CONFIG['blocks']
+        self.block_size = block_size if block_size is not None else CONFIG['block_size']
+        self.lane_width = lane_width if lane_width is not None else CONFIG['lane_width']
+        nx, ny = blocks
+        size = self.block_size
+        self.road_x = (np.arange(nx) - (nx - 1) / 2) * size  # 纵向道路的x坐标
+        self.road_y = (np.arange(ny) - (ny - 1) / 2) * size  # 横向道路的y坐标
+        min_x, max_x = self.road_x[0] - size / 2, self.road_x[-1] + size / 2
+        min_y, max_y = self.road_y[0] - size / 2, self.road_y[-1] + size / 2
+        half = self.lane_width / 2
+
+        # 车道：(road_id, lane_id, 起点x, 起点y, 方向x, 方向y, 长度)
+        # CARLA左手坐标系中朝向的右侧为负lane_id车道
+        lanes = []
+        for j, y in enumerate(self.road_y):
+            lanes.append((j, -1, min_x, y + half, 1.0, 0.0, max_x - min_x))
+            lanes.append((j, 1, max_x, y - half, -1.0, 0.0, max_x - min_x))
+        for i, x in enumerate(self.road_x):
+            lanes.append((1000 + i, -1, x - half, min_y, 0.0, 1.0, max_y - min_y))
+            lanes.append((1000 + i, 1, x + half, max_y, 0.0, -1.0, max_y - min_y))
+        lanes = np.array(lanes, dtype=np.float64)
+        self.lane_road = lanes[:, 0].astype(np.int64)
+        self.lane_id = lanes[:, 1].astype(np.int64)
+        self.lane_start = lanes[:, 2:4]
+        self.lane_dir = lanes[:, 4:6]
+        self.lane_length = lanes[:, 6]
+        self.bounds = (min_x, min_y, max_x, max_y)
+
+    def _opposite_lane(self, lane):
+        """同一条路的对向车道"""
+        return lane + 1 if lane % 2 == 0 else lane - 1
+
+    def _project(self, x, y):
+        """投影到最近车道，返回(车道下标, s)"""
+        offset = np.array([x, y]) - self.lane_start
+        s = np.clip(np.einsum('ij,ij->i', offset, self.lane_dir), 0.0, self.lane_length)
+        closest = self.lane_start + self.lane_dir * s[:, None]
+        distance = np.hypot(closest[:, 0] - x, closest[:, 1] - y)
+        lane = int(np.argmin(distance))
+        return lane, float(s[lane])
+
+    def _in_junction(self, lane, s):
+        """车道上该位置是否位于交叉口"""
+        x, y = self.lane_start[lane] + self.lane_dir[lane] * s
+        crossing = self.road_x if self.lane_dir[lane][0] != 0 else self.road_y
+        coordinate = x if self.lane_dir[lane][0] != 0 else y
+        return bool(np.min(np.abs(crossing - coordinate)) < self.lane_width)
+
+    def get_waypoint(self, location, project_to_road=True, lane_type=LaneType.Driving):
+        lane, s = self._project(location.x, location.y)
+        return Waypoint(self, lane, s)
+
+    def generate_waypoints(self, distance):
+        waypoints = []
+        for lane in range(len(self.lane_length)):
+            for s in np.arange(0.0, self.lane_length[lane], distance):
+                waypoints.append(Waypoint(self, lane, float(s)))
+        return waypoints
+
+    def get_spawn_points(self):
+        """每段路中点（两个路口之间）各一个生成点"""
+        spawn_points = []
+        for lane in range(len(self.lane_length)):
+            for s in np.arange(self.block_size / 2 + self.block_size / 2, self.lane_length[lane], self.block_size):
+                waypoint = Waypoint(self, lane, float(s))
+                transform = waypoint.transform
+                transform.location.z = 0.5
+                spawn_points.append(transform)
+        return spawn_points
+
+    def traffic_light_transforms(self):
+        """每个交叉口一个信号灯，放在路口一角"""
+        offset = self.lane_width * 1.5
+        return [
+            Transform(Location(x + offset, y + offset, 0.0), Rotation(yaw=0.0))
+            for x in self.road_x for y in self.road_y
+        ]
+
+    def to_opendrive(self):
+        nx, ny = len(self.road_x), len(self.road_y)
+        return (f'<?xml version="1.0"?><OpenDRIVE><header name="{self.name}" generator="fake_carla"/>'
+                f'<!-- grid {nx}x{ny} block={self.block_size} lane_width={self.lane_width} --></OpenDRIVE>')
+
+    def get_topology(self):
+        return [(Waypoint(self, lane, 0.0), Waypoint(self, lane, float(self.lane_length[lane])))
+                for lane in range(len(self.lane_length))]
+
+
+class Waypoint:
+    def __init__(self, carla_map, lane, s):
+        self._map = carla_map
+        self._lane = lane
+        self.s = s
+        self.road_id = int(carla_map.lane_road[lane])
+        self.section_id = 0
+        self.lane_id = int(carla_map.lane_id[lane])
+        self.lane_width = carla_map.lane_width
+        self.lane_type = LaneType.Driving
+        self.lane_change = LaneChange.NONE
+        self.is_junction = carla_map._in_junction(lane, s)
+        self.is_intersection = self.is_junction
+        self.id = int(hashlib.md5(f"{lane}:{s:.2f}".encode()).hexdigest()[:15], 16)
+        self._transform = None
+
+    @property
+    def transform(self):
+        if self._transform is None:
+            x, y = self._map.lane_start[self._lane] + self._map.lane_dir[self._lane] * self.s
+            dx, dy = self._map.lane_dir[self._lane]
+            self._transform = Transform(Location(x, y, 0.0), Rotation(yaw=math.degrees(math.atan2(dy, dx))))
+        return Transform(Location(self._transform.location.x, self._transform.location.y, 0.0),
+                         Rotation(yaw=self._transform.rotation.yaw))
+
+    def next(self, distance):
+        s = self.s + distance
+        if s > self._map.lane_length[self._lane]:
+            return []  # 道路尽头
+        return [Waypoint(self._map, self._lane, s)]
+
+    def previous(self, distance):
+        s = self.s - distance
+        if s < 0:
+            return []
+        return [Waypoint(self._map, self._lane, s)]
+
+    def get_left_lane(self):
+        """左侧为对向车道（s按对向行驶方向换算）"""
+        lane = self._map._opposite_lane(self._lane)
+        return Waypoint(self._map, lane, float(self._map.lane_length[lane] - self.s))
+
+    def get_right_lane(self):
+        return None
+
+
+# ---------------------------------------------------------------- actor
+
+class ActorList(list):
+    def filter(self, pattern):
+        return ActorList(actor for actor in self if fnmatch.fnmatch(actor.type_id, pattern))
+
+    def find(self, actor_id):
+        for actor in self:
+            if actor.id == actor_id:
+                return actor
+        return None
+
+
+class Actor:
+    def __init__(self, server, type_id, transform, attributes=None, parent=None):
+        self._server = server
+        self.id = next(_actor_ids)
+        self.type_id = type_id
+        self.attributes = dict(attributes or {})
+        self.parent = parent
+        self.is_alive = True
+        self._transform = Transform(
+            Location(transform.location.x, transform.location.y, transform.location.z),
+            Rotation(transform.rotation.pitch, transform.rotation.yaw, transform.rotation.roll)
+        )
+
+    def _local_transform(self):
+        return self._transform
+
+    def get_transform(self):
+        self._server.rpc('actor.get_transform')
+        return self._local_transform()
+
+    def get_location(self):
+        self._server.rpc('actor.get_location')
+        return self._local_transform().location
+
+    def get_velocity(self):
+        self._server.rpc('actor.get_velocity')
+        return Vector3D()
+
+    def get_acceleration(self):
+        self._server.rpc('actor.get_acceleration')
+        return Vector3D()
+
+    def get_angular_velocity(self):
+        self._server.rpc('actor.get_angular_velocity')
+        return Vector3D()
+
+    def set_transform(self, transform):
+        self._server.rpc('actor.set_transform')
+        self._set_transform(transform)
+
+    def _set_transform(self, transform):
+        self._transform = transform
+
+    def destroy(self):
+        self._server.rpc('actor.destroy')
+        return self._server.world._destroy(self.id)
+
+    def _snapshot(self):
+        zero = Vector3D()
+        return ActorSnapshot(self.id, self._local_transform(), zero, zero, zero)
+
+
+class Vehicle(Actor):
+    """车辆状态存放在世界的向量化数组中，对象只保存槽位"""
+    def __init__(self, server, type_id, transform, attributes=None):
+        super().__init__(server, type_id, transform, attributes)
+        self._slot = server.world._vehicles.add(self.id, transform)
+        self._control = VehicleControl()
+
+    def _local_transform(self):
+        return self._server.world._vehicles.transform(self._slot)
+
+    def _set_transform(self, transform):
+        with self._server.world._lock:
+            self._server.world._vehicles.set_transform(self._slot, transform)
+
+    def get_velocity(self):
+        self._server.rpc('vehicle.get_velocity')
+        return self._server.world._vehicles.vector('velocity', self._slot)
+
+    def get_acceleration(self):
+        self._server.rpc('vehicle.get_acceleration')
+        return self._server.world._vehicles.vector('acceleration', self._slot)
+
+    def get_angular_velocity(self):
+        self._server.rpc('vehicle.get_angular_velocity')
+        return self._server.world._vehicles.vector('angular_velocity', self._slot)
+
+    def get_control(self):
+        self._server.rpc('vehicle.get_control')
+        return self._control
+
+    def apply_control(self, control):
+        self._server.rpc('vehicle.apply_control')
+        self._apply_control(control)
+
+    def _apply_control(self, control):
+        self._control = control
+        with self._server.world._lock:
+            self._server.world._vehicles.set_control(self._slot, control)
+
+    def get_physics_control(self):
+        self._server.rpc('vehicle.get_physics_control')
+        return VehiclePhysicsControl([
+            WheelPhysicsControl(Vector3D(x, y, 30.0)) for x in (140.0, -140.0) for y in (-80.0, 80.0)
+        ])
+
+    def set_autopilot(self, enabled=True, tm_port=8000):
+        self._server.rpc('vehicle.set_autopilot')
+        traffic_manager = self._server.traffic_manager(tm_port)
+        with self._server.world._lock:
+            self._server.world._vehicles.set_autopilot(self._slot, enabled, tm_port, traffic_manager._target_speed)
+
+    def set_target_velocity(self, velocity):
+        self._server.rpc('vehicle.set_target_velocity')
+        with self._server.world._lock:
+            self._server.world._vehicles.set_velocity(self._slot, velocity)
+
+    def set_target_angular_velocity(self, velocity):
+        self._server.rpc('vehicle.set_target_angular_velocity')
+
+    def _snapshot(self):
+        vehicles = self._server.world._vehicles
+        return ActorSnapshot(
+            self.id, vehicles.transform(self._slot), vehicles.vector('velocity', self._slot),
+            vehicles.vector('acceleration', self._slot), vehicles.vector('angular_velocity', self._slot)
+        )
+
+
+class Sensor(Actor):
+    def __init__(self, server, type_id, transform, attributes=None, parent=None):
+        super().__init__(server, type_id, transform, attributes, parent)
+        self._callback = None
+        self.is_listening = False
+
+    def _local_transform(self):
+        if self.parent is not None and self.parent.is_alive:
+            return self.parent._local_transform()
+        return self._transform
+
+    def listen(self, callback):
+        self._server.rpc('sensor.listen')
+        self._callback = callback
+        self.is_listening = True
+
+    def stop(self):
+        self._server.rpc('sensor.stop')
+        self._callback = None
+        self.is_listening = False
+
+    def _emit(self, data):
+        if self._callback is not None:
+            self._callback(data)
+
+
+class Image:
+    def __init__(self, frame, timestamp, width, height, raw_data, fov, transform):
+        self.frame = frame
+        self.timestamp = timestamp
+        self.width = width
+        self.height = height
+        self.raw_data = raw_data
+        self.fov = fov
+        self.transform = transform
+
+
+class CollisionEvent:
+    def __init__(self, frame, timestamp, actor, other_actor, normal_impulse):
+        self.frame = frame
+        self.timestamp = timestamp
+        self.actor = actor
+        self.other_actor = other_actor
+        self.normal_impulse = normal_impulse
+
+
+class TrafficLight(Actor):
+    def __init__(self, server, transform, phase_offset):
+        super().__init__(server, 'traffic.traffic_light', transform)
+        self.phase_offset = phase_offset
+
+    def get_state(self):
+        """按仿真时间循环：绿10秒、黄3秒、红7秒"""
+        self._server.rpc('traffic_light.get_state')
+        t = (self._server.world._elapsed + self.phase_offset) % 20.0
+        if t < 10.0:
+            return TrafficLightState.Green
+        if t < 13.0:
+            return TrafficLightState.Yellow
+        return TrafficLightState.Red
+
+
+class ActorSnapshot:
+    def __init__(self, id, transform, velocity, acceleration, angular_velocity):
+        self.id = id
+        self._transform = transform
+        self._velocity = velocity
+        self._acceleration = acceleration
+        self._angular_velocity = angular_velocity
+
+    def get_transform(self):
+        return self._transform
+
+    def get_velocity(self):
+        return self._velocity
+
+    def get_acceleration(self):
+        return self._acceleration
+
+    def get_angular_velocity(self):
+        return self._angular_velocity
+
+
+class WorldSnapshot:
+    def __init__(self, world_id, timestamp, actor_snapshots):
+        self.id = world_id
+        self.frame = timestamp.frame
+        self.timestamp = timestamp
+        self._actors = collections.OrderedDict((snapshot.id, snapshot) for snapshot in actor_snapshots)
+
+    def __iter__(self):
+        return iter(self._actors.values())
+
+    def __len__(self):
+        return len(self._actors)
+
+    def find(self, actor_id):
+        return self._actors.get(actor_id)
+
+    def has_actor(self, actor_id):
+        return actor_id in self._actors
+
+
+# ---------------------------------------------------------------- 车辆动力学（向量化）
+
+class VehiclePool:
+    """所有车辆的状态数组：位置、朝向、速度、控制量和自动驾驶所在车道，每帧整体更新"""
+    def __init__(self, carla_map, capacity=64):
+        self.map = carla_map
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=np.bool_)
+        self.position = np.zeros((capacity, 3))
+        self.yaw = np.zeros(capacity)
+        self.speed = np.zeros(capacity)
+        self.velocity = np.zeros((capacity, 3))
+        self.acceleration = np.zeros((capacity, 3))
+        self.angular_velocity = np.zeros((capacity, 3))
+        self.control = np.zeros((capacity, 3))  # throttle, steer, brake
+        self.autopilot = np.zeros(capacity, dtype=np.bool_)
+        self.lane = np.zeros(capacity, dtype=np.int64)
+        self.lane_s = np.zeros(capacity)
+        # 自动驾驶车辆所属的TrafficManager端口和目标速度
+        self.tm_port = np.zeros(capacity, dtype=np.int64)
+        self.target_speed = np.zeros(capacity)
+        self._free = list(range(capacity - 1, -1, -1))
+
+    def _grow(self):
+        capacity = len(self.ids)
+        for name in ('ids', 'alive', 'position', 'yaw', 'speed', 'velocity', 'acceleration',
+                     'angular_velocity', 'control', 'autopilot', 'lane', 'lane_s', 'tm_port', 'target_speed'):
+            array = getattr(self, name)
+            grown = np.zeros((capacity * 2,) + array.shape[1:], dtype=array.dtype)
+            grown[:capacity] = array
+            setattr(self, name, grown)
+        self._free = list(range(capacity * 2 - 1, capacity - 1, -1))
+
+    def add(self, actor_id, transform):
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        self.ids[slot] = actor_id
+        self.alive[slot] = True
+        self.speed[slot] = 0.0
+        self.velocity[slot] = 0.0
+        self.acceleration[slot] = 0.0
+        self.angular_velocity[slot] = 0.0
+        self.control[slot] = 0.0
+        self.autopilot[slot] = False
+        self.set_transform(slot, transform)
+        return slot
+
+    def remove(self, slot):
+        self.alive[slot] = False
+        self.autopilot[slot] = False
+        self._free.append(slot)
+
+    def set_transform(self, slot, transform):
+        location = transform.location
+        self.position[slot] = (location.x, location.y, location.z)
+        self.yaw[slot] = transform.rotation.yaw
+        if self.autopilot[slot]:
+            self._snap_to_lane(slot)
+
+    def set_velocity(self, slot, velocity):
+        self.velocity[slot] = (velocity.x, velocity.y, velocity.z)
+        self.speed[slot] = math.hypot(velocity.x, velocity.y)
+
+    def set_control(self, slot, control):
+        self.control[slot] = (control.throttle, control.steer, control.brake)
+
+    def set_autopilot(self, slot, enabled, tm_port=8000, target_speed=DEFAULT_TARGET_SPEED):
+        self.autopilot[slot] = enabled
+        if enabled:
+            self.tm_port[slot] = tm_port
+            self.target_speed[slot] = target_speed
+            self._snap_to_lane(slot)
+
+    def set_target_speed(self, tm_port, target_speed):
+        """更新某个TrafficManager下所有自动驾驶车辆的目标速度"""
+        self.target_speed[self.autopilot & (self.tm_port == tm_port)] = target_speed
+
+    def _snap_to_lane(self, slot):
+        lane, s = self.map._project(self.position[slot, 0], self.position[slot, 1])
+        self.lane[slot] = lane
+        self.lane_s[slot] = s
+
+    def transform(self, slot):
+        x, y, z = self.position[slot]
+        return Transform(Location(x, y, z), Rotation(yaw=self.yaw[slot]))
+
+    def vector(self, name, slot):
+        x, y, z = getattr(self, name)[slot]
+        return Vector3D(x, y, z)
+
+    def step(self, dt):
+        """推进dt秒：自动驾驶车辆沿车道匀速行驶（到头回到车道起点），其他车辆按简单运动学模型"""
+        alive = self.alive
+        old_velocity = self.velocity.copy()
+        old_yaw = self.yaw.copy()
+
+        auto = alive & self.autopilot
+        if auto.any():
+            lanes = self.lane[auto]
+            length = self.map.lane_length[lanes]
+            target_speed = self.target_speed[auto]
+            s = (self.lane_s[auto] + target_speed * dt) % length
+            self.lane_s[auto] = s
+            direction = self.map.lane_dir[lanes]
+            self.position[auto, :2] = self.map.lane_start[lanes] + direction * s[:, None]
+            self.yaw[auto] = np.degrees(np.arctan2(direction[:, 1], direction[:, 0]))
+            self.speed[auto] = target_speed
+
+        manual = alive & ~self.autopilot
+        if manual.any():
+            throttle, steer, brake = self.control[manual].T
+            speed = self.speed[manual]
+            speed = np.maximum(0.0, speed + (4.0 * throttle - 8.0 * brake - 0.05 * speed) * dt)
+            # 自行车模型：轴距2.8米，最大转角40度
+            yaw_rate = np.degrees(speed * np.tan(np.radians(40.0) * steer) / 2.8)
+            self.yaw[manual] = (self.yaw[manual] + yaw_rate * dt + 180.0) % 360.0 - 180.0
+            self.speed[manual] = speed
+            heading = np.radians(self.yaw[manual])
+            self.position[manual, 0] += speed * np.cos(heading) * dt
+            self.position[manual, 1] += speed * np.sin(heading) * dt
+
+        heading = np.radians(self.yaw)
+        self.velocity[:, 0] = self.speed * np.cos(heading)
+        self.velocity[:, 1] = self.speed * np.sin(heading)
+        self.velocity[:, 2] = 0.0
+        self.velocity[~alive] = 0.0
+        if dt > 0:
+            self.acceleration[:] = (self.velocity - old_velocity) / dt
+            yaw_delta = (self.yaw - old_yaw + 180.0) % 360.0 - 180.0
+            self.angular_velocity[:, 2] = yaw_delta / dt
+        self.acceleration[~alive] = 0.0
+        self.angular_velocity[~alive] = 0.0
+
+    def touching(self, slot, radius=2.0):
+        """与该车距离小于radius的其他车辆id（只对挂了碰撞传感器的车辆计算）"""
+        offsets = self.position[:, :2] - self.position[slot, :2]
+        close = self.alive & (np.einsum('ij,ij->i', offsets, offsets) < radius ** 2)
+        close[slot] = False
+        return self.ids[close].tolist()
+
+
+# ---------------------------------------------------------------- 世界和服务器
+
+class FakeWorld:
+    def __init__(self, server, map_name):
+        self._server = server
+        self.id = server.random.getrandbits(63)
+        self._map = FakeMap(map_name)
+        self._settings = WorldSettings()
+        self._weather = WeatherParameters()
+        self._frame = 0
+        self._elapsed = 0.0
+        self._actors = collections.OrderedDict()
+        self._vehicles = VehiclePool(self._map)
+        self._blueprints = BlueprintLibrary([ActorBlueprint(id, attributes) for id, attributes in _BLUEPRINTS])
+        self._camera_buffers = {}
+        # 后台推进线程和客户端调用共用的锁，帧号变化时通知wait_for_tick
+        self._lock = threading.RLock()
+        self._frame_changed = threading.Condition(self._lock)
+
+        self._spectator = Actor(server, 'spectator', Transform())
+        self._actors[self._spectator.id] = self._spectator
+        for i, transform in enumerate(self._map.traffic_light_transforms()):
+            light = TrafficLight(server, transform, phase_offset=(i * 7.0) % 20.0)
+            self._actors[light.id] = light
+
+    # RPC接口
+    def get_map(self):
+        self._server.rpc('world.get_map', extra=CONFIG['map_latency'])
+        return self._map
+
+    def get_settings(self):
+        self._server.rpc('world.get_settings')
+        return WorldSettings(self._settings.synchronous_mode, self._settings.fixed_delta_seconds,
+                             self._settings.no_rendering_mode)
+
+    def apply_settings(self, settings):
+        self._server.rpc('world.apply_settings')
+        self._settings = WorldSettings(settings.synchronous_mode, settings.fixed_delta_seconds,
+                                       settings.no_rendering_mode)
+        return self._frame
+
+    def get_blueprint_library(self):
+        self._server.rpc('world.get_blueprint_library')
+        return self._blueprints
+
+    def get_weather(self):
+        self._server.rpc('world.get_weather')
+        return self._weather
+
+    def set_weather(self, weather):
+        self._server.rpc('world.set_weather')
+        self._weather = weather
+
+    def get_spectator(self):
+        self._server.rpc('world.get_spectator')
+        return self._spectator
+
+    def get_actors(self, actor_ids=None):
+        self._server.rpc('world.get_actors')
+        if actor_ids is None:
+            return ActorList(self._actors.values())
+        return ActorList(self._actors[i] for i in actor_ids if i in self._actors)
+
+    def get_actor(self, actor_id):
+        self._server.rpc('world.get_actor')
+        return self._actors.get(actor_id)
+
+    def spawn_actor(self, blueprint, transform, attach_to=None):
+        self._server.rpc('world.spawn_actor')
+        return self._spawn(blueprint, transform, attach_to)
+
+    def try_spawn_actor(self, blueprint, transform, attach_to=None):
+        try:
+            return self.spawn_actor(blueprint, transform, attach_to)
+        except RuntimeError:
+            return None
+
+    def get_snapshot(self):
+        """真实客户端读取本地缓存的最新帧，不经过服务器，所以不计RPC"""
+        with self._lock:
+            return self._snapshot()
+
+    def tick(self, seconds=10.0):
+        self._server.rpc('world.tick')
+        with self._lock:
+            self._advance()
+            return self._frame
+
+    def wait_for_tick(self, seconds=10.0):
+        """等待下一帧（异步模式下由服务器的后台线程推进），超时抛出RuntimeError"""
+        self._server.rpc('world.wait_for_tick')
+        with self._frame_changed:
+            frame = self._frame
+            if not self._frame_changed.wait_for(lambda: self._frame != frame, seconds):
+                raise RuntimeError(f"time-out of {seconds}s while waiting for the simulator")
+            return self._snapshot()
+
+    # 内部实现
+    def _spawn(self, blueprint, transform, attach_to=None):
+        with self._lock:
+            return self._spawn_locked(blueprint, transform, attach_to)
+
+    def _spawn_locked(self, blueprint, transform, attach_to):
+        attributes = {attr.id: attr.value for attr in blueprint}
+        if blueprint.id.startswith('vehicle.'):
+            location = transform.location
+            vehicles = self._vehicles
+            alive = np.flatnonzero(vehicles.alive)
+            if len(alive):
+                distance = np.hypot(vehicles.position[alive, 0] - location.x, vehicles.position[alive, 1] - location.y)
+                if distance.min() < 2.0:
+                    raise RuntimeError("Spawn failed because of collision at spawn position")
+            actor = Vehicle(self._server, blueprint.id, transform, attributes)
+        elif blueprint.id.startswith('sensor.'):
+            actor = Sensor(self._server, blueprint.id, transform, attributes, parent=attach_to)
+        else:
+            actor = Actor(self._server, blueprint.id, transform, attributes, parent=attach_to)
+        self._actors[actor.id] = actor
+        return actor
+
+    def _destroy(self, actor_id):
+        with self._lock:
+            return self._destroy_locked(actor_id)
+
+    def _destroy_locked(self, actor_id):
+        actor = self._actors.pop(actor_id, None)
+        if actor is None:
+            return False
+        actor.is_alive = False
+        if isinstance(actor, Vehicle):
+            self._vehicles.remove(actor._slot)
+        if isinstance(actor, Sensor):
+            actor._callback = None
+        return True
+
+    def _timestamp(self):
+        delta = self._settings.fixed_delta_seconds or 0.05
+        return Timestamp(self._frame, self._elapsed, delta)
+
+    def _snapshot(self):
+        return WorldSnapshot(self.id, self._timestamp(),
+                             [actor._snapshot() for actor in self._actors.values()])
+
+    def _advance(self):
+        """推进一帧：车辆运动、碰撞检测、传感器数据（调用方持有self._lock）"""
+        dt = self._settings.fixed_delta_seconds or 0.05
+        self._frame += 1
+        self._elapsed += dt
+        self._vehicles.step(dt)
+        timestamp = self._elapsed
+        self._frame_changed.notify_all()
+
+        sensors = [actor for actor in self._actors.values() if isinstance(actor, Sensor) and actor._callback]
+        if not sensors:
+            return
+
+        for sensor in sensors:
+            if sensor.type_id == 'sensor.other.collision':
+                # 碰撞：只检测挂了碰撞传感器的车辆
+                parent = sensor.parent
+                if not isinstance(parent, Vehicle) or not parent.is_alive:
+                    continue
+                for other_id in self._vehicles.touching(parent._slot):
+                    sensor._emit(CollisionEvent(self._frame, timestamp, parent, self._actors.get(other_id),
+                                                Vector3D(1000.0, 0.0, 0.0)))
+            elif sensor.type_id.startswith('sensor.camera') and CONFIG['render_cameras'] \
+                    and not self._settings.no_rendering_mode:
+                width = int(sensor.attributes.get('image_size_x', 800))
+                height = int(sensor.attributes.get('image_size_y', 600))
+                raw = self._camera_buffers.get((width, height))
+                if raw is None:
+                    raw = bytes(width * height * 4)
+                    self._camera_buffers[(width, height)] = raw
+                sensor._emit(Image(self._frame, timestamp, width, height, raw,
+                                   float(sensor.attributes.get('fov', 90)), sensor._local_transform()))
+
+
+class FakeServer:
+    """一个端口上的假服务器：持有当前世界和RPC统计"""
+    def __init__(self, port):
+        self.port = port
+        self.rpc_counts = collections.Counter()
+        self.random = random.Random(CONFIG['seed'] + port)
+        self.world = FakeWorld(self, 'Carla/Maps/Town03')
+        # 端口 -> TrafficManager，同一端口的客户端共用一个
+        self.traffic_managers = {}
+        # 真实服务器在异步模式下自己推进，这里用后台线程按固定步长模拟
+        self._stop_event = threading.Event()
+        self._ticker = threading.Thread(target=self._run_async_ticks, name=f'fake-carla-ticker-{port}', daemon=True)
+        self._ticker.start()
+
+    def _run_async_ticks(self):
+        """异步模式下按fixed_delta_seconds（默认0.05秒）的真实时间间隔推进当前世界"""
+        while True:
+            world = self.world
+            if self._stop_event.wait(world._settings.fixed_delta_seconds or 0.05):
+                return
+            with world._lock:
+                if not world._settings.synchronous_mode:
+                    world._advance()
+
+    def stop(self):
+        """停止后台推进线程"""
+        self._stop_event.set()
+
+    def rpc(self, name, extra=0.0):
+        """记录一次RPC并模拟往返延迟"""
+        self.rpc_counts[name] += 1
+        delay = CONFIG['latency'] + extra
+        if CONFIG['jitter']:
+            delay += self.random.uniform(0.0, CONFIG['jitter'])
+        if delay > 0:
+            time.sleep(delay)
+
+    def traffic_manager(self, port):
+        """获取端口上的TrafficManager，不存在时创建（与真实客户端在set_autopilot时按需启动一致）"""
+        if port not in self.traffic_managers:
+            self.traffic_managers[port] = TrafficManager(self, port)
+        return self.traffic_managers[port]
+
+    def load_world(self, map_name):
+        if not map_name.startswith('Carla/Maps/') and '/' not in map_name:
+            map_name = f"Carla/Maps/{map_name}"
+        settings = self.world._settings
+        self.world = FakeWorld(self, map_name)
+        return settings
+
+
+class TrafficManager:
+    def __init__(self, server, port):
+        self._server = server
+        self._port = port
+        self._target_speed = DEFAULT_TARGET_SPEED
+
+    def get_port(self):
+        return self._port
+
+    def set_synchronous_mode(self, enabled=True):
+        self._server.rpc('tm.set_synchronous_mode')
+
+    def set_global_distance_to_leading_vehicle(self, distance):
+        self._server.rpc('tm.set_global_distance_to_leading_vehicle')
+
+    def global_percentage_speed_difference(self, percentage):
+        """负数表示比限速更快"""
+        self._server.rpc('tm.global_percentage_speed_difference')
+        self._target_speed = DEFAULT_TARGET_SPEED * (1.0 - percentage / 100.0)
+        with self._server.world._lock:
+            self._server.world._vehicles.set_target_speed(self._port, self._target_speed)
+
+    def set_random_device_seed(self, seed):
+        self._server.rpc('tm.set_random_device_seed')
+
+
+class Client:
+    def __init__(self, host='localhost', port=2000, worker_threads=0):
+        self.host = host
+        self.port = port
+        self._server = get_server(port)
+        self._timeout = 5.0
+
+    def set_timeout(self, seconds):
+        self._timeout = seconds
+
+    def get_server_version(self):
+        self._server.rpc('client.get_server_version')
+        return '0.9.15-fake'
+
+    def get_client_version(self):
+        return '0.9.15-fake'
+
+    def get_world(self):
+        self._server.rpc('client.get_world')
+        return self._server.world
+
+    def get_available_maps(self):
+        self._server.rpc('client.get_available_maps')
+        return [f"/Game/Carla/Maps/Town{i:02d}" for i in (1, 2, 3, 4, 5, 10)]
+
+    def load_world(self, map_name, reset_settings=True, map_layers=MapLayer.All):
+        self._server.rpc('client.load_world', extra=CONFIG['load_latency'])
+        settings = self._server.load_world(map_name)
+        if not reset_settings:
+            self._server.world._settings = settings
+        return self._server.world
+
+    def reload_world(self, reset_settings=True):
+        self._server.rpc('client.reload_world', extra=CONFIG['load_latency'])
+        settings = self._server.load_world(self._server.world._map.name)
+        if not reset_settings:
+            self._server.world._settings = settings
+        return self._server.world
+
+    def get_trafficmanager(self, port=8000):
+        self._server.rpc('client.get_trafficmanager')
+        return self._server.traffic_manager(port)
+
+    def apply_batch_sync(self, commands, do_tick=False):
+        """批量命令一次往返完成"""
+        self._server.rpc('client.apply_batch_sync')
+        world = self._server.world
+        with world._lock:
+            responses = [cmd._execute(world) for cmd in commands]
+            if do_tick:
+                world._advance()
+        return responses
+
+    def apply_batch(self, commands):
+        self._server.rpc('client.apply_batch')
+        world = self._server.world
+        with world._lock:
+            for cmd in commands:
+                cmd._execute(world)
+
+
+# ---------------------------------------------------------------- 批量命令
+
+class _FutureActor:
+    """批量命令中指代前一条SpawnActor生成的actor"""
+
+
+class Response:
+    def __init__(self, actor_id=0, error=''):
+        self.actor_id = actor_id
+        self.error = error
+
+    def has_error(self):
+        return bool(self.error)
+
+
+class _Command:
+    def __init__(self):
+        self._then = []
+
+    def then(self, cmd):
+        self._then.append(cmd)
+        return self
+
+    def _run(self, world, future_id=None):
+        """执行命令，返回相关actor的id；future_id是同批前一条SpawnActor生成的actor"""
+        raise NotImplementedError
+
+    def _execute(self, world, future_id=None):
+        try:
+            actor_id = self._run(world, future_id)
+        except Exception as e:
+            return Response(error=str(e))
+        for cmd in self._then:
+            response = cmd._execute(world, actor_id)
+            if response.error:
+                return Response(actor_id, response.error)
+        return Response(actor_id)
+
+    @staticmethod
+    def _actor(world, actor, future_id):
+        actor_id = future_id if actor is _FutureActor else (actor if isinstance(actor, int) else actor.id)
+        found = world._actors.get(actor_id)
+        if found is None:
+            raise RuntimeError(f"actor {actor_id} not found")
+        return found
+
+
+class SpawnActor(_Command):
+    def __init__(self, blueprint, transform, parent=None):
+        super().__init__()
+        self.blueprint = blueprint
+        self.transform = transform
+        self.parent = parent
+
+    def _run(self, world, future_id=None):
+        parent = world._actors.get(self.parent) if isinstance(self.parent, int) else self.parent
+        return world._spawn(self.blueprint, self.transform, parent).id
+
+
+class DestroyActor(_Command):
+    def __init__(self, actor):
+        super().__init__()
+        self.actor = actor
+
+    def _run(self, world, future_id=None):
+        actor = self._actor(world, self.actor, future_id)
+        world._destroy(actor.id)
+        return actor.id
+
+
+class SetAutopilot(_Command):
+    def __init__(self, actor, enabled, tm_port=8000):
+        super().__init__()
+        self.actor = actor
+        self.enabled = enabled
+        self.tm_port = tm_port
+
+    def _run(self, world, future_id=None):
+        actor = self._actor(world, self.actor, future_id)
+        traffic_manager = world._server.traffic_manager(self.tm_port)
+        world._vehicles.set_autopilot(actor._slot, self.enabled, self.tm_port, traffic_manager._target_speed)
+        return actor.id
+
+
+class ApplyTransform(_Command):
+    def __init__(self, actor, transform):
+        super().__init__()
+        self.actor = actor
+        self.transform = transform
+
+    def _run(self, world, future_id=None):
+        actor = self._actor(world, self.actor, future_id)
+        actor._set_transform(self.transform)
+        return actor.id
+
+
+class ApplyTargetVelocity(_Command):
+    def __init__(self, actor, velocity):
+        super().__init__()
+        self.actor = actor
+        self.velocity = velocity
+
+    def _run(self, world, future_id=None):
+        actor = self._actor(world, self.actor, future_id)
+        if isinstance(actor, Vehicle):
+            world._vehicles.set_velocity(actor._slot, self.velocity)
+        return actor.id
+
+
+class ApplyTargetAngularVelocity(_Command):
+    def __init__(self, actor, angular_velocity):
+        super().__init__()
+        self.actor = actor
+        self.angular_velocity = angular_velocity
+
+    def _run(self, world, future_id=None):
+        return self._actor(world, self.actor, future_id).id
+
+
+class ApplyVehicleControl(_Command):
+    def __init__(self, actor, control):
+        super().__init__()
+        self.actor = actor
+        self.control = control
+
+    def _run(self, world, future_id=None):
+        actor = self._actor(world, self.actor, future_id)
+        actor._apply_control(self.control)
+        return actor.id
+
+
+command = types.ModuleType('carla.command')
+for _cls in (SpawnActor, DestroyActor, SetAutopilot, ApplyTransform, ApplyTargetVelocity,
+             ApplyTargetAngularVelocity, ApplyVehicleControl, Response):
+    setattr(command, _cls.__name__, _cls)
+command.FutureActor = _FutureActor
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+import collections
+import pygame
+
+
+class TextCache:
+    """文字渲染缓存：同一字体、内容和颜色只渲染一次（LRU淘汰）"""
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color):
+        key = (id(font), text, color)
+        surface = self._cache.get(key)
+        if surface is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = font.render(text, True, color)
+        self._cache[key] = surface
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return surface
+
+
+class ScenarioHud:
+    """场景界面的缓存式绘制
+
+    背景、面板、帮助栏等静态元素只预渲染一次；文字只在内容变化时重新渲染；
+    每帧只把变化的区域通过pygame.display.update(rects)提交到屏幕。
+    """
+    def __init__(self, screen, main_view_size, side_panel_width, map_size,
+                 font_large, font_normal, font_small):
+        self.screen = screen
+        self.display_size = screen.get_size()
+        self.main_view_size = main_view_size
+        self.side_panel_width = side_panel_width
+        self.map_size = map_size
+        self.font_large = font_large
+        self.font_normal = font_normal
+        self.font_small = font_small
+        self.text_cache = TextCache()
+
+        self.main_rect = pygame.Rect((0, 0), main_view_size)
+        self.side_rect = pygame.Rect(main_view_size[0], 0, side_panel_width, self.display_size[1])
+        self.map_pos = (main_view_size[0] + 10, 10)  # 留出边距
+        self.map_rect = pygame.Rect(self.map_pos, (map_size, map_size))
+
+        self._build_static_layers()
+        self._info_key = None
+        self._overlay = None
+        self._side_text = {}
+        self._full_redraw = True
+
+    def _build_static_layers(self):
+        """预渲染静态元素"""
+        # 右侧信息面板背景（含小地图底色和仪表盘面板）
+        self.side_background = pygame.Surface(self.side_rect.size)
+        self.side_background.fill((20, 20, 20))  # 深灰色背景
+        self.side_background.fill((0, 0, 0), pygame.Rect((10, 10), (self.map_size, self.map_size)))
+        panel_surface = pygame.Surface((self.side_panel_width - 20, 280))  # 留出边距
+        panel_surface.fill((0, 0, 0))
+        panel_surface.set_alpha(160)  # 稍微透明一些
+        self.side_background.blit(panel_surface, (10, self.map_size + 80))
+
+        # 主屏幕左上方轮次信息背景
+        self.info_bg = pygame.Surface((300, 100))
+        self.info_bg.fill((0, 0, 0))
+        self.info_bg.set_alpha(160)
+
+        # 底部操作提示
+        help_text = "ESC: Exit | Space: Switch Mode | Right Click: Save"
+        self.help_surface = self.font_small.render(help_text, True, (200, 200, 200))
+        self.help_bg = pygame.Surface((self.help_surface.get_width() + 20, self.help_surface.get_height() + 10))
+        self.help_bg.fill((0, 0, 0))
+        self.help_bg.set_alpha(160)
+        self.help_pos = (self.display_size[0] - self.help_surface.get_width() - 30, self.display_size[1] - 40)
+        self.help_rect = self.help_bg.get_rect(topleft=(self.help_pos[0] - 10, self.help_pos[1] - 5))
+
+    def invalidate(self):
+        """下一帧整屏重绘（窗口被覆盖、摄像头重建后调用）"""
+        self._full_redraw = True
+
+    def _restore_side(self, rect):
+        """用预渲染的面板背景恢复右侧区域"""
+        area = rect.clip(self.side_rect)
+        if area.width and area.height:
+            self.screen.blit(self.side_background, area.topleft, area.move(-self.side_rect.x, 0))
+
+    def _draw_side_text(self, name, text, font, color, pos, dirty):
+        """右侧面板文字：内容变化时才恢复背景并重绘"""
+        previous = self._side_text.get(name)
+        if previous is not None and previous[0] == text:
+            return
+        if previous is not None:
+            self._restore_side(previous[1])
+            dirty.append(previous[1])
+        rect = None
+        if text:
+            surface = self.text_cache.render(font, text, color)
+            rect = surface.get_rect(topleft=pos)
+            self._restore_side(rect)
+            self.screen.blit(surface, rect)
+            dirty.append(rect)
+        self._side_text[name] = (text, rect) if rect is not None else None
+
+    def draw(self, main_surface, main_updated, map_surface, map_updated,
+             round_text, time_text, npc_text, vehicle_info, overlay=None):
+        dirty = []
+        if self._full_redraw:
+            self.screen.fill((0, 0, 0))
+            self.screen.blit(self.side_background, self.side_rect)
+            self._side_text.clear()
+            self._info_key = None
+            main_updated = map_updated = True
+
+        # 主视角（左侧）：新画面、轮次/时间或性能叠加层变化时重绘，叠加层一起重绘
+        info_key = (round_text, time_text)
+        if main_updated or info_key != self._info_key or overlay is not self._overlay:
+            self.screen.blit(main_surface, (0, 0))
+            self.screen.blit(self.info_bg, (20, 20))
+            self.screen.blit(self.text_cache.render(self.font_large, round_text, (255, 255, 255)), (30, 30))
+            self.screen.blit(self.text_cache.render(self.font_large, time_text, (255, 255, 255)), (30, 70))
+            # 帮助栏可能跨到右侧面板，先恢复面板背景避免半透明叠加变暗
+            self._restore_side(self.help_rect)
+            self.screen.blit(self.help_bg, self.help_rect)
+            self.screen.blit(self.help_surface, self.help_pos)
+            if overlay is not None:
+                # 性能叠加层放在主视角左下角
+                self.screen.blit(overlay, (20, self.main_rect.height - overlay.get_height() - 20))
+            self._info_key = info_key
+            self._overlay = overlay
+            dirty.append(self.main_rect)
+            dirty.append(self.help_rect)
+
+        # 小地图（右上）
+        if map_updated:
+            self.screen.blit(map_surface, self.map_pos)
+            dirty.append(self.map_rect)
+
+        # 显示NPC数量
+        self._draw_side_text('npc', npc_text, self.font_normal, (200, 200, 200),
+                             (self.map_pos[0], self.map_pos[1] + self.map_size + 10), dirty)
+
+        # 车辆信息仪表盘
+        self.draw_vehicle_info(vehicle_info, self.main_view_size[0] + 10, self.map_size + 80, dirty)
+
+        if self._full_redraw:
+            pygame.display.flip()
+            self._full_redraw = False
+        elif dirty:
+            pygame.display.update(dirty)
+
+    def draw_vehicle_info(self, info, start_x, start_y, dirty):
+        """绘制车辆信息仪表盘（面板背景已预渲染）"""
+        y_offset = start_y + 20
+        x_padding = start_x + 20
+        if not info:
+            for name in ('speed', 'steer', 'throttle', 'brake', 'gear', 'location'):
+                self._draw_side_text(name, '', None, None, None, dirty)
+            return
+
+        loc = info['location']
+        # (名称, 文字, 字体, 颜色, y偏移)
+        lines = [
+            ('speed', f"{info['speed']:.1f} km/h", self.font_large, (255, 255, 255), 0),  # 速度表（大字体）
+            ('steer', f"Steering: {info['steer']:.2f}", self.font_normal, (255, 255, 255), 60),  # 方向盘状态
+            ('throttle', f"Throttle: {info['throttle']:.2f}", self.font_normal, (0, 255, 0), 100),  # 油门
+            ('brake', f"Brake: {info['brake']:.2f}", self.font_normal, (255, 0, 0), 140),  # 刹车
+            ('gear', f"Gear: {info['gear']}", self.font_normal, (255, 255, 255), 180),  # 档位
+            ('location', f"Location: ({loc.x:.1f}, {loc.y:.1f})", self.font_small, (200, 200, 200), 220),  # 坐标
+        ]
+        for name, text, font, color, offset in lines:
+            self._draw_side_text(name, text, font, color, (x_padding, y_offset + offset), dirty)
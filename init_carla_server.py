@@ -1,23 +1,30 @@
 import os
 import sys
 import time
+import socket
 import subprocess
 import psutil
 import carla
 import signal
 import glob
 
+# CARLA服务器路径，改为你的安装目录
+CARLA_PATH = "G:/Simulator/WindowsNoEditor/CarlaUE4.exe"
+
 def kill_carla_processes():
     """终止所有CARLA相关进程"""
     print("正在终止所有CARLA进程...")
+    killed = []
     for proc in psutil.process_iter(['pid', 'name']):
         try:
             if 'carla' in proc.info['name'].lower():
                 print(f"终止进程: {proc.info['name']} (PID: {proc.info['pid']})")
                 proc.kill()
+                killed.append(proc)
         except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
             pass
-    time.sleep(2)  # 等待进程完全终止
+    # 等待进程真正退出（没有进程时立即返回）
+    psutil.wait_procs(killed, timeout=5)
 
 def clean_cache():
     """清理CARLA缓存文件"""
@@ -25,7 +32,7 @@ def clean_cache():
     cache_paths = [
         os.path.expanduser("~/.cache/carla"),
         os.path.expanduser("~/AppData/Local/carla"),
-        "G:/Simulator/WindowsNoEditor/CarlaUE4/Saved"
+        os.path.join(os.path.dirname(CARLA_PATH), "CarlaUE4/Saved")
     ]
     
     for path in cache_paths:
@@ -40,50 +47,81 @@ def clean_cache():
             except Exception as e:
                 print(f"清理 {path} 时出错: {e}")
 
-def start_carla_server():
-    """启动CARLA服务器"""
-    print("正在启动CARLA服务器...")
-    carla_path = "G:/Simulator/WindowsNoEditor/CarlaUE4.exe"
+def start_carla_server(rpc_port=2000, carla_path=CARLA_PATH, offscreen=False):
+    """启动CARLA服务器
+
+    carla_path可以是可执行文件路径，也可以是命令列表（例如用假服务器脚本代替CarlaUE4做测试）
+    """
+    print(f"正在启动CARLA服务器（端口 {rpc_port}）...")
+    command = list(carla_path) if isinstance(carla_path, (list, tuple)) else [carla_path]
     
     # 服务器启动参数
     params = [
-        "-carla-rpc-port=2000",       # RPC端口
+        f"-carla-rpc-port={rpc_port}", # RPC端口
         "-quality-level=Epic",         # 图形质量
         "-fps=30",                     # 帧率限制
-        "-windowed",                   # 窗口模式
-        "-ResX=1280",                  # 窗口宽度
-        "-ResY=720"                    # 窗口高度
     ]
+    if offscreen:
+        params.append("-RenderOffScreen")  # 无窗口渲染（多服务器训练）
+    else:
+        params += [
+            "-windowed",               # 窗口模式
+            "-ResX=1280",              # 窗口宽度
+            "-ResY=720"                # 窗口高度
+        ]
     
     try:
-        process = subprocess.Popen([carla_path] + params, 
-                                 stdout=subprocess.PIPE, 
-                                 stderr=subprocess.PIPE)
+        # 输出丢弃，避免管道写满阻塞服务器
+        process = subprocess.Popen(command + params,
+                                 stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.DEVNULL)
         print(f"CARLA服务器已启动，PID: {process.pid}")
         return process
     except Exception as e:
         print(f"启动CARLA服务器失败: {e}")
         return None
 
-def wait_for_server():
-    """等待服务器就绪"""
+def probe_port(host, port, timeout=0.2):
+    """TCP层探测端口是否已在监听"""
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+def wait_for_server(rpc_port=2000, process=None, timeout=60.0, host='localhost'):
+    """等待服务器就绪
+
+    先用TCP探测RPC端口，端口打开后再做一次RPC确认；重试间隔指数退避（有上限），
+    同时检查服务器进程是否提前退出。
+    """
     print("等待服务器就绪...")
-    max_attempts = 10
+    start = time.perf_counter()
+    delay = 0.05
+    max_delay = 1.0
     attempt = 0
     
-    while attempt < max_attempts:
-        try:
-            client = carla.Client('localhost', 2000)
-            client.set_timeout(10.0)
-            world = client.get_world()
-            print("服务器已就绪！")
-            return True
-        except Exception as e:
-            attempt += 1
-            print(f"尝试连接服务器 {attempt}/{max_attempts}")
-            time.sleep(2)
+    while time.perf_counter() - start < timeout:
+        attempt += 1
+        # 服务器进程已退出则不必再等
+        if process is not None and process.poll() is not None:
+            print(f"服务器进程提前退出，返回码: {process.returncode}")
+            return False
+        
+        if probe_port(host, rpc_port):
+            try:
+                client = carla.Client(host, rpc_port)
+                client.set_timeout(2.0)
+                client.get_server_version()
+                print(f"服务器已就绪！耗时 {time.perf_counter() - start:.2f} 秒（探测 {attempt} 次）")
+                return True
+            except Exception:
+                pass
+        
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
     
-    print("服务器启动超时！")
+    print(f"服务器启动超时！（{timeout:.0f} 秒）")
     return False
 
 def init_server():
@@ -103,7 +141,7 @@ def init_server():
         return False
     
     # 4. 等待服务器就绪
-    if not wait_for_server():
+    if not wait_for_server(process=server_process):
         print("服务器初始化失败！")
         server_process.terminate()
         return False
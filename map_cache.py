@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+import glob
+import hashlib
+import os
+import numpy as np
+
+MAP_CACHE_VERSION = 1
+MAP_CACHE_DIR = 'map_cache'
+
+
+class MapData:
+    """地图静态数据：路点、车道信息、生成点、交通信号灯位置和地图边界，全部为NumPy数组
+
+    从缓存文件加载时不需要连接服务器，工具可以离线运行。
+    """
+    FIELDS = (
+        'waypoint_ids',         # (N,) uint64 路点id
+        'waypoint_transforms',  # (N, 6) x, y, z, pitch, yaw, roll
+        'waypoint_lanes',       # (N, 5) int32 road_id, section_id, lane_id, lane_type, lane_change
+        'waypoint_lane_info',   # (N, 2) float32 lane_width, s
+        'waypoint_junction',    # (N,) bool 是否在路口内
+        'spawn_points',         # (M, 6) x, y, z, pitch, yaw, roll
+        'traffic_lights',       # (K, 4) x, y, z, yaw
+        'bounds',               # (4,) min_x, min_y, max_x, max_y（路点和生成点）
+    )
+
+    def __init__(self, map_name, opendrive_hash, waypoint_distance, **arrays):
+        self.map_name = map_name
+        self.opendrive_hash = opendrive_hash
+        self.waypoint_distance = waypoint_distance
+        for field in self.FIELDS:
+            setattr(self, field, arrays[field])
+
+    @property
+    def short_name(self):
+        """去掉路径前缀的地图名，例如 Carla/Maps/Town03 -> Town03"""
+        return map_short_name(self.map_name)
+
+    @property
+    def waypoint_xy(self):
+        return self.waypoint_transforms[:, :2]
+
+    @property
+    def spawn_xy(self):
+        return self.spawn_points[:, :2]
+
+    @property
+    def spawn_yaw(self):
+        return self.spawn_points[:, 4]
+
+    def spawn_transforms(self):
+        """生成点还原为carla.Transform列表（需要carla模块）"""
+        import carla
+        return [
+            carla.Transform(carla.Location(x=x, y=y, z=z), carla.Rotation(pitch=pitch, yaw=yaw, roll=roll))
+            for x, y, z, pitch, yaw, roll in self.spawn_points.tolist()
+        ]
+
+    def save(self, path):
+        """保存为压缩的.npz文件"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        arrays = {field: getattr(self, field) for field in self.FIELDS}
+        # 先写临时文件再替换，中断时不会留下损坏的缓存
+        temp_path = path + '.tmp.npz'
+        np.savez_compressed(
+            temp_path,
+            version=np.int32(MAP_CACHE_VERSION),
+            map_name=np.str_(self.map_name),
+            opendrive_hash=np.str_(self.opendrive_hash),
+            waypoint_distance=np.float64(self.waypoint_distance),
+            **arrays
+        )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """从.npz文件加载，版本不一致时抛出ValueError"""
+        with np.load(path) as data:
+            version = int(data['version'])
+            if version != MAP_CACHE_VERSION:
+                raise ValueError(f"地图缓存版本不匹配: {path} (v{version}, 需要v{MAP_CACHE_VERSION})")
+            return cls(
+                str(data['map_name']),
+                str(data['opendrive_hash']),
+                float(data['waypoint_distance']),
+                **{field: data[field] for field in cls.FIELDS}
+            )
+
+
+def map_short_name(map_name):
+    """Carla/Maps/Town03 -> Town03"""
+    return map_name.rsplit('/', 1)[-1]
+
+
+def opendrive_hash(carla_map):
+    """地图OpenDRIVE内容的SHA1，地图文件变化后缓存自动失效"""
+    return hashlib.sha1(carla_map.to_opendrive().encode('utf-8')).hexdigest()
+
+
+def cache_path(map_name, od_hash, waypoint_distance=2.0, cache_dir=MAP_CACHE_DIR):
+    """缓存文件路径：地图名_哈希前16位_路点间距.npz"""
+    return os.path.join(cache_dir, f"{map_short_name(map_name)}_{od_hash[:16]}_{waypoint_distance:g}m.npz")
+
+
+def _transform_row(transform):
+    location = transform.location
+    rotation = transform.rotation
+    return (location.x, location.y, location.z, rotation.pitch, rotation.yaw, rotation.roll)
+
+
+def build_map_data(world, carla_map=None, waypoint_distance=2.0, od_hash=None):
+    """从服务器查询地图静态数据"""
+    if carla_map is None:
+        carla_map = world.get_map()
+    if od_hash is None:
+        od_hash = opendrive_hash(carla_map)
+
+    waypoints = carla_map.generate_waypoints(waypoint_distance)
+    waypoint_transforms = np.array([_transform_row(wp.transform) for wp in waypoints],
+                                   dtype=np.float64).reshape(-1, 6)
+    waypoint_lanes = np.array([
+        (wp.road_id, wp.section_id, wp.lane_id, int(wp.lane_type), int(wp.lane_change))
+        for wp in waypoints
+    ], dtype=np.int32).reshape(-1, 5)
+    waypoint_lane_info = np.array([(wp.lane_width, wp.s) for wp in waypoints],
+                                  dtype=np.float32).reshape(-1, 2)
+
+    spawn_points = np.array([_transform_row(sp) for sp in carla_map.get_spawn_points()],
+                            dtype=np.float64).reshape(-1, 6)
+
+    traffic_lights = []
+    for light in world.get_actors().filter('traffic.traffic_light'):
+        transform = light.get_transform()
+        location = transform.location
+        traffic_lights.append((location.x, location.y, location.z, transform.rotation.yaw))
+
+    points = np.concatenate([waypoint_transforms[:, :2], spawn_points[:, :2]])
+    if len(points):
+        bounds = np.concatenate([points.min(axis=0), points.max(axis=0)])
+    else:
+        bounds = np.zeros(4)
+
+    return MapData(
+        carla_map.name, od_hash, waypoint_distance,
+        waypoint_ids=np.array([wp.id for wp in waypoints], dtype=np.uint64),
+        waypoint_transforms=waypoint_transforms,
+        waypoint_lanes=waypoint_lanes,
+        waypoint_lane_info=waypoint_lane_info,
+        waypoint_junction=np.array([wp.is_junction for wp in waypoints], dtype=np.bool_),
+        spawn_points=spawn_points,
+        traffic_lights=np.array(traffic_lights, dtype=np.float64).reshape(-1, 4),
+        bounds=bounds.astype(np.float64)
+    )
+
+
+def find_cached(map_name, waypoint_distance=2.0, cache_dir=MAP_CACHE_DIR):
+    """离线查找某地图最新的缓存文件（不校验哈希），没有则返回None"""
+    pattern = os.path.join(cache_dir, f"{map_short_name(map_name)}_*_{waypoint_distance:g}m.npz")
+    paths = sorted(glob.glob(pattern), key=os.path.getmtime)
+    return paths[-1] if paths else None
+
+
+def get_map_data(world=None, map_name=None, waypoint_distance=2.0, cache_dir=MAP_CACHE_DIR, refresh=False):
+    """获取地图静态数据：优先读缓存，缓存缺失、过期或版本不符时查询服务器并写入缓存
+
+    world为None时离线运行，只按map_name读取缓存。
+    """
+    if world is None:
+        if map_name is None:
+            raise ValueError("离线模式需要指定map_name")
+        path = find_cached(map_name, waypoint_distance, cache_dir)
+        if path is None:
+            raise FileNotFoundError(f"没有 {map_name} 的地图缓存，请先联网运行一次生成缓存")
+        return MapData.load(path)
+
+    carla_map = world.get_map()
+    od_hash = opendrive_hash(carla_map)
+    path = cache_path(carla_map.name, od_hash, waypoint_distance, cache_dir)
+    if not refresh and os.path.exists(path):
+        try:
+            return MapData.load(path)
+        except Exception as e:
+            print(f"地图缓存读取失败，重新生成: {e}")
+
+    map_data = build_map_data(world, carla_map, waypoint_distance, od_hash)
+    try:
+        map_data.save(path)
+        print(f"地图缓存已保存到 {path}")
+    except Exception as e:
+        print(f"地图缓存保存失败: {e}")
+    return map_data
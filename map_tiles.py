@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+import collections
+import math
+import numpy as np
+import pygame
+
+
+class RoadTileCache:
+    """分级瓦片缓存：路网和官方生成点按缩放级别切成定长瓦片，按需渲染，只绘制可见瓦片
+
+    第level级的像素密度为base_scale * 2**level（像素/米）。全局像素坐标以地图左上角
+    (min_x, max_y)为原点，x向右、y向下。同一级别落在同一像素上的路点只保留一个，
+    缩小时点密度随之降低，十万级路点的地图渲染量也只和屏幕像素数相关。
+    """
+    def __init__(self, waypoint_xy, spawn_xy, spawn_yaw, origin, base_scale, max_level,
+                 tile_size=256, max_tiles=256, arrow_length=20):
+        self.waypoint_xy = waypoint_xy
+        self.spawn_xy = spawn_xy
+        self.spawn_yaw = spawn_yaw
+        self.origin_x, self.origin_y = origin
+        self.base_scale = base_scale
+        self.max_level = max_level
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.arrow_length = arrow_length
+        self._levels = {}  # level -> (路点瓦片字典, 生成点瓦片字典)
+        self._tiles = collections.OrderedDict()  # (level, tx, ty) -> Surface
+        self.rendered = 0
+
+    def scale(self, level):
+        """该级别的像素密度（像素/米）"""
+        return self.base_scale * (2 ** level)
+
+    def to_pixels(self, xy, level):
+        """(N, 2)世界坐标 -> 该级别的全局整数像素坐标"""
+        s = self.scale(level)
+        pixels = np.empty((len(xy), 2), dtype=np.int64)
+        pixels[:, 0] = np.floor((xy[:, 0] - self.origin_x) * s)
+        pixels[:, 1] = np.floor((self.origin_y - xy[:, 1]) * s)
+        return pixels
+
+    def _level_index(self, level):
+        """按级别把路点和生成点分配到瓦片（每级只计算一次）"""
+        if level in self._levels:
+            return self._levels[level]
+        size = self.tile_size
+
+        # 同一像素的路点去重后按瓦片分组
+        road = self.to_pixels(self.waypoint_xy, level)
+        road = road[(road[:, 0] >= 0) & (road[:, 1] >= 0)]
+        height = int(road[:, 1].max()) + 1 if len(road) else 1
+        packed = np.unique(road[:, 0] * height + road[:, 1])
+        gx, gy = packed // height, packed % height
+        tx, ty = gx // size, gy // size
+        order = np.lexsort((ty, tx))
+        gx, gy, tx, ty = gx[order], gy[order], tx[order], ty[order]
+        road_tiles = {}
+        if len(gx):
+            starts = np.flatnonzero(np.r_[True, (tx[1:] != tx[:-1]) | (ty[1:] != ty[:-1])])
+            ends = np.r_[starts[1:], len(gx)]
+            for start, end in zip(starts, ends):
+                key = (int(tx[start]), int(ty[start]))
+                road_tiles[key] = (gx[start:end] - key[0] * size, gy[start:end] - key[1] * size)
+
+        # 生成点连同箭头可能跨越瓦片边界，分配到它覆盖的所有瓦片
+        spawn_tiles = collections.defaultdict(list)
+        reach = self.arrow_length + 4
+        for i, (px, py) in enumerate(self.to_pixels(self.spawn_xy, level).tolist()):
+            for tile_x in range((px - reach) // size, (px + reach) // size + 1):
+                for tile_y in range((py - reach) // size, (py + reach) // size + 1):
+                    spawn_tiles[(tile_x, tile_y)].append((i, px, py))
+
+        self._levels[level] = (road_tiles, spawn_tiles)
+        return self._levels[level]
+
+    def _render(self, level, tx, ty):
+        """渲染单个瓦片"""
+        size = self.tile_size
+        road_tiles, spawn_tiles = self._level_index(level)
+        tile = pygame.Surface((size, size))
+        tile.fill((0, 0, 0))  # 黑色背景
+
+        # 路网点（灰色小点）：3x3像素直接写入像素数组
+        if (tx, ty) in road_tiles:
+            x0, y0 = road_tiles[(tx, ty)]
+            pixels = pygame.surfarray.pixels3d(tile)
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    x = x0 + dx
+                    y = y0 + dy
+                    visible = (x >= 0) & (x < size) & (y >= 0) & (y < size)
+                    pixels[x[visible], y[visible]] = (50, 50, 50)
+            del pixels  # 释放surface锁
+
+        # 官方生成点和方向（白色）
+        left, top = tx * size, ty * size
+        for i, px, py in spawn_tiles.get((tx, ty), ()):
+            pos = (px - left, py - top)
+            angle = math.radians(self.spawn_yaw[i])
+            end_pos = (
+                pos[0] + self.arrow_length * math.cos(angle),
+                pos[1] - self.arrow_length * math.sin(angle)
+            )
+            pygame.draw.circle(tile, (200, 200, 200), pos, 4)
+            pygame.draw.line(tile, (200, 200, 200), pos, end_pos, 2)
+
+        self.rendered += 1
+        return tile
+
+    def tile(self, level, tx, ty):
+        """取出瓦片（LRU缓存，超出上限时淘汰最久未用的）"""
+        key = (level, tx, ty)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            return tile
+        tile = self._render(level, tx, ty)
+        self._tiles[key] = tile
+        if len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+        return tile
+
+    def draw(self, surface, level, view_left, view_top):
+        """把可见瓦片贴到surface上，(view_left, view_top)为屏幕左上角的全局像素坐标"""
+        size = self.tile_size
+        road_tiles, spawn_tiles = self._level_index(level)
+        width, height = surface.get_size()
+        for tx in range(view_left // size, (view_left + width) // size + 1):
+            for ty in range(view_top // size, (view_top + height) // size + 1):
+                # 空白瓦片不渲染也不缓存
+                if (tx, ty) not in road_tiles and (tx, ty) not in spawn_tiles:
+                    continue
+                surface.blit(self.tile(level, tx, ty), (tx * size - view_left, ty * size - view_top))
+
+    def clear(self):
+        """清空所有缓存"""
+        self._levels.clear()
+        self._tiles.clear()
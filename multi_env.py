@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+import multiprocessing
+import numpy as np
+
+from init_carla_server import CARLA_PATH, start_carla_server, wait_for_server
+
+
+def make_scenario(host, port, tm_port, scenario_kwargs):
+    """默认环境工厂：无界面、不带RL代理的AutonomousScenario
+
+    训练在主进程完成，工作进程不创建模型和回放池；scenario_kwargs需要包含reward_fn
+    （模块级函数，spawn方式启动时要能被pickle），或显式指定with_agent=True。
+    """
+    from autonomous_scenario import AutonomousScenario
+    scenario_kwargs = dict(scenario_kwargs)
+    scenario_kwargs.setdefault('with_agent', False)
+    return AutonomousScenario(host=host, port=port, tm_port=tm_port, headless=True, **scenario_kwargs)
+
+
+def _worker(conn, env_factory, host, port, tm_port, scenario_kwargs):
+    """工作进程：驱动一个场景，按命令执行reset/step/close"""
+    env = None
+    try:
+        env = env_factory(host, port, tm_port, scenario_kwargs)
+        conn.send(('ready', None))
+        while True:
+            command, data = conn.recv()
+            if command == 'reset':
+                conn.send(('ok', env.env_reset()))
+            elif command == 'step':
+                observation, reward, done, info = env.env_step(data)
+                if done:
+                    # 回合结束后自动重置，终止观察放在info里
+                    info['terminal_observation'] = observation
+                    observation = env.env_reset()
+                conn.send(('ok', (observation, reward, done, info)))
+            elif command == 'close':
+                break
+    except Exception as e:
+        conn.send(('error', f"端口 {port}: {str(e)}"))
+    finally:
+        if env is not None:
+            try:
+                env.close()
+            except Exception as e:
+                print(f"关闭环境时出错: {str(e)}")
+        conn.close()
+
+
+def stack_observations(observations):
+    """把多个环境的观察合并为批量数组（扁平向量或字段字典）"""
+    if isinstance(observations[0], dict):
+        return {key: np.stack([obs[key] for obs in observations]) for key in observations[0]}
+    return np.stack(observations)
+
+
+class MultiCarlaEnv:
+    """多服务器并行环境：每个CARLA服务器一个工作进程，提供批量step(actions) -> observations接口
+
+    服务器i使用RPC端口 base_port + i * port_stride，TrafficManager端口 base_tm_port + i。
+    carla_path和env_factory可以替换为假服务器/假环境，用于没有CarlaUE4的测试。
+    """
+    def __init__(self, num_envs, host='localhost', base_port=2000, port_stride=4, base_tm_port=8000,
+                 launch_servers=True, carla_path=CARLA_PATH, env_factory=make_scenario, scenario_kwargs=None):
+        self.num_envs = num_envs
+        self.ports = [base_port + i * port_stride for i in range(num_envs)]
+        self.tm_ports = [base_tm_port + i for i in range(num_envs)]
+        self.server_processes = []
+        self.workers = []
+        self.connections = []
+        scenario_kwargs = dict(scenario_kwargs or {})
+
+        try:
+            if launch_servers:
+                self.launch_servers(carla_path)
+
+            # spawn方式启动，避免fork继承pygame/carla的连接状态
+            context = multiprocessing.get_context('spawn')
+            for port, tm_port in zip(self.ports, self.tm_ports):
+                parent_conn, child_conn = context.Pipe()
+                worker = context.Process(
+                    target=_worker,
+                    args=(child_conn, env_factory, host, port, tm_port, scenario_kwargs),
+                    daemon=True
+                )
+                worker.start()
+                child_conn.close()
+                self.workers.append(worker)
+                self.connections.append(parent_conn)
+            self._receive_all()
+        except Exception:
+            self.close()
+            raise
+
+    def launch_servers(self, carla_path):
+        """在不同端口上启动所有服务器并等待就绪"""
+        for port in self.ports:
+            process = start_carla_server(rpc_port=port, carla_path=carla_path, offscreen=True)
+            if process is None:
+                raise RuntimeError(f"无法启动端口 {port} 上的服务器")
+            self.server_processes.append(process)
+        for port, process in zip(self.ports, self.server_processes):
+            if not wait_for_server(rpc_port=port, process=process):
+                raise RuntimeError(f"端口 {port} 上的服务器未就绪")
+
+    def _receive_all(self):
+        """接收所有工作进程的回复；任一出错时先读完其余回复，再关闭全部工作进程并抛出异常
+
+        出错的工作进程已经退出，各环境无法再同步，关闭后环境不能再使用。
+        """
+        results = []
+        errors = []
+        for port, conn in zip(self.ports, self.connections):
+            try:
+                status, payload = conn.recv()
+            except (EOFError, OSError):
+                errors.append(f"端口 {port}: 工作进程意外退出")
+                continue
+            if status == 'error':
+                errors.append(payload)
+            else:
+                results.append(payload)
+        if errors:
+            self.close()
+            raise RuntimeError('; '.join(errors))
+        return results
+
+    def _check_open(self):
+        if not self.connections:
+            raise RuntimeError("环境已关闭（工作进程出错后需要重新创建MultiCarlaEnv）")
+
+    def reset(self):
+        """重置所有环境，返回批量观察"""
+        self._check_open()
+        for conn in self.connections:
+            conn.send(('reset', None))
+        return stack_observations(self._receive_all())
+
+    def step(self, actions):
+        """所有环境并行执行一步，返回(批量观察, 奖励数组, 结束标志数组, 信息列表)"""
+        self._check_open()
+        for conn, action in zip(self.connections, actions):
+            conn.send(('step', action))
+        results = self._receive_all()
+        observations, rewards, dones, infos = zip(*results)
+        return (
+            stack_observations(observations),
+            np.array(rewards, dtype=np.float32),
+            np.array(dones, dtype=np.bool_),
+            list(infos)
+        )
+
+    def close(self):
+        """关闭所有工作进程和服务器"""
+        for conn in self.connections:
+            try:
+                conn.send(('close', None))
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self.workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+        for process in self.server_processes:
+            if process.poll() is None:
+                process.terminate()
+        self.connections = []
+        self.workers = []
+        self.server_processes = []
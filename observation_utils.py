@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+import math
+import numpy as np
+
+
+# 观察字段及形状（扁平向量中的顺序即此顺序）
+OBSERVATION_FIELDS = [
+    ('velocity', (3,)),
+    ('acceleration', (3,)),
+    ('angular_velocity', (3,)),
+    ('location', (3,)),
+    ('rotation', (3,)),
+    ('control_state', (5,)),
+    ('wheel_positions', (4, 3)),
+    ('lane_info', (8,)),
+    ('waypoints', (10, 4)),
+    ('nearest_vehicles', (8,)),
+    ('vehicle_info', (8, 4)),
+    ('traffic_light', (2,)),
+    ('weather', (6,)),
+    ('danger_info', (5,)),
+]
+
+
+class ObservationLayout:
+    """扁平float32观察向量的固定布局：记录每个字段的偏移和形状
+
+    观察直接写入一块预分配的float32缓冲区，各字段是缓冲区上的视图，
+    网络输入和多环境批量数组可以原地填充，不需要再拼接。
+    """
+    def __init__(self, fields=OBSERVATION_FIELDS):
+        self.fields = list(fields)
+        self.offsets = {}
+        self.shapes = {}
+        offset = 0
+        for name, shape in self.fields:
+            size = int(np.prod(shape))
+            self.offsets[name] = (offset, offset + size)
+            self.shapes[name] = tuple(shape)
+            offset += size
+        self.size = offset
+
+    def spec(self):
+        """发布布局说明：字段 -> {offset, size, shape}"""
+        return {
+            name: {
+                'offset': self.offsets[name][0],
+                'size': self.offsets[name][1] - self.offsets[name][0],
+                'shape': list(self.shapes[name])
+            }
+            for name, _ in self.fields
+        }
+
+    def allocate(self, batch_shape=()):
+        """分配扁平缓冲区，batch_shape用于多环境批量"""
+        return np.zeros(tuple(batch_shape) + (self.size,), dtype=np.float32)
+
+    def views(self, buffer):
+        """返回字段名 -> 缓冲区视图的字典（零拷贝，最后一维为扁平向量）"""
+        views = {}
+        for name, shape in self.fields:
+            start, end = self.offsets[name]
+            views[name] = buffer[..., start:end].reshape(buffer.shape[:-1] + shape)
+        return views
+
+    def copy(self, observation):
+        """复制观察（扁平向量或字段视图字典），副本使用一块新的扁平缓冲区"""
+        if isinstance(observation, dict):
+            return self.views(self.flatten(observation))
+        return np.array(observation, dtype=np.float32)
+
+    def flatten(self, observation, out=None):
+        """把观察字典写入扁平向量"""
+        if out is None:
+            out = self.allocate()
+        for name, _ in self.fields:
+            start, end = self.offsets[name]
+            out[start:end] = np.ravel(observation[name])
+        return out
+
+
+def encode_nearby_vehicles(ego_location, ego_forward, ego_velocity, positions, velocities, max_distance=100.0, out=None):
+    """批量编码周围车辆，返回(8, 4)数组：每个45度扇区内最近车辆的[距离, 相对速度, TTC, 角度]
+
+    positions/velocities为(N,3)数组，计算全部向量化，开销随数组大小而非Python循环次数增长。
+    指定out时结果直接写入out。
+    """
+    if out is None:
+        vehicle_info = np.zeros((8, 4), dtype=np.float32)  # 8个方向，每个方向4个值
+    else:
+        vehicle_info = out
+        vehicle_info[:] = 0
+    if len(positions) == 0:
+        return vehicle_info
+
+    ego_location = np.array([ego_location.x, ego_location.y, ego_location.z], dtype=np.float64)
+    ego_velocity = np.array([ego_velocity.x, ego_velocity.y, ego_velocity.z], dtype=np.float64)
+
+    # 计算相对位置，忽略max_distance外的车辆
+    relative = positions - ego_location
+    distance = np.sqrt(np.einsum('ij,ij->i', relative, relative))
+    mask = distance <= max_distance
+    if not mask.any():
+        return vehicle_info
+    relative = relative[mask]
+    distance = distance[mask]
+
+    # 计算相对速度
+    relative_velocity = velocities[mask] - ego_velocity
+    relative_speed = np.sqrt(np.einsum('ij,ij->i', relative_velocity, relative_velocity))
+
+    # 计算角度（相对主车朝向）
+    ego_heading = math.degrees(math.atan2(ego_forward.y, ego_forward.x))
+    angle = np.mod(np.degrees(np.arctan2(relative[:, 1], relative[:, 0])) - ego_heading, 360.0)
+
+    # 确定方向扇区（8个45度扇区）
+    sector = np.floor((angle + 22.5) / 45).astype(np.int64) % 8
+
+    # 计算时间to collision (TTC)，相对静止时取默认安全值
+    moving = relative_speed > 0
+    ttc = np.full_like(distance, 100.0)
+    ttc[moving] = distance[moving] / relative_speed[moving]
+
+    # 每个扇区取最近的车辆（距离相同时保留先出现的）
+    order = np.argsort(distance, kind='stable')
+    _, first = np.unique(sector[order], return_index=True)
+    chosen = order[first]
+    vehicle_info[sector[chosen]] = np.stack([
+        distance[chosen],
+        relative_speed[chosen],
+        ttc[chosen],
+        angle[chosen]
+    ], axis=1)
+
+    return vehicle_info
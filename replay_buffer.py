@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+import json
+import os
+import numpy as np
+
+
+class ObservationReplayBuffer:
+    """预分配的列式经验回放池：每个观察字段一块定长数组，插入O(1)，批量采样向量化
+
+    字段形状和类型由第一条经验推断，观察也可以是扁平向量（单列存储）。
+    指定mmap_dir时所有列以.npy内存映射文件存放在磁盘上，百万级经验也不会占满内存；
+    flush()后可以用ObservationReplayBuffer.open(mmap_dir)重新打开继续使用。
+    接口与RLAgent.store_experience保持一致。
+    """
+    def __init__(self, capacity, mmap_dir=None, seed=None):
+        self.capacity = int(capacity)
+        self.mmap_dir = mmap_dir
+        self.rng = np.random.default_rng(seed)
+        self.position = 0
+        self.size = 0
+        self.observations = None
+        self.next_observations = None
+        self.actions = None
+        self.rewards = None
+        self.dones = None
+        self.flat = False
+
+    def __len__(self):
+        return self.size
+
+    @classmethod
+    def open(cls, mmap_dir, seed=None):
+        """重新打开flush()写到磁盘的回放池，恢复容量、已写入条数和写入位置"""
+        with open(os.path.join(mmap_dir, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        buffer = cls(meta['capacity'], mmap_dir=mmap_dir, seed=seed)
+        buffer.size = int(meta['size'])
+        buffer.position = int(meta['position'])
+        keys = meta['keys']
+        if not keys:
+            return buffer
+        buffer.flat = meta.get('flat', keys == ['observation'])
+
+        def load(name):
+            column = np.load(os.path.join(mmap_dir, f"{name}.npy"), mmap_mode='r+')
+            if len(column) != buffer.capacity:
+                raise ValueError(f"{name}.npy 的长度 {len(column)} 与meta.json中的容量 {buffer.capacity} 不一致")
+            return column
+
+        buffer.observations = {key: load(f"obs.{key}") for key in keys}
+        buffer.next_observations = {key: load(f"next_obs.{key}") for key in keys}
+        buffer.actions = load('action')
+        buffer.rewards = load('reward')
+        buffer.dones = load('done')
+        return buffer
+
+    def _allocate(self, name, shape, dtype):
+        """分配一列存储（内存数组或磁盘映射）"""
+        shape = (self.capacity,) + tuple(shape)
+        if self.mmap_dir is None:
+            return np.zeros(shape, dtype=dtype)
+        os.makedirs(self.mmap_dir, exist_ok=True)
+        path = os.path.join(self.mmap_dir, f"{name}.npy")
+        return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+
+    @staticmethod
+    def _storage_dtype(value):
+        """浮点统一存为float32"""
+        if np.issubdtype(value.dtype, np.floating):
+            return np.float32
+        return value.dtype
+
+    def _initialize(self, observation, action):
+        """按第一条经验分配所有列"""
+        self.flat = not isinstance(observation, dict)
+        if self.flat:
+            observation = {'observation': observation}
+        self.observations = {}
+        self.next_observations = {}
+        for key, value in observation.items():
+            value = np.asarray(value)
+            dtype = self._storage_dtype(value)
+            self.observations[key] = self._allocate(f"obs.{key}", value.shape, dtype)
+            self.next_observations[key] = self._allocate(f"next_obs.{key}", value.shape, dtype)
+        action = np.asarray(action)
+        self.actions = self._allocate('action', action.shape, self._storage_dtype(action))
+        self.rewards = self._allocate('reward', (), np.float32)
+        self.dones = self._allocate('done', (), np.bool_)
+
+    def store_experience(self, observation, action, reward, next_observation, done):
+        """写入一条经验，满了以后覆盖最旧的数据；观察获取失败(None)时跳过"""
+        if observation is None or next_observation is None or action is None:
+            return False
+        if self.observations is None:
+            self._initialize(observation, action)
+        if self.flat:
+            observation = {'observation': observation}
+            next_observation = {'observation': next_observation}
+
+        i = self.position
+        for key, column in self.observations.items():
+            column[i] = observation[key]
+            self.next_observations[key][i] = next_observation[key]
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.dones[i] = done
+
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return True
+
+    def sample(self, batch_size):
+        """随机采样一批经验，返回(obs, actions, rewards, next_obs, dones)，观察为字段->批量数组的字典"""
+        if self.size == 0:
+            raise ValueError("回放池为空，无法采样")
+        indices = self.rng.integers(0, self.size, size=batch_size)
+        return self.gather(indices)
+
+    def gather(self, indices):
+        """按下标批量取出经验"""
+        observations = {key: column[indices] for key, column in self.observations.items()}
+        next_observations = {key: column[indices] for key, column in self.next_observations.items()}
+        if self.flat:
+            observations = observations['observation']
+            next_observations = next_observations['observation']
+        return (
+            observations,
+            self.actions[indices],
+            self.rewards[indices],
+            next_observations,
+            self.dones[indices]
+        )
+
+    def flush(self):
+        """内存映射模式下把数据和写入位置同步到磁盘"""
+        if self.mmap_dir is None or self.observations is None:
+            return
+        columns = list(self.observations.values()) + list(self.next_observations.values())
+        columns += [self.actions, self.rewards, self.dones]
+        for column in columns:
+            column.flush()
+        with open(os.path.join(self.mmap_dir, 'meta.json'), 'w') as f:
+            json.dump({
+                'capacity': self.capacity,
+                'size': self.size,
+                'position': self.position,
+                'flat': self.flat,
+                'keys': list(self.observations.keys())
+            }, f, indent=4)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+import json
+import os
+import numpy as np
+
+from episode_recorder import load_index
+from observation_utils import ObservationLayout
+
+# 只在部分分块中出现的列额外记录一列布尔掩码，缺失的行补0
+PRESENT_PREFIX = '__present__.'
+
+
+def consolidate_recording(recording_dir, cache_dir=None):
+    """把压缩分块逐块解压合并成每列一个.npy文件，返回 列名 -> 路径
+
+    逐块流式写入内存映射文件，内存占用只和单个分块相关；已合并且步数一致时直接复用。
+    合并所有分块中出现过的列，某些分块缺少的列补0，并用 __present__.<列名> 掩码标出有效行；
+    同一列在不同分块中形状或类型不一致时报错并指出分块。
+    """
+    index = load_index(recording_dir)
+    chunks = index['chunks']
+    if not chunks:
+        raise ValueError(f"记录为空: {recording_dir}")
+    if cache_dir is None:
+        cache_dir = os.path.join(recording_dir, 'columns')
+    total_steps = sum(chunk['num_steps'] for chunk in chunks)
+    data_keys = sorted(set().union(*(set(chunk['keys']) for chunk in chunks)))
+    partial_keys = [key for key in data_keys if any(key not in chunk['keys'] for chunk in chunks)]
+    paths = {key: os.path.join(cache_dir, f"{key}.npy") for key in data_keys}
+    for key in partial_keys:
+        paths[PRESENT_PREFIX + key] = os.path.join(cache_dir, f"{PRESENT_PREFIX}{key}.npy")
+    keys = sorted(paths)
+
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if meta.get('total_steps') == total_steps and meta.get('keys') == keys:
+            return paths
+
+    os.makedirs(cache_dir, exist_ok=True)
+    columns = {}
+    masks = {
+        key: np.lib.format.open_memmap(paths[PRESENT_PREFIX + key], mode='w+', dtype=np.bool_, shape=(total_steps,))
+        for key in partial_keys
+    }
+    position = 0
+    for chunk in chunks:
+        with np.load(os.path.join(recording_dir, chunk['file'])) as data:
+            for key in chunk['keys']:
+                values = data[key]
+                if key not in columns:
+                    # 新建的内存映射文件内容为0，前面缺少该列的分块即为补0
+                    columns[key] = np.lib.format.open_memmap(
+                        paths[key], mode='w+', dtype=values.dtype, shape=(total_steps,) + values.shape[1:]
+                    )
+                elif values.shape[1:] != columns[key].shape[1:] or values.dtype != columns[key].dtype:
+                    raise ValueError(
+                        f"分块 {chunk['file']} 的列 {key} 为 {values.dtype}{values.shape[1:]}，"
+                        f"与之前的分块 {columns[key].dtype}{columns[key].shape[1:]} 不一致"
+                    )
+                columns[key][position:position + len(values)] = values
+                if key in masks:
+                    masks[key][position:position + len(values)] = True
+        position += chunk['num_steps']
+    columns.update(masks)
+    for column in columns.values():
+        column.flush()
+    del columns
+
+    with open(meta_path, 'w') as f:
+        json.dump({'total_steps': total_steps, 'keys': keys}, f, indent=4)
+    return paths
+
+
+class ReplayEnv:
+    """离线回放环境：从记录目录读取回合数据，提供与AutonomousScenario相同的env_reset/env_step/get_observation接口
+
+    数据以内存映射方式读取，不需要CARLA服务器和GPU。动作只用于接口兼容，
+    回放的是记录时的轨迹，记录的动作放在info['logged_action']里。
+    reward_fn(observation, collision)可以替换记录的奖励，用于离线调试奖励函数。
+    每个回合最后一步的下一观察没有记录，沿用最后一步的观察。
+    缺少观察或动作的步被跳过，回合在这些步处断开成多段，每段按一个回合回放。
+    """
+    def __init__(self, recording_dir, flat_observations=False, reward_fn=None, shuffle=False, seed=None):
+        self.recording_dir = recording_dir
+        self.flat_observations = flat_observations
+        self.reward_fn = reward_fn
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        self.observation_layout = ObservationLayout()
+
+        paths = consolidate_recording(recording_dir)
+        self.columns = {key: np.load(path, mmap_mode='r') for key, path in paths.items()}
+        self.observation_keys = {
+            key[len('observation.'):]: key for key in self.columns if key.startswith('observation.')
+        }
+        if not self.observation_keys and 'observation' not in self.columns:
+            raise ValueError(f"记录中没有观察数据: {recording_dir}")
+
+        # 观察和动作都有记录的步
+        episode_ids = np.asarray(self.columns['episode'])
+        present = np.ones(len(episode_ids), dtype=bool)
+        for key in list(self.observation_keys.values()) + ['observation', 'action']:
+            mask = self.columns.get(PRESENT_PREFIX + key)
+            if mask is not None:
+                present &= np.asarray(mask)
+        if not present.any():
+            raise ValueError(f"记录中没有同时包含观察和动作的步: {recording_dir}")
+        self.skipped_steps = int(len(present) - present.sum())
+        if self.skipped_steps:
+            print(f"{self.skipped_steps} 步缺少观察或动作，回放时跳过")
+
+        # 回合边界（缺失的步处断开）
+        changed = (episode_ids[1:] != episode_ids[:-1]) | (present[1:] != present[:-1])
+        starts = np.flatnonzero(np.r_[True, changed])
+        ends = np.r_[starts[1:], len(episode_ids)]
+        keep = present[starts]
+        self.episodes = list(zip(starts[keep].tolist(), ends[keep].tolist()))
+        self.episode_ids = episode_ids[starts[keep]].tolist()
+
+        self.episode = -1
+        self.position = None
+        self.episode_end = None
+        self.episode_reward = 0.0
+
+    def __len__(self):
+        return len(self.columns['episode'])
+
+    def get_observation(self, out=None, index=None):
+        """当前（或第index步）的观察，格式与AutonomousScenario.get_observation一致"""
+        if index is None:
+            index = self.position
+        if index is None:
+            return None
+        if 'observation' in self.columns:
+            buffer = out if out is not None else self.observation_layout.allocate()
+            buffer[:] = self.columns['observation'][index]
+            return buffer if self.flat_observations else self.observation_layout.views(buffer)
+        observation = {name: np.array(self.columns[key][index]) for name, key in self.observation_keys.items()}
+        if self.flat_observations:
+            return self.observation_layout.flatten(observation, out)
+        return observation
+
+    def _value(self, key, index, default=None):
+        column = self.columns.get(key)
+        return default if column is None else column[index]
+
+    def env_reset(self):
+        """开始下一个回合（按顺序循环，shuffle时随机），返回初始观察"""
+        if self.shuffle:
+            self.episode = int(self.rng.integers(len(self.episodes)))
+        else:
+            self.episode = (self.episode + 1) % len(self.episodes)
+        self.position, self.episode_end = self.episodes[self.episode]
+        self.episode_reward = 0.0
+        return self.get_observation()
+
+    def env_step(self, action):
+        """推进一步，返回(观察, 奖励, 是否结束, 信息)"""
+        if self.position is None:
+            raise RuntimeError("请先调用env_reset()")
+        index = self.position
+        collision = bool(self._value('collision', index, False))
+        last = index + 1 >= self.episode_end
+        next_index = index if last else index + 1
+        observation = self.get_observation(index=next_index)
+
+        if self.reward_fn is not None:
+            # 与AutonomousScenario._compute_reward一致：碰撞时按上一步观察计算
+            reward_observation = self.get_observation(index=index) if collision else observation
+            reward = float(self.reward_fn(reward_observation, collision))
+        else:
+            reward = float(self._value('reward', index, 0.0))
+        self.episode_reward += reward
+
+        done = bool(self._value('done', index, False)) or last
+        self.position = next_index
+        info = {
+            'frame': int(self._value('sim_frame', index, index)),
+            'collision': collision,
+            'episode_reward': self.episode_reward,
+            'episode': self.episode_ids[self.episode],
+            'logged_action': np.array(self._value('action', index))
+        }
+        return observation, reward, done, info
+
+    def fill_replay_buffer(self, replay_buffer):
+        """把全部记录的转移写入回放池（离线强化学习），返回写入条数"""
+        stored = 0
+        for start, end in self.episodes:
+            for index in range(start, end):
+                last = index + 1 >= end
+                stored += bool(replay_buffer.store_experience(
+                    self.get_observation(index=index),
+                    np.array(self.columns['action'][index]),
+                    float(self._value('reward', index, 0.0)),
+                    self.get_observation(index=index if last else index + 1),
+                    bool(self._value('done', index, False)) or last
+                ))
+        return stored
+
+    def close(self):
+        """释放内存映射"""
+        self.columns = {}
+
+
+def make_replay_env(host, port, tm_port, scenario_kwargs):
+    """MultiCarlaEnv的环境工厂：scenario_kwargs需要包含recording_dir，配合launch_servers=False使用"""
+    return ReplayEnv(**scenario_kwargs)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+import collections
+import numpy as np
+
+
+class RouteCache:
+    """前方路点缓存：环形缓冲区保存前瞻路点，只在主车越过第一个路点时向前补充
+
+    同一帧内车道投影只做一次，车道信息、路径信息和危险信息共享同一个投影路点。
+    """
+    def __init__(self, carla_map, lookahead=10, spacing=5.0, rpc_counter=None):
+        self.map = carla_map
+        self.lookahead = lookahead
+        self.spacing = spacing
+        self.rpc_counter = rpc_counter
+        self._buffer = collections.deque(maxlen=lookahead)  # [(waypoint, [x, y, z, yaw]), ...]
+        self._frame = None
+        self._waypoint = None
+        self._next_cache = {}
+
+    def _count(self, name):
+        if self.rpc_counter is not None:
+            self.rpc_counter.count(name)
+
+    def reset(self):
+        """清空缓存（重置场景或主车瞬移后调用）"""
+        self._buffer.clear()
+        self._frame = None
+        self._waypoint = None
+        self._next_cache.clear()
+
+    def _append_after(self, waypoint):
+        """在缓冲区末尾追加waypoint前方spacing米处的路点，道路尽头返回False"""
+        self._count('waypoint.next')
+        next_waypoints = waypoint.next(self.spacing)
+        if not next_waypoints:
+            return False
+        next_waypoint = next_waypoints[0]
+        location = next_waypoint.transform.location
+        self._buffer.append((next_waypoint, [
+            location.x, location.y, location.z, next_waypoint.transform.rotation.yaw
+        ]))
+        return True
+
+    def _rebuild(self, waypoint):
+        """从当前投影路点重新生成整个前瞻序列"""
+        self._buffer.clear()
+        current = waypoint
+        while len(self._buffer) < self.lookahead and self._append_after(current):
+            current = self._buffer[-1][0]
+
+    def _is_stale(self, waypoint, location):
+        """缓冲区和当前投影不一致时（换道、瞬移）需要重建"""
+        if not self._buffer:
+            return True
+        first = self._buffer[0][0]
+        if first.road_id == waypoint.road_id and first.lane_id != waypoint.lane_id:
+            return True
+        return first.transform.location.distance(location) > self.spacing * 2
+
+    def _has_passed(self, waypoint, location):
+        """主车是否已越过该路点（沿路点朝向的投影为正）"""
+        forward = waypoint.transform.get_forward_vector()
+        wp_location = waypoint.transform.location
+        return ((location.x - wp_location.x) * forward.x +
+                (location.y - wp_location.y) * forward.y) >= 0
+
+    def update(self, frame, location):
+        """投影当前位置并推进前瞻序列，同一帧内只计算一次，返回投影路点"""
+        if frame is not None and frame == self._frame:
+            return self._waypoint
+
+        self._count('map.get_waypoint')
+        waypoint = self.map.get_waypoint(location)
+
+        if self._is_stale(waypoint, location):
+            self._rebuild(waypoint)
+        else:
+            # 越过的路点出队，末尾补充新路点
+            while self._buffer and self._has_passed(self._buffer[0][0], location):
+                self._buffer.popleft()
+            tail = self._buffer[-1][0] if self._buffer else waypoint
+            while len(self._buffer) < self.lookahead and self._append_after(tail):
+                tail = self._buffer[-1][0]
+
+        self._frame = frame
+        self._waypoint = waypoint
+        self._next_cache.clear()
+        return waypoint
+
+    def next_waypoint(self, distance):
+        """当前投影路点前方distance米处的路点（同一帧内缓存）"""
+        if self._waypoint is None:
+            return None
+        if distance not in self._next_cache:
+            self._count('waypoint.next')
+            next_waypoints = self._waypoint.next(distance)
+            self._next_cache[distance] = next_waypoints[0] if next_waypoints else self._waypoint
+        return self._next_cache[distance]
+
+    def lookahead_array(self, out=None):
+        """返回(lookahead, 4)的前瞻路点数组，道路尽头不足时重复最后一个点；指定out时直接写入"""
+        if out is None:
+            out = np.zeros((self.lookahead, 4), dtype=np.float32)
+        rows = [row for _, row in self._buffer]
+        if not rows:
+            out[:] = 0
+            return out
+        out[:len(rows)] = rows
+        out[len(rows):] = rows[-1]
+        return out
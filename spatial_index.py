@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+import math
+import numpy as np
+
+
+class GridIndex:
+    """静态点集的二维均匀网格索引，按x/y分桶，距离按点的全部维度计算"""
+    def __init__(self, points, cell_size=50.0):
+        points = np.asarray(points, dtype=np.float64)
+        self.points = points if points.ndim == 2 else points.reshape(len(points), -1)
+        self.cell_size = float(cell_size)
+
+        # 按网格分桶，每个桶保存点的下标
+        buckets = {}
+        if len(self.points):
+            cells = np.floor(self.points[:, :2] / self.cell_size).astype(np.int64)
+            for i, (cx, cy) in enumerate(cells.tolist()):
+                buckets.setdefault((cx, cy), []).append(i)
+        self._buckets = {cell: np.array(indices, dtype=np.int64) for cell, indices in buckets.items()}
+
+    def __len__(self):
+        return len(self.points)
+
+    def _candidates(self, x, y, radius):
+        """返回半径覆盖到的网格内的所有点下标"""
+        min_cx = int(math.floor((x - radius) / self.cell_size))
+        max_cx = int(math.floor((x + radius) / self.cell_size))
+        min_cy = int(math.floor((y - radius) / self.cell_size))
+        max_cy = int(math.floor((y + radius) / self.cell_size))
+        found = []
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                indices = self._buckets.get((cx, cy))
+                if indices is not None:
+                    found.append(indices)
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(found)
+
+    def query_radius(self, point, radius):
+        """半径查询，返回(下标数组, 距离数组)"""
+        point = np.asarray(point, dtype=np.float64)
+        candidates = self._candidates(point[0], point[1], radius)
+        if len(candidates) == 0:
+            return candidates, np.zeros(0, dtype=np.float64)
+        offsets = self.points[candidates, :len(point)] - point
+        distances = np.sqrt(np.einsum('ij,ij->i', offsets, offsets))
+        mask = distances < radius
+        return candidates[mask], distances[mask]
+
+    def nearest(self, point, max_distance=None):
+        """max_distance内最近的点，返回(下标, 距离)，没有则返回(None, inf)
+
+        max_distance为None时不限距离：从一个网格开始逐次加倍搜索半径，直到覆盖整个点集。
+        """
+        if max_distance is not None:
+            indices, distances = self.query_radius(point, max_distance)
+            if len(indices) == 0:
+                return None, float('inf')
+            best = int(np.argmin(distances))
+            return int(indices[best]), float(distances[best])
+
+        if len(self.points) == 0:
+            return None, float('inf')
+        point = np.asarray(point, dtype=np.float64)
+        # 到点集包围盒最远角的距离，超过它一定能找到
+        corners = np.maximum(np.abs(self.points[:, :2].min(axis=0) - point[:2]),
+                             np.abs(self.points[:, :2].max(axis=0) - point[:2]))
+        limit = float(np.hypot(*corners))
+        radius = self.cell_size
+        while True:
+            index, distance = self.nearest(point, radius)
+            if index is not None or radius > limit:
+                return index, distance
+            radius *= 2
+
+    def query_box(self, min_x, min_y, max_x, max_y):
+        """矩形范围查询，返回落在矩形内（含边界）的点下标"""
+        center_x, center_y = (min_x + max_x) / 2, (min_y + max_y) / 2
+        half = max(max_x - min_x, max_y - min_y) / 2
+        candidates = self._candidates(center_x, center_y, half)
+        if len(candidates) == 0:
+            return candidates
+        xy = self.points[candidates, :2]
+        mask = ((xy[:, 0] >= min_x) & (xy[:, 0] <= max_x) &
+                (xy[:, 1] >= min_y) & (xy[:, 1] <= max_y))
+        return np.sort(candidates[mask])
+
+
+class StaticActorIndex:
+    """不会移动的actor（交通信号灯、标志）的空间索引，每次加载地图时构建一次"""
+    def __init__(self, world, type_filter, map_name=None, cell_size=50.0):
+        self.map_name = map_name
+        self.actors = list(world.get_actors().filter(type_filter))
+        locations = [actor.get_location() for actor in self.actors]
+        self.grid = GridIndex(
+            np.array([[loc.x, loc.y, loc.z] for loc in locations], dtype=np.float64).reshape(-1, 3),
+            cell_size
+        )
+
+    def __len__(self):
+        return len(self.actors)
+
+    def nearest(self, location, max_distance):
+        """返回max_distance内最近的actor及距离，没有则返回(None, inf)"""
+        index, distance = self.grid.nearest((location.x, location.y, location.z), max_distance)
+        if index is None:
+            return None, distance
+        return self.actors[index], distance
@@ -6,21 +6,36 @@ import json
 import sys
 import os
 import math
+import numpy as np
+from map_tiles import RoadTileCache
+from spatial_index import GridIndex
+from map_cache import get_map_data
+from world_loader import acquire_world
 
 class SpawnPointSelector:
-    def __init__(self):
-        # 初始化Carla客户端
-        self.client = carla.Client('localhost', 2000)
-        self.client.set_timeout(4.0)
+    def __init__(self, map_name='Town03', offline=False):
+        self.client = None
+        self.world = None
+        if not offline:
+            # 初始化Carla客户端
+            self.client = carla.Client('localhost', 2000)
+            self.client.set_timeout(4.0)
+            
+            # 获取指定地图（服务器已是该地图时直接复用）
+            self.world = acquire_world(self.client, map_name, client_timeout=4.0)
+        
+        # 官方生成点和路网点从地图缓存读取，缓存缺失或地图变化时才查询服务器；离线模式只读缓存
+        self.map_data = get_map_data(self.world, map_name=map_name, waypoint_distance=2.0)
+        self.map_name = self.map_data.map_name
+        self.spawn_points = self.map_data.spawn_points  # (M, 6) x, y, z, pitch, yaw, roll
         
-        # 加载指定地图
-        self.client.load_world('Town03')
-        self.world = self.client.get_world()
-        self.map = self.world.get_map()
+        # 坐标数组，后续坐标变换全部向量化
+        self.waypoint_xy = np.ascontiguousarray(self.map_data.waypoint_xy)
+        self.spawn_xy = np.ascontiguousarray(self.map_data.spawn_xy)
+        self.spawn_yaw = np.ascontiguousarray(self.map_data.spawn_yaw)
         
-        # 获取官方生成点和路网点
-        self.spawn_points = self.map.get_spawn_points()
-        self.waypoints = self.map.generate_waypoints(2.0)
+        # 官方生成点的网格索引，点选和框选不再遍历所有生成点
+        self.spawn_index = GridIndex(self.spawn_xy, cell_size=50.0)
         
         # 计算地图边界
         self.calculate_map_bounds()
@@ -32,18 +47,104 @@ class SpawnPointSelector:
         self.screen = pygame.display.set_mode((self.width, self.height))
         pygame.display.set_caption('Carla Spawn Point Selector - Space to switch mode')
         
-        # 计算合适的缩放比例
+        # 计算合适的缩放比例（整图显示时的基础比例）
         self.calculate_scale()
+        self.base_scale = self.scale
+        
+        # 视口：缩放级别每级放大一倍，最高放大到约20像素/米
+        self.zoom_level = 0
+        self.max_zoom_level = min(8, max(0, math.ceil(math.log2(20.0 / self.base_scale))))
+        self.pan_step = 100  # 方向键平移像素数
+        self.dragging = False
+        self.update_view()
+        
+        # 路网和官方生成点按缩放级别切成瓦片缓存，只绘制可见瓦片
+        self.tiles = RoadTileCache(
+            self.waypoint_xy, self.spawn_xy, self.spawn_yaw,
+            origin=(self.map_bounds['min_x'], self.map_bounds['max_y']),
+            base_scale=self.base_scale,
+            max_level=self.max_zoom_level
+        )
+        
+        # 字体只创建一次，图例预渲染为透明叠加层
+        self.font = pygame.font.Font(None, 36)
+        self.legend_font = pygame.font.Font(None, 28)
+        self.legend = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
+        self.draw_legend(self.legend)
+        self.clock = pygame.time.Clock()
+        self.needs_redraw = True
         
         # 存储选择的点
         self.ego_point = None  # 主车只能有一个点
-        self.npc_points = []   # NPC可以有多个点
+        self.npc_selected = {}  # NPC可以有多个点：量化坐标 -> 生成点（保持选择顺序）
         self.selecting_ego = True
+        self.box_start = None  # 框选起点（屏幕坐标）
+        self.box_end = None
         
         # 加载已有的生成点
         self.spawn_points_file = 'spawn_points.json'
         self.load_spawn_points()
 
+    @staticmethod
+    def point_key(point):
+        """生成点按0.1米量化后的坐标，作为去重用的哈希键"""
+        return (int(round(point['x'] * 10)), int(round(point['y'] * 10)))
+
+    @property
+    def npc_points(self):
+        """已选择的NPC生成点列表"""
+        return list(self.npc_selected.values())
+
+    @npc_points.setter
+    def npc_points(self, points):
+        self.npc_selected = {self.point_key(point): point for point in points}
+
+    def spawn_point_dict(self, index):
+        """官方生成点转为保存用的字典"""
+        x, y, z, _, yaw, _ = self.spawn_points[index].tolist()
+        return {'x': x, 'y': y, 'z': z, 'yaw': yaw}
+
+    def pick_spawn_point(self, screen_pos):
+        """获取离点击位置最近的官方生成点，没有生成点时返回None"""
+        world_pos = self.screen_to_world(screen_pos)
+        index, _ = self.spawn_index.nearest((world_pos.x, world_pos.y))
+        if index is None:
+            return None
+        return self.spawn_point_dict(index)
+
+    def toggle_point(self, point):
+        """点选：已选中的点移除，否则选中"""
+        key = self.point_key(point)
+        if self.selecting_ego:
+            # 如果点击的是当前主车点位置，则移除它
+            if self.ego_point and self.point_key(self.ego_point) == key:
+                self.ego_point = None
+            else:
+                self.ego_point = point
+        else:
+            # 如果点击的是已有的NPC点，则移除它
+            if key in self.npc_selected:
+                del self.npc_selected[key]
+            else:
+                self.npc_selected[key] = point
+
+    def select_box(self, start, end, remove=False):
+        """框选范围内的所有官方生成点加入NPC点（remove=True时移除），返回处理的点数"""
+        corner_a = self.screen_to_world(start)
+        corner_b = self.screen_to_world(end)
+        indices = self.spawn_index.query_box(
+            min(corner_a.x, corner_b.x), min(corner_a.y, corner_b.y),
+            max(corner_a.x, corner_b.x), max(corner_a.y, corner_b.y)
+        )
+        for index in indices.tolist():
+            point = self.spawn_point_dict(index)
+            key = self.point_key(point)
+            if remove:
+                self.npc_selected.pop(key, None)
+            else:
+                self.npc_selected.setdefault(key, point)
+        return len(indices)
+
     def load_spawn_points(self):
         if os.path.exists(self.spawn_points_file):
             try:
@@ -58,7 +159,7 @@ class SpawnPointSelector:
         data = {
             'ego_point': self.ego_point,
             'npc_points': self.npc_points,
-            'map_name': self.map.name
+            'map_name': self.map_name
         }
         with open(self.spawn_points_file, 'w') as f:
             json.dump(data, f, indent=4)
@@ -66,20 +167,19 @@ class SpawnPointSelector:
 
     def calculate_map_bounds(self):
         """计算地图边界"""
-        # 同时考虑路网点和生成点来计算边界
-        x_coords = ([wp.transform.location.x for wp in self.waypoints] + 
-                   [sp.location.x for sp in self.spawn_points])
-        y_coords = ([wp.transform.location.y for wp in self.waypoints] +
-                   [sp.location.y for sp in self.spawn_points])
+        # 同时考虑路网点和生成点来计算边界（地图缓存中已算好）
+        min_x, min_y, max_x, max_y = self.map_data.bounds.tolist()
         
         # 扩大边界确保显示完整
         margin = 50  # 米
         self.map_bounds = {
-            'min_x': min(x_coords) - margin,
-            'max_x': max(x_coords) + margin,
-            'min_y': min(y_coords) - margin,
-            'max_y': max(y_coords) + margin
+            'min_x': float(min_x) - margin,
+            'max_x': float(max_x) + margin,
+            'min_y': float(min_y) - margin,
+            'max_y': float(max_y) + margin
         }
+        self.center_x = (self.map_bounds['min_x'] + self.map_bounds['max_x']) / 2
+        self.center_y = (self.map_bounds['min_y'] + self.map_bounds['max_y']) / 2
         
     def calculate_scale(self):
         """计算合适的缩放比例"""
@@ -94,154 +194,192 @@ class SpawnPointSelector:
         # 使用较小的缩放比例以确保地图完全显示
         self.scale = min(width_scale, height_scale)
 
+    def update_view(self):
+        """按当前缩放级别和视口中心计算屏幕左上角的全局像素坐标"""
+        self.scale = self.base_scale * (2 ** self.zoom_level)
+        self.view_left = int(round((self.center_x - self.map_bounds['min_x']) * self.scale - self.width / 2))
+        self.view_top = int(round((self.map_bounds['max_y'] - self.center_y) * self.scale - self.height / 2))
+        self.needs_redraw = True
+
+    def zoom_at(self, screen_pos, step):
+        """以screen_pos为中心缩放，光标下的世界坐标保持不动"""
+        level = max(0, min(self.max_zoom_level, self.zoom_level + step))
+        if level == self.zoom_level:
+            return
+        anchor = self.screen_to_world(screen_pos)
+        self.zoom_level = level
+        self.scale = self.base_scale * (2 ** level)
+        self.center_x = anchor.x - (screen_pos[0] - self.width / 2) / self.scale
+        self.center_y = anchor.y + (screen_pos[1] - self.height / 2) / self.scale
+        self.update_view()
+
+    def pan(self, dx, dy):
+        """按屏幕像素平移视口"""
+        self.center_x -= dx / self.scale
+        self.center_y += dy / self.scale
+        self.update_view()
+
+    def reset_view(self):
+        """恢复整图显示"""
+        self.zoom_level = 0
+        self.center_x = (self.map_bounds['min_x'] + self.map_bounds['max_x']) / 2
+        self.center_y = (self.map_bounds['min_y'] + self.map_bounds['max_y']) / 2
+        self.update_view()
+
     def world_to_screen(self, location):
-        """将世界坐标转换为屏幕坐标"""
-        center_x = (self.map_bounds['min_x'] + self.map_bounds['max_x']) / 2
-        center_y = (self.map_bounds['min_y'] + self.map_bounds['max_y']) / 2
-        
-        # 转换坐标
-        screen_x = self.width/2 + (location.x - center_x) * self.scale
-        screen_y = self.height/2 - (location.y - center_y) * self.scale
-        return (int(screen_x), int(screen_y))
+        """将世界坐标转换为屏幕坐标（与瓦片使用同一套像素网格）"""
+        screen_x = math.floor((location.x - self.map_bounds['min_x']) * self.scale) - self.view_left
+        screen_y = math.floor((self.map_bounds['max_y'] - location.y) * self.scale) - self.view_top
+        return (screen_x, screen_y)
+
+    def world_to_screen_array(self, xy):
+        """批量将(N, 2)世界坐标转换为(N, 2)整数屏幕坐标"""
+        screen = self.tiles.to_pixels(xy, self.zoom_level)
+        screen[:, 0] -= self.view_left
+        screen[:, 1] -= self.view_top
+        return screen
 
     def screen_to_world(self, screen_pos):
-        """将屏幕坐标转换为世界坐标"""
-        center_x = (self.map_bounds['min_x'] + self.map_bounds['max_x']) / 2
-        center_y = (self.map_bounds['min_y'] + self.map_bounds['max_y']) / 2
-        
-        x = center_x + (screen_pos[0] - self.width/2) / self.scale
-        y = center_y - (screen_pos[1] - self.height/2) / self.scale
+        """将屏幕坐标转换为世界坐标（像素中心）"""
+        x = self.map_bounds['min_x'] + (screen_pos[0] + self.view_left + 0.5) / self.scale
+        y = self.map_bounds['max_y'] - (screen_pos[1] + self.view_top + 0.5) / self.scale
         return carla.Location(x=x, y=y, z=0.0)
 
-    def draw(self):
-        self.screen.fill((0, 0, 0))  # 黑色背景
-        
-        # 绘制背景路网点（灰色小点）
-        for wp in self.waypoints:
-            pos = self.world_to_screen(wp.transform.location)
-            pygame.draw.circle(self.screen, (50, 50, 50), pos, 1)
-        
-        # 绘制官方生成点和方向（白色）
-        for spawn_point in self.spawn_points:
-            pos = self.world_to_screen(spawn_point.location)
-            direction_length = 20
-            angle = math.radians(spawn_point.rotation.yaw)
-            end_pos = (
-                pos[0] + direction_length * math.cos(angle),
-                pos[1] - direction_length * math.sin(angle)
-            )
-            pygame.draw.circle(self.screen, (200, 200, 200), pos, 4)
-            pygame.draw.line(self.screen, (200, 200, 200), pos, end_pos, 2)
-        
-        # 绘制主车生成点（红色）
-        if self.ego_point:
-            loc = carla.Location(x=self.ego_point['x'], y=self.ego_point['y'], z=self.ego_point['z'])
-            pos = self.world_to_screen(loc)
-            angle = math.radians(self.ego_point.get('yaw', 0))
-            end_pos = (
-                pos[0] + direction_length * math.cos(angle),
-                pos[1] - direction_length * math.sin(angle)
-            )
-            pygame.draw.circle(self.screen, (255, 0, 0), pos, 6)
-            pygame.draw.line(self.screen, (255, 0, 0), pos, end_pos, 2)
-        
-        # 绘制NPC生成点（蓝色）
-        for point in self.npc_points:
-            loc = carla.Location(x=point['x'], y=point['y'], z=point['z'])
-            pos = self.world_to_screen(loc)
-            angle = math.radians(point.get('yaw', 0))
-            end_pos = (
-                pos[0] + direction_length * math.cos(angle),
-                pos[1] - direction_length * math.sin(angle)
-            )
-            pygame.draw.circle(self.screen, (0, 0, 255), pos, 6)
-            pygame.draw.line(self.screen, (0, 0, 255), pos, end_pos, 2)
-        
-        # 显示当前模式和计数
-        font = pygame.font.Font(None, 36)
-        mode_text = "Current Mode: EGO Vehicle (Only one)" if self.selecting_ego else f"Current Mode: NPC Vehicle ({len(self.npc_points)})"
-        text_surface = font.render(mode_text, True, (255, 255, 255))
-        self.screen.blit(text_surface, (10, 10))
-        
-        # 显示图例
-        legend_font = pygame.font.Font(None, 28)
+    def draw_legend(self, surface):
+        """绘制图例和操作说明（静态文字）"""
+        legend_font = self.legend_font
         legend_y = 50
         legend_spacing = 25
         
         # 白色点说明
         white_text = "White Points: Available Spawn Points"
         white_surface = legend_font.render(white_text, True, (200, 200, 200))
-        self.screen.blit(white_surface, (10, legend_y))
+        surface.blit(white_surface, (10, legend_y))
         
         # 红色点说明
         red_text = "Red Point: Selected EGO Vehicle (Click again to remove)"
         red_surface = legend_font.render(red_text, True, (255, 0, 0))
-        self.screen.blit(red_surface, (10, legend_y + legend_spacing))
+        surface.blit(red_surface, (10, legend_y + legend_spacing))
         
         # 蓝色点说明
         blue_text = "Blue Points: Selected NPC Vehicles (Click to remove)"
         blue_surface = legend_font.render(blue_text, True, (0, 0, 255))
-        self.screen.blit(blue_surface, (10, legend_y + legend_spacing * 2))
+        surface.blit(blue_surface, (10, legend_y + legend_spacing * 2))
         
         # 箭头说明
         arrow_text = "Arrow: Vehicle Forward Direction"
         arrow_surface = legend_font.render(arrow_text, True, (200, 200, 200))
-        self.screen.blit(arrow_surface, (10, legend_y + legend_spacing * 3))
+        surface.blit(arrow_surface, (10, legend_y + legend_spacing * 3))
         
         # 显示地图名称
-        map_text = f"Current Map: {self.map.name}"
+        map_text = f"Current Map: {self.map_name}"
         map_surface = legend_font.render(map_text, True, (200, 200, 200))
-        self.screen.blit(map_surface, (10, legend_y + legend_spacing * 4))
+        surface.blit(map_surface, (10, legend_y + legend_spacing * 4))
         
         # 显示操作说明
+        view_text = "Wheel / +/-: Zoom | Middle Drag / Arrows: Pan | Home: Reset View"
+        view_surface = legend_font.render(view_text, True, (200, 200, 200))
+        surface.blit(view_surface, (10, self.height - 60))
+        
+        box_text = "NPC Mode: Shift+Drag: Box Select | Ctrl+Drag: Box Remove"
+        box_surface = legend_font.render(box_text, True, (200, 200, 200))
+        surface.blit(box_surface, (10, self.height - 85))
+        
         help_text = "Left Click: Select/Remove Spawn Point | Right Click: Save | Space: Switch Mode | ESC: Exit"
-        help_surface = font.render(help_text, True, (200, 200, 200))
-        self.screen.blit(help_surface, (10, self.height - 30))
+        help_surface = self.font.render(help_text, True, (200, 200, 200))
+        surface.blit(help_surface, (10, self.height - 30))
+
+    def draw_selected_point(self, point, color):
+        """绘制已选择的生成点和方向"""
+        pos = self.world_to_screen(carla.Location(x=point['x'], y=point['y'], z=point['z']))
+        angle = math.radians(point.get('yaw', 0))
+        direction_length = 20
+        end_pos = (
+            pos[0] + direction_length * math.cos(angle),
+            pos[1] - direction_length * math.sin(angle)
+        )
+        pygame.draw.circle(self.screen, color, pos, 6)
+        pygame.draw.line(self.screen, color, pos, end_pos, 2)
+
+    def draw(self):
+        """贴可见瓦片，再叠加选择点、图例和模式文字"""
+        self.screen.fill((0, 0, 0))  # 黑色背景
+        self.tiles.draw(self.screen, self.zoom_level, self.view_left, self.view_top)
+        
+        # 绘制主车生成点（红色）
+        if self.ego_point:
+            self.draw_selected_point(self.ego_point, (255, 0, 0))
+        
+        # 绘制NPC生成点（蓝色）
+        for point in self.npc_points:
+            self.draw_selected_point(point, (0, 0, 255))
+        
+        # 框选矩形
+        if self.box_start is not None and self.box_end is not None:
+            rect = pygame.Rect(self.box_start, (0, 0))
+            rect.union_ip(pygame.Rect(self.box_end, (0, 0)))
+            pygame.draw.rect(self.screen, (255, 255, 0), rect, 1)
+        
+        # 显示当前模式和计数
+        mode_text = "Current Mode: EGO Vehicle (Only one)" if self.selecting_ego else f"Current Mode: NPC Vehicle ({len(self.npc_points)})"
+        text_surface = self.font.render(mode_text, True, (255, 255, 255))
+        self.screen.blit(text_surface, (10, 10))
+        self.screen.blit(self.legend, (0, 0))
         
         pygame.display.flip()
+        self.needs_redraw = False
 
     def run(self):
         running = True
+        pygame.key.set_repeat(300, 30)  # 按住方向键连续平移
         while running:
-            for event in pygame.event.get():
+            # 没有事件时阻塞等待，空闲时不占用CPU
+            events = [pygame.event.wait()] + pygame.event.get()
+            for event in events:
                 if event.type == pygame.QUIT:
                     running = False
                 
+                elif event.type == pygame.VIDEOEXPOSE:
+                    self.needs_redraw = True
+                
+                elif event.type == pygame.MOUSEWHEEL:
+                    self.zoom_at(pygame.mouse.get_pos(), 1 if event.y > 0 else -1)
+                
+                elif event.type == pygame.MOUSEMOTION and self.dragging:
+                    self.pan(*event.rel)
+                
+                elif event.type == pygame.MOUSEMOTION and self.box_start is not None:
+                    self.box_end = event.pos
+                    self.needs_redraw = True
+                
+                elif event.type == pygame.MOUSEBUTTONUP and event.button == 2:
+                    self.dragging = False
+                
+                elif event.type == pygame.MOUSEBUTTONUP and event.button == 1 and self.box_start is not None:
+                    # Ctrl框选移除，Shift框选加入
+                    remove = bool(pygame.key.get_mods() & pygame.KMOD_CTRL)
+                    count = self.select_box(self.box_start, event.pos, remove=remove)
+                    print(f"框选{'移除' if remove else '加入'} {count} 个生成点")
+                    self.box_start = None
+                    self.box_end = None
+                    self.needs_redraw = True
+                
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     if event.button == 1:  # 左键点击
-                        world_pos = self.screen_to_world(event.pos)
-                        # 获取最近的官方生成点
-                        closest_point = min(self.spawn_points, 
-                                         key=lambda sp: math.sqrt(
-                                             (sp.location.x - world_pos.x)**2 + 
-                                             (sp.location.y - world_pos.y)**2))
-                        point = {
-                            'x': closest_point.location.x,
-                            'y': closest_point.location.y,
-                            'z': closest_point.location.z,
-                            'yaw': closest_point.rotation.yaw
-                        }
-                        
-                        if self.selecting_ego:
-                            # 如果点击的是当前主车点位置，则移除它
-                            if (self.ego_point and 
-                                abs(self.ego_point['x'] - point['x']) < 0.1 and 
-                                abs(self.ego_point['y'] - point['y']) < 0.1):
-                                self.ego_point = None
-                            else:
-                                self.ego_point = point
+                        self.needs_redraw = True
+                        if (not self.selecting_ego and
+                                pygame.key.get_mods() & (pygame.KMOD_SHIFT | pygame.KMOD_CTRL)):
+                            # NPC模式下按住Shift/Ctrl拖动框选
+                            self.box_start = event.pos
+                            self.box_end = event.pos
                         else:
-                            # 如果点击的是已有的NPC点，则移除它
-                            remove_idx = None
-                            for i, npc_point in enumerate(self.npc_points):
-                                if (abs(npc_point['x'] - point['x']) < 0.1 and 
-                                    abs(npc_point['y'] - point['y']) < 0.1):
-                                    remove_idx = i
-                                    break
-                            if remove_idx is not None:
-                                self.npc_points.pop(remove_idx)
-                            else:
-                                self.npc_points.append(point)
+                            # 获取最近的官方生成点
+                            point = self.pick_spawn_point(event.pos)
+                            if point is not None:
+                                self.toggle_point(point)
+                    
+                    elif event.button == 2:  # 中键拖动平移
+                        self.dragging = True
                     
                     elif event.button == 3:  # 右键点击
                         self.save_spawn_points()
@@ -249,16 +387,35 @@ class SpawnPointSelector:
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_SPACE:
                         self.selecting_ego = not self.selecting_ego
+                        self.needs_redraw = True
                     elif event.key == pygame.K_ESCAPE:
                         running = False
+                    elif event.key in (pygame.K_EQUALS, pygame.K_PLUS, pygame.K_KP_PLUS):
+                        self.zoom_at((self.width // 2, self.height // 2), 1)
+                    elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                        self.zoom_at((self.width // 2, self.height // 2), -1)
+                    elif event.key == pygame.K_HOME:
+                        self.reset_view()
+                    elif event.key == pygame.K_LEFT:
+                        self.pan(self.pan_step, 0)
+                    elif event.key == pygame.K_RIGHT:
+                        self.pan(-self.pan_step, 0)
+                    elif event.key == pygame.K_UP:
+                        self.pan(0, self.pan_step)
+                    elif event.key == pygame.K_DOWN:
+                        self.pan(0, -self.pan_step)
             
-            self.draw()
+            # 选择状态变化时才重绘
+            if self.needs_redraw:
+                self.draw()
+                self.clock.tick(60)  # 拖动、缩放时限制在60帧
         
         pygame.quit()
 
 if __name__ == '__main__':
     try:
-        selector = SpawnPointSelector()
+        # --offline: 不连接服务器，只使用本地地图缓存
+        selector = SpawnPointSelector(offline='--offline' in sys.argv)
         selector.run()
     except KeyboardInterrupt:
         print('\n退出程序')
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+import math
+import time
+
+
+class WallClock:
+    """默认时间源：真实时间"""
+    def now(self):
+        return time.perf_counter()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class ManualClock:
+    """手动推进的时间源，配合假world做离线测试"""
+    def __init__(self, start=0.0):
+        self.current = start
+
+    def now(self):
+        return self.current
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.current += seconds
+
+
+class SteppingEngine:
+    """同步模式固定步长驱动：客户端调用world.tick()推进仿真，轮次按仿真帧计时
+
+    指定rpc_counter时world.tick()计为一次RPC（异步模式的wait_for_tick只是等待服务器推送，不计）。
+    """
+    def __init__(self, world, fixed_delta_seconds=0.05, synchronous=True, no_rendering=False,
+                 realtime=True, traffic_manager=None, time_source=None, rpc_counter=None):
+        self.world = world
+        self.rpc_counter = rpc_counter
+        self.fixed_delta_seconds = fixed_delta_seconds
+        self.synchronous = synchronous
+        self.no_rendering = no_rendering
+        # 无渲染模式下不限速，训练可以快于真实时间
+        self.realtime = realtime and not no_rendering
+        self.traffic_manager = traffic_manager
+        self.time_source = time_source if time_source is not None else WallClock()
+
+        self.frame = 0
+        self.sim_time = 0.0
+        self.round_start_frame = 0
+        self.round_start_time = 0.0
+        self._original_settings = None
+        self._last_tick_wall = None
+
+    def enable(self):
+        """应用同步模式和固定步长设置，保存原设置以便退出时恢复"""
+        settings = self.world.get_settings()
+        self._original_settings = (
+            settings.synchronous_mode,
+            settings.fixed_delta_seconds,
+            settings.no_rendering_mode
+        )
+        settings.synchronous_mode = self.synchronous
+        settings.fixed_delta_seconds = self.fixed_delta_seconds if self.synchronous else None
+        settings.no_rendering_mode = self.no_rendering
+        self.world.apply_settings(settings)
+        if self.traffic_manager is not None:
+            self.traffic_manager.set_synchronous_mode(self.synchronous)
+        self._last_tick_wall = self.time_source.now()
+        self.tick()
+        self.start_round()
+
+    def restore(self):
+        """恢复进入前的服务器设置，避免服务器停在同步模式"""
+        if self._original_settings is None:
+            return
+        settings = self.world.get_settings()
+        (settings.synchronous_mode,
+         settings.fixed_delta_seconds,
+         settings.no_rendering_mode) = self._original_settings
+        self.world.apply_settings(settings)
+        if self.traffic_manager is not None:
+            self.traffic_manager.set_synchronous_mode(self._original_settings[0])
+        self._original_settings = None
+
+    @property
+    def enabled(self):
+        """是否已应用同步设置"""
+        return self._original_settings is not None
+
+    def tick(self):
+        """推进一帧，返回当前帧号"""
+        if self.synchronous:
+            if self.rpc_counter is not None:
+                self.rpc_counter.count('world.tick')
+            self.frame = self.world.tick()
+            self.sim_time += self.fixed_delta_seconds
+        else:
+            snapshot = self.world.wait_for_tick()
+            self.frame = snapshot.frame
+            self.sim_time = snapshot.timestamp.elapsed_seconds
+
+        # 显示画面时按真实时间限速
+        if self.realtime and self.synchronous:
+            now = self.time_source.now()
+            if self._last_tick_wall is not None:
+                self.time_source.sleep(self.fixed_delta_seconds - (now - self._last_tick_wall))
+            self._last_tick_wall = self.time_source.now()
+        return self.frame
+
+    def settle(self, seconds):
+        """等待生成/销毁生效：同步模式推进一帧即可，异步模式退回到sleep"""
+        if self.synchronous:
+            self.tick()
+        else:
+            self.time_source.sleep(seconds)
+
+    def seconds_to_frames(self, seconds):
+        """仿真秒数换算为帧数"""
+        return int(math.ceil(seconds / self.fixed_delta_seconds))
+
+    def start_round(self):
+        """记录新一轮的起始帧"""
+        self.round_start_frame = self.frame
+        self.round_start_time = self.sim_time
+
+    def round_elapsed(self):
+        """本轮已经过的仿真时间（秒）"""
+        if self.synchronous:
+            return (self.frame - self.round_start_frame) * self.fixed_delta_seconds
+        return self.sim_time - self.round_start_time
+
+    def round_elapsed_frames(self):
+        """本轮已经过的仿真帧数"""
+        return self.frame - self.round_start_frame
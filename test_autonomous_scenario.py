@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+"""AutonomousScenario环境接口（env_reset/env_step）测试，使用fake_carla，不需要CARLA服务器
+
+    python -m pytest test_autonomous_scenario.py
+"""
+
+import os
+import numpy as np
+import pytest
+
+import benchmark
+import fake_carla
+
+
+@pytest.fixture(scope='module')
+def scenario(tmp_path_factory):
+    fake_carla.install(blocks=(6, 6), seed=0)
+    benchmark.install_agent_stub()
+    from autonomous_scenario import AutonomousScenario
+
+    # 场景在当前目录读写spawn_points.json和输出目录
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('scenario'))
+    scenario = None
+    try:
+        benchmark.write_spawn_points('spawn_points.json', 5)
+        scenario = AutonomousScenario(headless=True, record_episodes=False)
+        yield scenario
+    finally:
+        if scenario is not None:
+            scenario.close()
+        os.chdir(cwd)
+        fake_carla.reset()
+
+
+def test_env_reset_returns_observation(scenario):
+    observation = scenario.env_reset()
+    assert observation is not None
+    assert observation['velocity'].shape == (3,)
+    assert scenario.ego_vehicle is not None
+    assert len(scenario.npc_vehicles) == 5
+
+
+def test_env_step_applies_action_and_advances(scenario):
+    scenario.env_reset()
+    frame = scenario.stepping.frame
+    observation, reward, done, info = scenario.env_step(np.array([0.7, -0.2, 0.0], dtype=np.float32))
+
+    control = scenario.ego_vehicle.get_control()
+    assert control.throttle == pytest.approx(0.7)
+    assert control.steer == pytest.approx(-0.2)
+    assert control.brake == pytest.approx(0.0)
+    assert scenario.stepping.frame == frame + 1
+    assert info['frame'] == scenario.stepping.frame
+    assert observation is not None
+    assert isinstance(reward, float)
+    assert not done
+
+
+def test_apply_rl_action_clips_out_of_range_values(scenario):
+    scenario.env_reset()
+    scenario.apply_rl_action([1.5, -3.0, -0.5])
+    control = scenario.ego_vehicle.get_control()
+    assert control.throttle == pytest.approx(1.0)
+    assert control.steer == pytest.approx(-1.0)
+    assert control.brake == pytest.approx(0.0)
+
+
+@pytest.mark.parametrize('action', [[0.5, 0.0], [0.5, 0.0, 0.0, 0.0], 0.5, [0.5, float('nan'), 0.0]])
+def test_apply_rl_action_rejects_invalid_actions(scenario, action):
+    scenario.env_reset()
+    with pytest.raises(ValueError, match='动作'):
+        scenario.apply_rl_action(action)
+
+
+def test_env_step_ends_rpc_counter_tick(scenario):
+    scenario.env_reset()
+    ticks = len(scenario.rpc_counter.history)
+    for _ in range(3):
+        scenario.env_step([0.5, 0.0, 0.0])
+    assert len(scenario.rpc_counter.history) == ticks + 3
+
+
+def test_env_step_done_after_round_time(scenario):
+    round_time = scenario.round_time
+    scenario.round_time = 4 * scenario.stepping.fixed_delta_seconds
+    try:
+        scenario.env_reset()
+        done = False
+        steps = 0
+        while not done and steps < 20:
+            _, _, done, _ = scenario.env_step([0.0, 0.0, 1.0])
+            steps += 1
+        assert done
+        assert steps <= 5
+    finally:
+        scenario.round_time = round_time
+
+
+def collision_reward(observation, collision=False, off_road=False):
+    return -10.0 if collision else 1.0
+
+
+def test_env_only_mode_skips_agent(scenario):
+    from autonomous_scenario import AutonomousScenario
+
+    env = AutonomousScenario(headless=True, record_episodes=False, with_agent=False, reward_fn=collision_reward)
+    try:
+        assert env.rl_agent is None
+        assert env.learner is None
+        assert env.replay_buffer is None
+        assert env._compute_reward(None, collision=True) == -10.0
+    finally:
+        env.close()
+
+
+def test_env_only_mode_requires_reward_fn(scenario):
+    from autonomous_scenario import AutonomousScenario
+
+    with pytest.raises(ValueError, match='reward_fn'):
+        AutonomousScenario(headless=True, record_episodes=False, with_agent=False)
+
+
+def test_column_replay_buffer_is_opt_in(scenario, tmp_path):
+    from autonomous_scenario import AutonomousScenario
+
+    assert scenario.replay_buffer is None
+    env = AutonomousScenario(headless=True, record_episodes=False, replay_buffer_capacity=16,
+                             replay_buffer_dir=str(tmp_path))
+    try:
+        assert env.rl_agent.replay_buffer is env.replay_buffer
+        env.learner.start()
+        env.learner.push(scenario.get_observation(), np.zeros(3), 1.0, scenario.get_observation(), False)
+        env.learner.stop()  # 停止时剩余经验写入回放池
+    finally:
+        env.close()
+    assert len(env.replay_buffer) == 1
+    assert (tmp_path / 'meta.json').exists()
+
+
+def test_control_loop_reuses_observation_buffer(scenario):
+    scenario.env_reset()
+    scenario.last_observation = None
+    scenario.last_action = None
+    queue = scenario.learner.queue
+    while not queue.empty():
+        queue.get_nowait()
+
+    buffer = scenario._observation_buffer
+    for _ in range(3):
+        scenario.update_rl_control()
+        scenario.stepping.tick()
+    assert scenario._observation_buffer is buffer
+
+    # 经验中的观察是各自的副本，不随预分配缓冲区被覆盖
+    transitions = [queue.get_nowait() for _ in range(queue.qsize())]
+    assert len(transitions) == 2
+    observations = [transitions[0][0], transitions[0][3], transitions[1][3]]
+    assert transitions[1][0] is transitions[0][3]
+    assert not any(np.shares_memory(observation['location'], buffer) for observation in observations)
+    frames = [observation['location'].copy() for observation in observations]
+    scenario.update_rl_control()
+    for observation, location in zip(observations, frames):
+        np.testing.assert_array_equal(observation['location'], location)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""MultiCarlaEnv的进程通信测试，使用进程内的假环境，不需要CARLA服务器
+
+    python -m pytest test_multi_env.py
+"""
+
+import numpy as np
+import pytest
+
+# 工作进程会重新导入multi_env（及init_carla_server），需要真实的carla和psutil
+pytest.importorskip('carla')
+pytest.importorskip('psutil')
+from multi_env import MultiCarlaEnv
+
+
+class CountingEnv:
+    """观察为[端口, 步数]；动作为'fail'时抛出异常"""
+    def __init__(self, port):
+        self.port = port
+        self.steps = 0
+
+    def env_reset(self):
+        self.steps = 0
+        return np.array([self.port, self.steps], dtype=np.float32)
+
+    def env_step(self, action):
+        if action == 'fail':
+            raise ValueError("模拟的环境错误")
+        self.steps += 1
+        return np.array([self.port, self.steps], dtype=np.float32), 1.0, self.steps >= 3, {}
+
+    def close(self):
+        pass
+
+
+def make_counting_env(host, port, tm_port, scenario_kwargs):
+    return CountingEnv(port)
+
+
+def make_env(num_envs=3):
+    return MultiCarlaEnv(num_envs, launch_servers=False, env_factory=make_counting_env)
+
+
+def test_step_and_auto_reset():
+    env = make_env()
+    try:
+        observations = env.reset()
+        assert observations.shape == (3, 2)
+        np.testing.assert_array_equal(observations[:, 0], env.ports)
+        for step in range(1, 3):
+            observations, rewards, dones, infos = env.step([None] * 3)
+            np.testing.assert_array_equal(observations[:, 1], step)
+        observations, rewards, dones, infos = env.step([None] * 3)
+        assert dones.all()
+        # 回合结束后自动重置，终止观察放在info里
+        np.testing.assert_array_equal(observations[:, 1], 0)
+        assert all(info['terminal_observation'][1] == 3 for info in infos)
+    finally:
+        env.close()
+
+
+def test_worker_error_closes_env():
+    env = make_env()
+    try:
+        env.reset()
+        workers = list(env.workers)
+        with pytest.raises(RuntimeError, match=str(env.ports[1])):
+            env.step([None, 'fail', None])
+        # 其余工作进程的回复已读完，所有工作进程都已结束
+        assert not any(worker.is_alive() for worker in workers)
+        with pytest.raises(RuntimeError, match="环境已关闭"):
+            env.step([None] * 3)
+        with pytest.raises(RuntimeError, match="环境已关闭"):
+            env.reset()
+    finally:
+        env.close()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+"""encode_nearby_vehicles与原逐车循环的等价性测试
+
+    python -m pytest test_observation_utils.py
+"""
+
+import math
+import numpy as np
+import pytest
+
+from observation_utils import encode_nearby_vehicles
+
+
+class Vector:
+    """代替carla.Location/Vector3D的最小向量"""
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def __sub__(self, other):
+        return Vector(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def length(self):
+        return math.sqrt(self.x ** 2 + self.y ** 2 + self.z ** 2)
+
+
+def reference_vehicle_info(ego_location, ego_forward, ego_velocity, vehicles):
+    """向量化之前AutonomousScenario._get_nearby_vehicle_info的逐车循环"""
+    vehicle_info = np.zeros((8, 4), dtype=np.float32)
+    for vehicle_location, vehicle_velocity in vehicles:
+        relative_location = vehicle_location - ego_location
+        distance = relative_location.length()
+        if distance > 100.0:
+            continue
+
+        relative_velocity = math.sqrt(
+            (vehicle_velocity.x - ego_velocity.x) ** 2 +
+            (vehicle_velocity.y - ego_velocity.y) ** 2 +
+            (vehicle_velocity.z - ego_velocity.z) ** 2
+        )
+
+        angle = math.degrees(math.atan2(relative_location.y, relative_location.x))
+        angle = (angle - math.degrees(math.atan2(ego_forward.y, ego_forward.x))) % 360
+
+        sector = int((angle + 22.5) / 45) % 8
+
+        if relative_velocity > 0:
+            ttc = distance / relative_velocity
+        else:
+            ttc = 100.0
+
+        if vehicle_info[sector][0] == 0 or distance < vehicle_info[sector][0]:
+            vehicle_info[sector] = np.array([
+                distance,
+                relative_velocity,
+                ttc,
+                angle
+            ], dtype=np.float32)
+
+    return vehicle_info
+
+
+def encode(ego_location, ego_forward, ego_velocity, vehicles, out=None):
+    positions = np.array([[l.x, l.y, l.z] for l, _ in vehicles], dtype=np.float64).reshape(-1, 3)
+    velocities = np.array([[v.x, v.y, v.z] for _, v in vehicles], dtype=np.float64).reshape(-1, 3)
+    return encode_nearby_vehicles(ego_location, ego_forward, ego_velocity, positions, velocities, out=out)
+
+
+def assert_equivalent(ego_location, ego_forward, ego_velocity, vehicles):
+    expected = reference_vehicle_info(ego_location, ego_forward, ego_velocity, vehicles)
+    actual = encode(ego_location, ego_forward, ego_velocity, vehicles)
+    assert actual.shape == (8, 4)
+    assert actual.dtype == np.float32
+    np.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-4)
+    return actual
+
+
+def random_vehicles(rng, count, spread=150.0, static_fraction=0.0):
+    vehicles = []
+    for _ in range(count):
+        location = Vector(*rng.uniform(-spread, spread, 3) * np.array([1.0, 1.0, 0.02]))
+        if rng.random() < static_fraction:
+            velocity = Vector(0.0, 0.0, 0.0)
+        else:
+            velocity = Vector(*rng.uniform(-15.0, 15.0, 3))
+        vehicles.append((location, velocity))
+    return vehicles
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_random_scenes_match_reference(seed):
+    rng = np.random.default_rng(seed)
+    ego_location = Vector(*rng.uniform(-50.0, 50.0, 3))
+    yaw = rng.uniform(-math.pi, math.pi)
+    ego_forward = Vector(math.cos(yaw), math.sin(yaw), 0.0)
+    ego_velocity = Vector(*rng.uniform(-10.0, 10.0, 3))
+    vehicles = random_vehicles(rng, int(rng.integers(1, 200)), static_fraction=0.2)
+    assert_equivalent(ego_location, ego_forward, ego_velocity, vehicles)
+
+
+def test_no_vehicles():
+    info = assert_equivalent(Vector(), Vector(1.0, 0.0, 0.0), Vector(), [])
+    assert not info.any()
+
+
+def test_vehicles_beyond_100m_are_ignored():
+    ego_location = Vector(10.0, -5.0, 0.0)
+    vehicles = [
+        (Vector(10.0 + 100.5, -5.0, 0.0), Vector(1.0, 0.0, 0.0)),
+        (Vector(10.0, -5.0 - 150.0, 0.0), Vector()),
+        (Vector(10.0 - 80.0, -5.0 + 80.0, 0.0), Vector())
+    ]
+    info = assert_equivalent(ego_location, Vector(1.0, 0.0, 0.0), Vector(), vehicles)
+    assert not info.any()
+
+
+def test_vehicle_at_exactly_100m_is_kept():
+    vehicles = [(Vector(100.0, 0.0, 0.0), Vector())]
+    info = assert_equivalent(Vector(), Vector(1.0, 0.0, 0.0), Vector(), vehicles)
+    assert info[0, 0] == pytest.approx(100.0)
+
+
+def test_zero_relative_speed_uses_default_ttc():
+    ego_velocity = Vector(5.0, -2.0, 0.0)
+    vehicles = [
+        (Vector(20.0, 0.0, 0.0), Vector(5.0, -2.0, 0.0)),
+        (Vector(0.0, -30.0, 0.0), Vector(5.0, -2.0, 0.0))
+    ]
+    info = assert_equivalent(Vector(), Vector(1.0, 0.0, 0.0), ego_velocity, vehicles)
+    assert info[0, 1] == 0.0
+    assert info[0, 2] == pytest.approx(100.0)
+    assert info[6, 2] == pytest.approx(100.0)
+
+
+def test_tied_distances_keep_first_vehicle():
+    # 同一扇区内距离相同的两辆车：原循环只在更近时替换，保留先出现的一辆
+    vehicles = [
+        (Vector(30.0, 4.0, 0.0), Vector(1.0, 0.0, 0.0)),
+        (Vector(30.0, -4.0, 0.0), Vector(3.0, 0.0, 0.0)),
+        (Vector(-4.0, 30.0, 0.0), Vector(0.0, 2.0, 0.0)),
+        (Vector(4.0, 30.0, 0.0), Vector(0.0, 6.0, 0.0))
+    ]
+    info = assert_equivalent(Vector(), Vector(1.0, 0.0, 0.0), Vector(), vehicles)
+    assert info[0, 1] == pytest.approx(1.0)
+    assert info[2, 1] == pytest.approx(2.0)
+
+    reordered = [vehicles[1], vehicles[0], vehicles[3], vehicles[2]]
+    info = assert_equivalent(Vector(), Vector(1.0, 0.0, 0.0), Vector(), reordered)
+    assert info[0, 1] == pytest.approx(3.0)
+    assert info[2, 1] == pytest.approx(6.0)
+
+
+def test_out_buffer_is_cleared_and_reused():
+    rng = np.random.default_rng(100)
+    ego_forward = Vector(0.0, 1.0, 0.0)
+    out = np.full((8, 4), 7.0, dtype=np.float32)
+    result = encode(Vector(), ego_forward, Vector(), random_vehicles(rng, 50), out=out)
+    assert result is out
+
+    vehicles = [(Vector(0.0, 12.0, 0.0), Vector())]
+    result = encode(Vector(), ego_forward, Vector(), vehicles, out=out)
+    assert result is out
+    np.testing.assert_allclose(out, reference_vehicle_info(Vector(), ego_forward, Vector(), vehicles), atol=1e-4)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""ObservationReplayBuffer测试：写入、采样和磁盘回放池的重新打开
+
+    python -m pytest test_replay_buffer.py
+"""
+
+import numpy as np
+import pytest
+
+from replay_buffer import ObservationReplayBuffer
+
+
+def observation(i):
+    return {'velocity': np.full(3, i, dtype=np.float32), 'waypoints': np.full((10, 4), i, dtype=np.float32)}
+
+
+def fill(buffer, count):
+    for i in range(count):
+        buffer.store_experience(observation(i), np.full(3, i, dtype=np.float32), float(i), observation(i + 1), i % 2 == 0)
+
+
+def test_wraps_around_and_samples():
+    buffer = ObservationReplayBuffer(8, seed=0)
+    fill(buffer, 11)
+    assert len(buffer) == 8
+    assert buffer.position == 3
+    np.testing.assert_array_equal(buffer.observations['velocity'][:, 0], [8, 9, 10, 3, 4, 5, 6, 7])
+
+    observations, actions, rewards, next_observations, dones = buffer.sample(5)
+    assert observations['waypoints'].shape == (5, 10, 4)
+    assert actions.shape == (5, 3)
+    np.testing.assert_array_equal(next_observations['velocity'][:, 0], observations['velocity'][:, 0] + 1)
+    np.testing.assert_array_equal(rewards, actions[:, 0])
+
+
+def test_skips_missing_observation():
+    buffer = ObservationReplayBuffer(4)
+    assert not buffer.store_experience(None, np.zeros(3), 0.0, observation(0), False)
+    assert len(buffer) == 0
+
+
+def test_open_restores_mmap_buffer(tmp_path):
+    buffer = ObservationReplayBuffer(8, mmap_dir=str(tmp_path))
+    fill(buffer, 11)
+    buffer.flush()
+    del buffer
+
+    reopened = ObservationReplayBuffer.open(str(tmp_path), seed=0)
+    assert reopened.capacity == 8
+    assert len(reopened) == 8
+    assert reopened.position == 3
+    assert not reopened.flat
+    np.testing.assert_array_equal(reopened.observations['velocity'][:, 0], [8, 9, 10, 3, 4, 5, 6, 7])
+
+    # 接着写入，再次flush后位置和数据都能恢复
+    reopened.store_experience(observation(99), np.zeros(3), 0.0, observation(100), False)
+    reopened.flush()
+    again = ObservationReplayBuffer.open(str(tmp_path))
+    assert again.position == 4
+    assert again.observations['velocity'][3, 0] == 99
+
+
+def test_open_flat_buffer(tmp_path):
+    buffer = ObservationReplayBuffer(4, mmap_dir=str(tmp_path))
+    buffer.store_experience(np.ones(133, dtype=np.float32), np.zeros(3), 1.0, np.ones(133, dtype=np.float32), True)
+    buffer.flush()
+
+    reopened = ObservationReplayBuffer.open(str(tmp_path))
+    assert reopened.flat
+    observations, _, rewards, _, dones = reopened.sample(2)
+    assert observations.shape == (2, 133)
+    assert rewards[0] == 1.0 and dones[0]
+
+
+def test_open_without_meta_fails(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        ObservationReplayBuffer.open(str(tmp_path))
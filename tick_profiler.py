@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+
+import collections
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+import pygame
+
+
+class LatencyHistogram:
+    """HDR风格的对数线性直方图
+
+    以微秒为单位，每个2的幂区间再均分为2^sub_bucket_bits个子桶，相对误差约1/32；
+    记录只是一次整数运算和列表自增，桶数固定（60秒以内约700个），可以长时间运行。
+    """
+    def __init__(self, sub_bucket_bits=5, max_seconds=60.0):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.max_value = int(max_seconds * 1e6)
+        self.counts = [0] * (self._index(self.max_value) + 1)
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def _index(self, value):
+        """微秒值 -> 桶下标"""
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits - 1
+        return (shift << self.sub_bucket_bits) + (value >> shift)
+
+    def _upper_bound(self, index):
+        """桶内最大值（微秒），分位数按桶上界报告，偏保守"""
+        if index < self.sub_bucket_count:
+            return index
+        shift = (index >> self.sub_bucket_bits) - 1
+        top = index - (shift << self.sub_bucket_bits)
+        return ((top + 1) << shift) - 1
+
+    def record(self, seconds):
+        value = min(int(seconds * 1e6), self.max_value)
+        self.counts[self._index(max(value, 0))] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        """把另一个直方图的计数累加进来"""
+        for i, n in enumerate(other.counts):
+            if n:
+                self.counts[i] += n
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        """第q百分位（秒）"""
+        if self.count == 0:
+            return 0.0
+        target = max(1, int(math.ceil(q / 100.0 * self.count)))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(self._upper_bound(index) / 1e6, self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self):
+        """毫秒统计"""
+        return {
+            'count': self.count,
+            'mean_ms': round(self.mean() * 1000.0, 3),
+            'p50_ms': round(self.percentile(50) * 1000.0, 3),
+            'p90_ms': round(self.percentile(90) * 1000.0, 3),
+            'p99_ms': round(self.percentile(99) * 1000.0, 3),
+            'max_ms': round(self.max * 1000.0, 3)
+        }
+
+
+class _NullStage:
+    """未启用时的阶段计时器，什么都不做"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """一个阶段的计时上下文：耗时和期间的RPC次数"""
+    __slots__ = ('profiler', 'name', 'start', 'rpcs', 'previous')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        profiler = self.profiler
+        self.previous = profiler.current_stage
+        profiler.current_stage = self.name
+        self.rpcs = profiler.rpc_counter.total if profiler.rpc_counter is not None else 0
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        profiler = self.profiler
+        rpcs = profiler.rpc_counter.total - self.rpcs if profiler.rpc_counter is not None else 0
+        profiler._record(self.name, elapsed, rpcs)
+        profiler.current_stage = self.previous
+        return False
+
+
+class StackSampler:
+    """采样式剖析：后台线程按固定间隔抓取目标线程的调用栈，按阶段累计折叠栈
+
+    折叠栈格式（"阶段;模块:函数;..." 次数）可以直接交给flamegraph.pl / speedscope生成火焰图。
+    采样线程本身也要GIL，间隔不宜太小。
+    """
+    def __init__(self, profiler, interval=0.005, max_depth=40, thread_id=None):
+        self.profiler = profiler
+        self.interval = interval
+        self.max_depth = max_depth
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.stacks = collections.Counter()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None and len(names) < self.max_depth:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            stage = self.profiler.current_stage or 'idle'
+            self.stacks[';'.join([stage] + names[::-1])] += 1
+
+    def top(self, n=10):
+        """采样最多的叶子函数：[(阶段;函数, 次数), ...]"""
+        leaves = collections.Counter()
+        for stack, count in self.stacks.items():
+            parts = stack.split(';')
+            leaves[f"{parts[0]};{parts[-1]}"] += count
+        return leaves.most_common(n)
+
+    def write_folded(self, path):
+        """写出折叠栈文件"""
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def reset(self):
+        self.stacks.clear()
+
+
+class TickProfiler:
+    """主循环逐阶段计时
+
+    用法：每个阶段 with profiler.stage('draw'): ...，每轮循环结束调用 end_tick()。
+    每report_interval秒汇总一次各阶段的p50/p99和每次调用的RPC数（供界面叠加显示），
+    每export_interval秒把这段时间的汇总追加一行JSON到export_path。
+    enabled=False时stage()返回共享的空上下文，end_tick()直接返回，几乎没有开销。
+    """
+    def __init__(self, rpc_counter=None, enabled=True, report_interval=1.0, export_path=None,
+                 export_interval=10.0, sampling=False, sample_interval=0.005, extra_metrics=None):
+        self.rpc_counter = rpc_counter
+        self.enabled = enabled
+        self.report_interval = report_interval
+        self.export_path = export_path
+        self.export_interval = export_interval
+        self.extra_metrics = dict(extra_metrics or {})  # 名称 -> 返回字典的函数，导出时一并写入
+        self.current_stage = None
+        self.sampler = StackSampler(self, sample_interval) if enabled and sampling else None
+
+        # 当前汇总窗口和导出窗口的直方图
+        self._stages = {}
+        self._rpcs = collections.Counter()
+        self._export_stages = {}
+        self._export_rpcs = collections.Counter()
+        self._tick = LatencyHistogram()
+        self._export_tick = LatencyHistogram()
+        self._last_tick = None
+        self._window_start = time.perf_counter()
+        self._export_start = self._window_start
+        self._export_ticks = 0
+
+        self.report = None  # 最近一次汇总
+        self._overlay = None
+        self._overlay_report = None
+
+    def start(self):
+        if self.sampler is not None:
+            self.sampler.start()
+
+    def stage(self, name):
+        """阶段计时上下文"""
+        if not self.enabled:
+            return NULL_STAGE
+        return _Stage(self, name)
+
+    def _record(self, name, elapsed, rpcs):
+        histogram = self._stages.get(name)
+        if histogram is None:
+            histogram = self._stages[name] = LatencyHistogram()
+        histogram.record(elapsed)
+        self._rpcs[name] += rpcs
+
+    def end_tick(self):
+        """一轮主循环结束：记录整轮耗时，到时间时汇总和导出"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self._last_tick is not None:
+            self._tick.record(now - self._last_tick)
+        self._last_tick = now
+        if now - self._window_start >= self.report_interval:
+            self._summarize(now)
+        if self.export_path is not None and now - self._export_start >= self.export_interval:
+            self.export(now)
+
+    @staticmethod
+    def _stage_summaries(stages, rpcs):
+        summaries = {}
+        for name, histogram in stages.items():
+            summary = histogram.summary()
+            summary['rpcs_per_call'] = rpcs[name] / histogram.count if histogram.count else 0.0
+            summaries[name] = summary
+        return summaries
+
+    def _summarize(self, now):
+        """汇总当前窗口，并把窗口并入导出累计后清空"""
+        elapsed = now - self._window_start
+        self.report = {
+            'tick_rate': self._tick.count / elapsed if elapsed > 0 else 0.0,
+            'tick': self._tick.summary(),
+            'stages': self._stage_summaries(self._stages, self._rpcs)
+        }
+        self._export_tick.merge(self._tick)
+        self._export_ticks += self._tick.count
+        self._tick.reset()
+        for name, histogram in self._stages.items():
+            if name not in self._export_stages:
+                self._export_stages[name] = LatencyHistogram()
+            self._export_stages[name].merge(histogram)
+            histogram.reset()
+        self._export_rpcs.update(self._rpcs)
+        self._rpcs.clear()
+        self._window_start = now
+
+    def export(self, now=None):
+        """把上次导出以来的汇总追加一行JSON到export_path"""
+        if self.export_path is None:
+            return
+        now = now if now is not None else time.perf_counter()
+        elapsed = now - self._export_start
+        record = {
+            'time': time.time(),
+            'interval_sec': elapsed,
+            'ticks': self._export_ticks,
+            'tick_rate': self._export_ticks / elapsed if elapsed > 0 else 0.0,
+            'tick': self._export_tick.summary(),
+            'stages': self._stage_summaries(self._export_stages, self._export_rpcs)
+        }
+        if self.sampler is not None:
+            record['top_samples'] = self.sampler.top(10)
+        for name, metrics in self.extra_metrics.items():
+            try:
+                record[name] = metrics()
+            except Exception as e:
+                record[name] = {'error': str(e)}
+        try:
+            with open(self.export_path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        except Exception as e:
+            print(f"导出性能数据时出错: {str(e)}")
+
+        self._export_tick.reset()
+        for histogram in self._export_stages.values():
+            histogram.reset()
+        self._export_rpcs.clear()
+        self._export_ticks = 0
+        self._export_start = now
+
+    def overlay(self, font, color=(255, 255, 0)):
+        """最近一次汇总渲染成的叠加层surface，汇总没变时返回同一个surface"""
+        if not self.enabled or self.report is None:
+            return None
+        if self._overlay is not None and self._overlay_report is self.report:
+            return self._overlay
+
+        report = self.report
+        lines = [f"{report['tick_rate']:.0f} Hz  tick p50 {report['tick']['p50_ms']:.1f}"
+                 f" p99 {report['tick']['p99_ms']:.1f} ms"]
+        for name, summary in sorted(report['stages'].items(), key=lambda item: -item[1]['p99_ms']):
+            lines.append(f"{name}: p50 {summary['p50_ms']:.2f} p99 {summary['p99_ms']:.2f} ms"
+                         f"  rpc {summary['rpcs_per_call']:.1f}")
+        rendered = [font.render(line, True, color) for line in lines]
+        line_height = font.get_linesize()
+        width = max(surface.get_width() for surface in rendered) + 20
+        # 不透明背景：内容变化时直接覆盖旧叠加层
+        overlay = pygame.Surface((width, line_height * len(rendered) + 10))
+        overlay.fill((0, 0, 0))
+        for i, surface in enumerate(rendered):
+            overlay.blit(surface, (10, 5 + i * line_height))
+        self._overlay = overlay
+        self._overlay_report = report
+        return overlay
+
+    def close(self):
+        """停止采样，导出剩余数据；采样结果写到导出文件旁边的 .folded 文件"""
+        if not self.enabled:
+            return
+        if self.sampler is not None:
+            self.sampler.stop()
+            if self.export_path is not None:
+                self.sampler.write_folded(os.path.splitext(self.export_path)[0] + '.folded')
+        now = time.perf_counter()
+        self._summarize(now)
+        self.export(now)
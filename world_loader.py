@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+from map_cache import map_short_name
+
+
+def map_matches(current_map_name, map_name):
+    """比较地图名（忽略 Carla/Maps/ 之类的路径前缀）"""
+    return map_short_name(current_map_name) == map_short_name(map_name)
+
+
+def wait_for_world_ready(world, timeout=10.0):
+    """等服务器推进出新地图的第一帧，代替固定sleep；返回该帧号"""
+    if world.get_settings().synchronous_mode:
+        return world.tick()
+    return world.wait_for_tick(timeout).frame
+
+
+def acquire_world(client, map_name, reload=False, layers=None, reset_settings=True,
+                  load_timeout=60.0, client_timeout=None, ready_timeout=10.0):
+    """获取指定地图的world，服务器上已经是该地图时直接复用
+
+    - 地图相同且不要求重载：直接返回当前world，不占用服务器时间
+    - 地图相同且reload=True：reload_world()，比load_world少一次地图资源加载
+    - 地图不同：load_world(map_name, map_layers=layers)，layers为carla.MapLayer组合，None表示全部图层
+    加载期间客户端超时临时放宽到load_timeout，结束后恢复为client_timeout。
+    """
+    world = client.get_world()
+    current_name = world.get_map().name
+    if map_matches(current_name, map_name) and not reload:
+        print(f"服务器已加载 {current_name}，直接复用")
+        return world
+
+    client.set_timeout(load_timeout)
+    try:
+        if map_matches(current_name, map_name):
+            print(f"重新加载 {current_name}...")
+            world = client.reload_world(reset_settings)
+        else:
+            print(f"加载地图 {map_name}...")
+            if layers is None:
+                world = client.load_world(map_name, reset_settings)
+            else:
+                world = client.load_world(map_name, reset_settings, layers)
+        wait_for_world_ready(world, ready_timeout)
+    finally:
+        if client_timeout is not None:
+            client.set_timeout(client_timeout)
+    return world
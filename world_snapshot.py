@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+import collections
+
+import numpy as np
+
+
+class RpcCounter:
+    """按tick统计发往服务器的RPC次数，用于衡量观察构建的开销
+
+    计数来自调用处的显式登记：观察构建的查询、主车控制、world.tick()（SteppingEngine）和apply_batch_sync。
+    """
+    def __init__(self, history_size=600):
+        self.current = collections.Counter()
+        self.last_tick = {}
+        self.history = collections.deque(maxlen=history_size)
+        self.total = 0  # 累计总数，用于按阶段统计（取前后差值）
+
+    def count(self, name, n=1):
+        """记录一次（或n次）RPC调用"""
+        self.current[name] += n
+        self.total += n
+
+    def end_tick(self):
+        """结束当前tick，返回本tick的RPC总数"""
+        total = sum(self.current.values())
+        self.last_tick = dict(self.current)
+        self.history.append(total)
+        self.current.clear()
+        return total
+
+    def mean_per_tick(self):
+        """最近若干tick的平均RPC次数"""
+        if not self.history:
+            return 0.0
+        return sum(self.history) / len(self.history)
+
+
+class FrameState:
+    """单帧世界快照中主车和周围actor的状态，供所有观察辅助函数共享"""
+    def __init__(self, frame, timestamp, ego_id):
+        self.frame = frame
+        self.timestamp = timestamp
+        self.ego_id = ego_id
+
+        # 主车运动学状态（来自快照，无额外RPC）
+        self.ego_transform = None
+        self.ego_location = None
+        self.ego_velocity = None
+        self.ego_acceleration = None
+        self.ego_angular_velocity = None
+
+        # 需要单独请求的状态，每帧只取一次
+        self.ego_control = None
+        self.weather = None
+        self._physics_control = None
+        self._physics_loader = None
+
+        # 周围车辆，位置和速度打包为(N,3)数组便于批量计算
+        self.vehicle_ids = []
+        self.vehicle_positions = np.zeros((0, 3), dtype=np.float64)
+        self.vehicle_velocities = np.zeros((0, 3), dtype=np.float64)
+
+    @property
+    def ego_physics_control(self):
+        """物理参数按需获取（同一主车只请求一次）"""
+        if self._physics_control is None and self._physics_loader is not None:
+            self._physics_control = self._physics_loader()
+        return self._physics_control
+
+
+class WorldSnapshotCache:
+    """基于world.get_snapshot()的逐帧缓存，每个tick只做一次批量获取
+
+    get_snapshot()读取的是客户端缓存的最新帧，不算RPC；主车物理参数不随帧变化，按主车id缓存。
+    """
+    def __init__(self, world, rpc_counter=None):
+        self.world = world
+        self.rpc_counter = rpc_counter if rpc_counter is not None else RpcCounter()
+        self._state = None
+        # actor类型缓存，只在出现新actor时查询一次
+        self._actor_types = {}
+        # 主车id -> 物理参数（只保留当前主车）
+        self._physics_controls = {}
+
+    def invalidate(self):
+        """清空缓存（换地图或重置场景后调用）"""
+        self._state = None
+        self._actor_types.clear()
+        self._physics_controls.clear()
+
+    def _sync_actor_registry(self, snapshot):
+        """根据快照中的actor id增量更新类型缓存"""
+        ids = set(actor_snapshot.id for actor_snapshot in snapshot)
+        new_ids = ids.difference(self._actor_types)
+        if new_ids:
+            self.rpc_counter.count('world.get_actors')
+            for actor in self.world.get_actors(list(new_ids)):
+                self._actor_types[actor.id] = actor.type_id
+        for actor_id in set(self._actor_types).difference(ids):
+            del self._actor_types[actor_id]
+
+    def get_frame(self, ego_vehicle):
+        """获取当前帧状态；同一帧内重复调用直接返回缓存"""
+        snapshot = self.world.get_snapshot()
+        state = self._state
+        if state is not None and state.frame == snapshot.frame and state.ego_id == ego_vehicle.id:
+            return state
+
+        self._sync_actor_registry(snapshot)
+
+        state = FrameState(snapshot.frame, snapshot.timestamp.elapsed_seconds, ego_vehicle.id)
+        ego_snapshot = snapshot.find(ego_vehicle.id)
+        if ego_snapshot is not None:
+            state.ego_transform = ego_snapshot.get_transform()
+            state.ego_velocity = ego_snapshot.get_velocity()
+            state.ego_acceleration = ego_snapshot.get_acceleration()
+            state.ego_angular_velocity = ego_snapshot.get_angular_velocity()
+        else:
+            # 主车刚生成还未出现在快照中，退回到直接查询
+            self.rpc_counter.count('ego.get_state', 4)
+            state.ego_transform = ego_vehicle.get_transform()
+            state.ego_velocity = ego_vehicle.get_velocity()
+            state.ego_acceleration = ego_vehicle.get_acceleration()
+            state.ego_angular_velocity = ego_vehicle.get_angular_velocity()
+        state.ego_location = state.ego_transform.location
+
+        self.rpc_counter.count('ego.get_control')
+        state.ego_control = ego_vehicle.get_control()
+        self.rpc_counter.count('world.get_weather')
+        state.weather = self.world.get_weather()
+
+        physics_control = self._physics_controls.get(ego_vehicle.id)
+        if physics_control is not None:
+            state._physics_control = physics_control
+        else:
+            def load_physics_control():
+                self.rpc_counter.count('ego.get_physics_control')
+                physics_control = ego_vehicle.get_physics_control()
+                self._physics_controls = {ego_vehicle.id: physics_control}
+                return physics_control
+            state._physics_loader = load_physics_control
+
+        positions = []
+        velocities = []
+        for actor_id, type_id in self._actor_types.items():
+            if actor_id == ego_vehicle.id or not type_id.startswith('vehicle.'):
+                continue
+            actor_snapshot = snapshot.find(actor_id)
+            if actor_snapshot is None:
+                continue
+            location = actor_snapshot.get_transform().location
+            velocity = actor_snapshot.get_velocity()
+            state.vehicle_ids.append(actor_id)
+            positions.append((location.x, location.y, location.z))
+            velocities.append((velocity.x, velocity.y, velocity.z))
+        if positions:
+            state.vehicle_positions = np.array(positions, dtype=np.float64)
+            state.vehicle_velocities = np.array(velocities, dtype=np.float64)
+
+        self._state = state
+        return state